@@ -1,11 +1,12 @@
 from django.contrib import admin
-from .models import Category, Product, Rack, Batch, Placement, WarehouseJournal
+from .models import Category, Product, Rack, Batch, Placement, WarehouseJournal, Warehouse, Zone, Aisle, Shelf
 from django.utils.html import format_html
 from django.db.models import Sum
 
 
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'description_short')
+    list_display = ('name', 'description_short', 'issue_strategy')
+    list_filter = ('issue_strategy',)
     search_fields = ('name',)
     prepopulated_fields = {'description': ('name',)}
 
@@ -25,13 +26,64 @@ class ProductAdmin(admin.ModelAdmin):
     dimensions.short_description = 'Габариты'
 
 
+class CapacityNodeAdmin(admin.ModelAdmin):
+    """Уровни иерархии: свернутые показатели только для чтения"""
+    readonly_fields = ('racks_count', 'total_volume', 'occupied_volume', 'total_load',
+                       'occupied_weight', 'max_free_volume', 'max_free_weight')
+    search_fields = ('name',)
+
+    def utilization(self, obj):
+        return f"{obj.get_utilization_percent()}%"
+    utilization.short_description = 'Загрузка'
+
+
+@admin.register(Warehouse)
+class WarehouseAdmin(CapacityNodeAdmin):
+    list_display = ('name', 'address', 'racks_count', 'utilization')
+
+
+@admin.register(Zone)
+class ZoneAdmin(CapacityNodeAdmin):
+    list_display = ('name', 'warehouse', 'racks_count', 'utilization')
+    list_filter = ('warehouse',)
+    list_select_related = ('warehouse',)
+
+
+@admin.register(Aisle)
+class AisleAdmin(CapacityNodeAdmin):
+    list_display = ('name', 'zone', 'racks_count', 'utilization')
+    list_filter = ('zone__warehouse', 'zone')
+    list_select_related = ('zone__warehouse',)
+
+
+class ShelfInline(admin.TabularInline):
+    model = Shelf
+    extra = 0
+    fields = ('level', 'height', 'slots', 'free_slots')
+    readonly_fields = ('free_slots',)
+
+    def get_readonly_fields(self, request, obj=None):
+        # obj - стеллаж. Пока на полках стоит товар, размер ячеек не меняется:
+        # иначе участки размещений разойдутся с картами занятости
+        if obj is not None and obj.placements.filter(is_active=True, slot_count__gt=0).exists():
+            return ('height', 'slots', 'free_slots')
+        return self.readonly_fields
+
+    def free_slots(self, obj):
+        return obj.free_slots() if obj.pk else '-'
+    free_slots.short_description = 'Свободно ячеек'
+
+
 @admin.register(Rack)
 class RackAdmin(admin.ModelAdmin):
-    list_display = ('name', 'dimensions', 'max_load',
+    list_display = ('name', 'aisle', 'dimensions', 'max_load',
                     'is_active', 'utilization_percent')
-    list_filter = ('is_active',)
+    list_filter = ('is_active', 'aisle__zone__warehouse')
+    list_select_related = ('aisle__zone__warehouse',)
     search_fields = ('name',)
     list_editable = ('is_active',)
+    raw_id_fields = ('aisle',)
+    inlines = [ShelfInline]
 
     def dimensions(self, obj):
         return f"{obj.length}×{obj.width}×{obj.height} см"
@@ -50,16 +102,16 @@ class RackAdmin(admin.ModelAdmin):
 class PlacementInline(admin.TabularInline):
     model = Placement
     extra = 0
-    readonly_fields = ('date_placed', 'is_active')
-    fields = ('rack', 'quantity', 'is_active', 'date_placed')
+    readonly_fields = ('date_placed', 'is_active', 'expiry_date')
+    fields = ('rack', 'quantity', 'is_active', 'date_placed', 'expiry_date')
     raw_id_fields = ('rack',)
 
 
 @admin.register(Batch)
 class BatchAdmin(admin.ModelAdmin):
-    list_display = ('__str__', 'product', 'quantity', 'arrival_date',
+    list_display = ('__str__', 'product', 'quantity', 'arrival_date', 'expiry_date',
                     'supplier_short', 'placed_quantity', 'remaining_quantity')
-    list_filter = ('arrival_date', 'product__category')
+    list_filter = ('arrival_date', 'expiry_date', 'product__category')
     search_fields = ('product__name', 'supplier', 'product__sku')
     raw_id_fields = ('product',)
     inlines = [PlacementInline]
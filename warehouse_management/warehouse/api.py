@@ -0,0 +1,254 @@
+"""JSON API для терминалов сбора данных (версия 1).
+
+Пакетные эндпоинты принимают ``{"items": [...], "atomic": false}`` и
+обрабатывают весь пакет в одной транзакции (journal.unit_of_work). Элементы проверяются по одному
+снимку склада (services.CapacitySnapshot), поэтому порядок элементов в
+пакете имеет значение, а число SQL-запросов не зависит от размера пакета.
+
+Ответ содержит результат для каждого элемента. При ``"atomic": true``
+ошибка в любом элементе отменяет весь пакет (HTTP 422), иначе применяются
+все корректные элементы.
+
+Аутентификация - сессия или HTTP Basic: терминал отправляет пакет одним
+запросом без получения CSRF-токена и редиректов. Тело принимается только
+как application/json: такой запрос браузер не отправит с чужого сайта без
+CORS-проверки, поэтому отключение CSRF для сессий безопасно.
+"""
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from . import journal, scans, services
+from .forms import ApiBatchItemForm, ApiIssueItemForm, ApiPlacementItemForm, ApiScanItemForm
+from .models import Batch, Product
+
+API_VERSION = 1
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def basic_auth_user(request):
+    """Пользователь из заголовка Authorization: Basic, если он передан и верен"""
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'basic':
+        return None
+    try:
+        username, _, password = base64.b64decode(credentials).decode().partition(':')
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    return authenticate(request, username=username, password=password)
+
+
+def error_response(message, status):
+    response = JsonResponse({'version': API_VERSION, 'error': message}, status=status)
+    if status == 401:
+        response['WWW-Authenticate'] = 'Basic realm="warehouse"'
+    return response
+
+
+def resolve_products(entries):
+    """Товары элементов по идентификатору или артикулу одним запросом"""
+    ids = {data['product'] for _, data in entries if data.get('product')}
+    skus = {data['sku'] for _, data in entries if data.get('sku')}
+    products = Product.objects.select_related('category').filter(
+        Q(pk__in=ids) | Q(sku__in=skus))
+    by_id, by_sku = {}, {}
+    for product in products:
+        by_id[product.pk] = by_sku[product.sku] = product
+    return lambda data: by_id.get(data['product']) if data.get('product') else by_sku.get(data['sku'])
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class BulkApiView(View):
+    """Пакетный эндпоинт: разбор, проверка элементов и применение в одной транзакции.
+
+    Подклассы задают form_class и реализуют:
+
+    - validate(entries) - проверка [(индекс, cleaned_data)] по снимку склада,
+      возвращает [(индекс, ошибки, подготовленный объект)];
+    - apply(prepared) - применение принятых объектов, возвращает результаты
+      в том же порядке.
+    """
+    http_method_names = ['post']
+    form_class = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            user = basic_auth_user(request)
+            if user is None:
+                return error_response('Требуется аутентификация', 401)
+            request.user = user
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as e:
+            return error_response(str(e), e.status)
+        except services.ConflictRetriesExhausted:
+            # Пакет не применен: терминал может отправить его повторно
+            return error_response('Конфликт с параллельными операциями, повторите запрос', 409)
+
+    def parse(self, request):
+        if request.content_type != 'application/json':
+            raise ApiError('Ожидается Content-Type: application/json', 415)
+        try:
+            payload = json.loads(request.body)
+        except (ValueError, UnicodeDecodeError):
+            raise ApiError('Некорректный JSON')
+        items = payload.get('items') if isinstance(payload, dict) else None
+        if not isinstance(items, list) or not items:
+            raise ApiError('Ожидается непустой список items')
+        limit = getattr(settings, 'API_BULK_MAX_ITEMS', 500)
+        if len(items) > limit:
+            raise ApiError(f'Слишком много элементов: {len(items)}, максимум {limit}', 413)
+        return items, bool(payload.get('atomic', False))
+
+    @services.retry_on_conflict
+    def post(self, request):
+        items, atomic = self.parse(request)
+        results, entries = [None] * len(items), []
+        for index, item in enumerate(items):
+            form = self.form_class(item if isinstance(item, dict) else {})
+            if form.is_valid():
+                entries.append((index, form.cleaned_data))
+            else:
+                results[index] = {'index': index, 'status': 'error',
+                                  'errors': form.errors.get_json_data()}
+
+        with journal.unit_of_work():
+            prepared = []
+            for index, errors, obj in self.validate(entries) if entries else []:
+                if errors:
+                    results[index] = {'index': index, 'status': 'error',
+                                      'errors': {'__all__': [{'message': e, 'code': ''}
+                                                             for e in errors]}}
+                else:
+                    prepared.append((index, obj))
+
+            failed = sum(result is not None for result in results)
+            applied = bool(prepared) and not (atomic and failed)
+            if applied:
+                for (index, _), data in zip(prepared, self.apply([obj for _, obj in prepared])):
+                    results[index] = {'index': index, 'status': 'ok', **data}
+            else:
+                for index, _ in prepared:
+                    results[index] = {'index': index, 'status': 'skipped'}
+
+        status = 422 if atomic and failed else 200
+        return JsonResponse({
+            'version': API_VERSION,
+            'atomic': atomic,
+            'applied': applied,
+            'ok': len(prepared) if applied else 0,
+            'failed': failed,
+            'results': results,
+        }, status=status, json_dumps_params={'ensure_ascii': False})
+
+    def validate(self, entries):
+        raise NotImplementedError
+
+    def apply(self, prepared):
+        raise NotImplementedError
+
+    @property
+    def operator(self):
+        return self.request.user.get_username()
+
+
+class BatchBulkView(BulkApiView):
+    """POST api/v1/batches/: приемка партий"""
+    form_class = ApiBatchItemForm
+
+    def validate(self, entries):
+        product_for = resolve_products(entries)
+        for index, data in entries:
+            product = product_for(data)
+            if product is None:
+                yield index, ['Товар не найден'], None
+            else:
+                yield index, [], Batch(product=product, quantity=data['quantity'],
+                                       supplier=data['supplier'], notes=data['notes'] or None,
+                                       expiry_date=data['expiry_date'])
+
+    def apply(self, prepared):
+        return [{'id': batch.pk, 'product': batch.product_id, 'quantity': batch.quantity}
+                for batch in Batch.objects.bulk_create(prepared)]
+
+
+class PlacementBulkView(BulkApiView):
+    """POST api/v1/placements/: размещение партий на стеллажах"""
+    form_class = ApiPlacementItemForm
+
+    def validate(self, entries):
+        snapshot = services.CapacitySnapshot(
+            batch_ids=[data['batch'] for _, data in entries],
+            rack_ids=[data['rack'] for _, data in entries])
+        for index, data in entries:
+            errors = snapshot.reserve_placement(data['batch'], data['rack'], data['quantity'])
+            yield index, errors, (None if errors else (
+                snapshot.batches[data['batch']], snapshot.racks[data['rack']], data['quantity']))
+
+    def apply(self, prepared):
+        return [{'id': placement.pk, 'batch': placement.batch_id, 'rack': placement.rack_id,
+                 'quantity': placement.quantity}
+                for placement in services.place_many(prepared, self.operator)]
+
+
+class IssueBulkView(BulkApiView):
+    """POST api/v1/issues/: выдача товара в порядке стратегии категории"""
+    form_class = ApiIssueItemForm
+
+    def validate(self, entries):
+        product_for = resolve_products(entries)
+        products = {product_for(data) for _, data in entries} - {None}
+        self.snapshot = services.CapacitySnapshot(products=products)
+        for index, data in entries:
+            product = product_for(data)
+            if product is None:
+                yield index, ['Товар не найден'], None
+                continue
+            errors = self.snapshot.reserve_issue(product, data['quantity'])
+            yield index, errors, (None if errors else services.IssueLine(
+                product, data['quantity'], data['operator'] or self.operator))
+
+    def apply(self, prepared):
+        return [{'product': line.product.pk, 'issued': line.issued,
+                 'racks': sorted(line.rack_ids)}
+                for line in services.issue_lines(prepared, self.snapshot.placements)]
+
+
+class ScanIngestView(BulkApiView):
+    """POST api/v1/scans/: сканирования с ключами идемпотентности.
+
+    Повтор с уже обработанным ключом возвращает сохраненный результат с
+    признаком duplicate. Статус pending означает, что пачка не успела
+    зафиксироваться за SCAN_WAIT_TIMEOUT, и сканирование нужно повторить.
+    """
+    form_class = ApiScanItemForm
+
+    def post(self, request):
+        items, _ = self.parse(request)
+        results, accepted = [None] * len(items), []
+        for index, item in enumerate(items):
+            form = self.form_class(item if isinstance(item, dict) else {})
+            if form.is_valid():
+                accepted.append((index, scans.Scan(operator=self.operator, **form.cleaned_data)))
+            else:
+                results[index] = {'index': index, 'status': 'error',
+                                  'errors': form.errors.get_json_data()}
+
+        outcomes = scans.buffer.submit([scan for _, scan in accepted]) if accepted else []
+        for (index, scan), outcome in zip(accepted, outcomes):
+            results[index] = {'index': index, 'key': scan.key, **outcome}
+        return JsonResponse({'version': API_VERSION, 'results': results},
+                            json_dumps_params={'ensure_ascii': False})
@@ -1,6 +1,40 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, pre_save, post_save
 
 
 class WarehouseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'warehouse'
+
+    def ready(self):
+        # PRAGMA SQLite из SQLITE_PRAGMAS для каждого нового соединения
+        from . import db
+        connection_created.connect(db.apply_sqlite_pragmas)
+
+        # Миниатюры изображений строятся в фоне после загрузки
+        from . import thumbnails
+        product = self.get_model('Product')
+        pre_save.connect(thumbnails.track_image_change, sender=product)
+        post_save.connect(thumbnails.schedule_on_upload, sender=product)
+
+        # Счетчики остатков следят за размещениями, сохраненными через save()
+        from . import stock
+        post_save.connect(stock.create_shards, sender=product)
+        placement = self.get_model('Placement')
+        pre_save.connect(stock.remember_stock, sender=placement)
+        post_save.connect(stock.track_placement_save, sender=placement)
+
+        # Свернутая вместимость рядов, зон и складов (см. locations.py)
+        from . import locations
+        post_save.connect(locations.track_placement_change, sender=placement)
+        for name in ('Rack', 'Aisle', 'Zone'):
+            model = self.get_model(name)
+            pre_save.connect(locations.remember_parent, sender=model)
+            post_save.connect(locations.track_location_change, sender=model)
+            post_delete.connect(locations.track_location_change, sender=model)
+
+        # Карты занятости полок следят за размещениями, измененными через save()
+        from . import slots
+        post_save.connect(slots.track_placement_change, sender=placement)
+        post_delete.connect(slots.track_placement_change, sender=placement)
@@ -0,0 +1,145 @@
+"""Бенчмарк представлений склада: задержки p50/p95 и число SQL-запросов по каждому URL"""
+import json
+import math
+import time
+
+from django.apps import apps
+from django.test import Client
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from . import urls as warehouse_urls
+from .middleware import QueryRecorder
+from .models import Product, Rack, Batch, Placement, WarehouseJournal
+
+# Параметры GET-запроса для представлений, которым без них нечего показывать
+EXTRA_QUERY = {
+    'search_product': {'q': 'Товар 0001'},
+}
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _resolve_kwargs(pattern):
+    """Подбирает значения параметров маршрута по существующим объектам"""
+    kwargs = {}
+    view_class = getattr(pattern.callback, 'view_class', None)
+    for name in pattern.pattern.converters:
+        if name == 'pk':
+            model = view_class.model
+        elif name.endswith('_id'):
+            try:
+                model = apps.get_model('warehouse', name[:-3])
+            except LookupError:
+                return None
+        else:
+            return None
+        obj = model.objects.order_by('pk').first()
+        if obj is None:
+            return None
+        kwargs[name] = obj.pk
+    return kwargs
+
+
+def discover_urls():
+    """Список (имя, URL) для всех маршрутов warehouse/urls.py"""
+    targets = []
+    for pattern in warehouse_urls.urlpatterns:
+        if not isinstance(pattern, URLPattern) or not pattern.name:
+            continue
+        # Только для записи (пакетный JSON API) - GET-бенчмарку нечего измерять
+        view_class = getattr(pattern.callback, 'view_class', None)
+        if view_class is not None and not hasattr(view_class, 'get'):
+            continue
+        kwargs = _resolve_kwargs(pattern)
+        if kwargs is None:
+            continue
+        url = reverse(f'{warehouse_urls.app_name}:{pattern.name}', kwargs=kwargs)
+        targets.append((pattern.name, url))
+    return targets
+
+
+def run_benchmark(user, repeat=20, warmup=2, names=None, host='localhost'):
+    """Прогоняет каждый URL через тестовый клиент и возвращает результаты замеров"""
+    client = Client(HTTP_HOST=host, raise_request_exception=False)
+    client.force_login(user)
+
+    results = {}
+    for name, url in discover_urls():
+        if names and name not in names:
+            continue
+        params = EXTRA_QUERY.get(name, {})
+        for _ in range(warmup):
+            client.get(url, params)
+
+        timings = []
+        queries = []
+        status = None
+        for _ in range(repeat):
+            recorder = QueryRecorder()
+            start = time.perf_counter()
+            with recorder.record():
+                response = client.get(url, params)
+            timings.append((time.perf_counter() - start) * 1000)
+            queries.append(recorder.count)
+            status = response.status_code
+
+        results[name] = {
+            'url': url,
+            'status': status,
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'queries': max(queries),
+        }
+
+    return {
+        'meta': {
+            'created': timezone.now().isoformat(),
+            'repeat': repeat,
+            'dataset': {
+                'products': Product.objects.count(),
+                'racks': Rack.objects.count(),
+                'batches': Batch.objects.count(),
+                'placements': Placement.objects.count(),
+                'journal': WarehouseJournal.objects.count(),
+            },
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, tolerance=0.2):
+    """Сравнивает прогон с базовой линией.
+
+    Регрессией считается рост p95 больше чем на tolerance (доля) или любой
+    рост числа SQL-запросов. Возвращает список строк с описанием регрессий.
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            regressions.append(
+                f"{name}: запросов {base['queries']} -> {result['queries']}")
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {base['p95_ms']} мс -> {result['p95_ms']} мс")
+    return regressions
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(data, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
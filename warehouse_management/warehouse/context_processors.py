@@ -0,0 +1,6 @@
+from . import events
+
+
+def live_events(request):
+    """Флаг live_events: подключать ли на страницах EventSource живых обновлений"""
+    return {'live_events': events.is_streaming(request)}
@@ -0,0 +1,100 @@
+"""Настройка SQLite для эксплуатации и маршрутизация чтения.
+
+- apply_sqlite_pragmas (сигнал connection_created) выполняет PRAGMA из
+  settings.SQLITE_PRAGMAS для каждого нового соединения: WAL, synchronous,
+  busy_timeout, mmap_size, cache_size. С постоянными соединениями
+  (CONN_MAX_AGE) это происходит один раз на соединение, а не на запрос.
+- ReadOnlyViewsMiddleware помечает запросы к представлениям из
+  DATABASE_READ_VIEWS, а ReadReplicaRouter направляет их чтение в
+  соединение DATABASE_READ_ALIAS. В режиме WAL читатели не ждут писателя,
+  а отдельное соединение с query_only не может случайно начать запись.
+
+Профиль с этими настройками - warehouse_management.settings_production.
+"""
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+_read_only = ContextVar('warehouse_read_only', default=False)
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {}).get(connection.alias, {})
+    # Напрямую через sqlite3: служебные PRAGMA не попадают в учет запросов
+    # (QueryBudgetMiddleware) того HTTP-запроса, который открыл соединение
+    for name, value in pragmas.items():
+        connection.connection.execute(f'PRAGMA {name} = {value}')
+
+
+def get_read_alias():
+    alias = getattr(settings, 'DATABASE_READ_ALIAS', 'read')
+    return alias if alias in connections.settings else None
+
+
+def is_read_only():
+    return _read_only.get()
+
+
+class ReadReplicaRouter:
+    """Чтение помеченных запросов - в DATABASE_READ_ALIAS, любая запись - в default"""
+
+    def db_for_read(self, model, **hints):
+        if is_read_only():
+            return get_read_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Объект, прочитанный через алиас чтения, все равно сохраняется в default
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Оба алиаса указывают на один файл базы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == get_read_alias():
+            return False
+        return None
+
+
+class ReadOnlyViewsMiddleware:
+    """Помечает запросы к представлениям из DATABASE_READ_VIEWS как только читающие"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.views = frozenset(getattr(settings, 'DATABASE_READ_VIEWS', ()))
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def is_read_view(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        try:
+            return resolve(request.path_info).view_name in self.views
+        except Resolver404:
+            return False
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = _read_only.set(self.is_read_view(request))
+        try:
+            return self.get_response(request)
+        finally:
+            _read_only.reset(token)
+
+    async def __acall__(self, request):
+        # ORM в потоке sync_to_async видит копию контекста этой задачи
+        token = _read_only.set(self.is_read_view(request))
+        try:
+            return await self.get_response(request)
+        finally:
+            _read_only.reset(token)
@@ -0,0 +1,297 @@
+"""Живые обновления панели и стеллажей через server-sent events.
+
+Операции размещения и выдачи публикуют небольшие события (дельты), а
+async-представление LiveEventsView отдает их подписчикам потоком
+``text/event-stream``. Бэкенды доставки (LIVE_EVENTS_BACKEND):
+
+- ``memory`` - pub/sub внутри процесса, подходит для одного ASGI-воркера;
+- ``db`` - журнал событий в таблице LiveEvent, который опрашивают все
+  воркеры; нужен, когда воркеров несколько.
+
+События публикуются только после фиксации транзакции операции. Если
+слушать некому (is_listening), операции не собирают события вовсе.
+Поток отдается только под ASGI (is_streaming): WSGI-сервер буферизует
+async-ответ и держал бы воркер все время потока, не доставив ни события.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.utils import timezone
+
+from . import stock
+from .models import LiveEvent, Product, Rack
+
+PLACEMENT_CREATED = 'placement_created'
+ISSUE_DONE = 'issue_done'
+RACK_UTILIZATION = 'rack_utilization'
+LOW_STOCK_ENTERED = 'low_stock_entered'
+LOW_STOCK_LEFT = 'low_stock_left'
+
+LOW_STOCK_THRESHOLD = 10
+
+
+def get_backend():
+    return getattr(settings, 'LIVE_EVENTS_BACKEND', 'memory')
+
+
+class Broker:
+    """Pub/sub внутри процесса: у каждого подписчика своя asyncio.Queue.
+
+    Публиковать можно из любого потока: события передаются в цикл событий
+    подписчика через call_soon_threadsafe.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+
+    def subscribe(self):
+        queue = asyncio.Queue(self.maxsize)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, kind, data):
+        event = (next(self._ids), kind, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # Цикл событий подписчика уже закрыт
+                self.unsubscribe((loop, queue))
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+
+def _offer(queue, event):
+    # Медленный клиент теряет события, а не задерживает остальных
+    if not queue.full():
+        queue.put_nowait(event)
+
+
+broker = Broker()
+_last_prune = 0.0
+
+
+def is_listening():
+    """Нужно ли собирать события операции.
+
+    Бэкенду memory - только если у брокера этого процесса есть подписчики,
+    бэкенду db - всегда: журнал читают потоки других воркеров. Без
+    слушателей операции не тратят запросы на загрузку и остатки.
+    """
+    if not getattr(settings, 'LIVE_EVENTS_ENABLED', True):
+        return False
+    return get_backend() == 'db' or broker.subscriber_count > 0
+
+
+def is_streaming(request):
+    """Можно ли отдать поток событий на этот запрос: включено и сервер ASGI"""
+    return getattr(settings, 'LIVE_EVENTS_ENABLED', True) and isinstance(request, ASGIRequest)
+
+
+def publish_many(items):
+    """Публикует [(тип, данные)] после успешной фиксации текущей транзакции"""
+    if not items or not getattr(settings, 'LIVE_EVENTS_ENABLED', True):
+        return
+    if get_backend() == 'db':
+        # Запись в той же транзакции одним INSERT: откат операции отменяет и события
+        LiveEvent.objects.bulk_create([LiveEvent(kind=kind, payload=data) for kind, data in items])
+        transaction.on_commit(prune)
+    else:
+        transaction.on_commit(lambda: _deliver(items))
+
+
+def _deliver(items):
+    for kind, data in items:
+        broker.publish(kind, data)
+
+
+def publish(kind, data):
+    publish_many([(kind, data)])
+
+
+def prune():
+    """Удаляет события старше LIVE_EVENTS_RETENTION (не чаще раза в минуту)"""
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < 60:
+        return
+    _last_prune = now
+    retention = getattr(settings, 'LIVE_EVENTS_RETENTION', timedelta(minutes=10))
+    LiveEvent.objects.filter(created__lt=timezone.now() - retention).delete()
+
+
+def _rack_utilization(rack_ids):
+    return [(RACK_UTILIZATION, {
+        'rack': rack.pk,
+        'name': rack.name,
+        'utilization': rack.get_utilization_percent(),
+        'available_volume': round(rack.available_volume(), 1),
+        'available_weight': round(rack.available_weight(), 1),
+    }) for rack in Rack.objects.filter(pk__in=set(rack_ids)).with_occupancy()]
+
+
+def _stock_changes(deltas):
+    totals = stock.available([product.pk for product in deltas])
+    crossed = []
+    for product, delta in deltas.items():
+        after = totals.get(product.pk, 0)
+        before = after - delta
+        if before >= LOW_STOCK_THRESHOLD > after:
+            crossed.append((LOW_STOCK_ENTERED, product, after))
+        elif after >= LOW_STOCK_THRESHOLD > before:
+            crossed.append((LOW_STOCK_LEFT, product, after))
+    if not crossed:
+        return []
+    # Названия категорий - одним запросом и только для товаров, пересекших порог
+    categories = dict(Product.objects.filter(
+        pk__in=[product.pk for _, product, _ in crossed]).values_list('pk', 'category__name'))
+    return [(kind, {'product': product.pk, 'name': product.name, 'sku': product.sku,
+                    'category': categories.get(product.pk), 'stock': after})
+            for kind, product, after in crossed]
+
+
+def rack_utilization(rack_ids):
+    """События загрузки для стеллажей, затронутых операцией (один запрос)"""
+    if is_listening():
+        publish_many(_rack_utilization(rack_ids))
+
+
+def stock_changes(deltas):
+    """События перехода через порог низкого остатка для {товар: изменение}.
+
+    Остатки после операции читаются из счетчиков одним запросом на все товары.
+    """
+    if is_listening() and deltas:
+        publish_many(_stock_changes(deltas))
+
+
+def stock_changed(product, delta):
+    stock_changes({product: delta})
+
+
+def placements_created(placements, operator):
+    if not is_listening():
+        return
+    items, deltas = [], Counter()
+    for placement in placements:
+        items.append((PLACEMENT_CREATED, {
+            'placement': placement.pk,
+            'product': placement.product_id,
+            'name': placement.product.name,
+            'batch': placement.batch_id,
+            'rack': placement.rack_id,
+            'quantity': placement.quantity,
+            'operator': operator,
+        }))
+        deltas[placement.product] += placement.quantity
+    items += _rack_utilization([placement.rack_id for placement in placements])
+    items += _stock_changes(deltas)
+    publish_many(items)
+
+
+def issues_done(lines):
+    """lines - результаты services.issue_lines()"""
+    if not is_listening():
+        return
+    items, deltas = [], Counter()
+    for line in lines:
+        items.append((ISSUE_DONE, {
+            'product': line.product.pk,
+            'name': line.product.name,
+            'quantity': line.issued,
+            'racks': sorted(line.rack_ids),
+            'deactivated_placements': line.deactivated,
+            'operator': line.operator,
+        }))
+        if line.reservation is None:
+            # Выдача по резерву не меняет доступный остаток: он уменьшен при резервировании
+            deltas[line.product] -= line.issued
+    items += _rack_utilization([rack_id for line in lines for rack_id in line.rack_ids])
+    if deltas:
+        items += _stock_changes(deltas)
+    publish_many(items)
+
+
+def format_event(event_id, kind, data):
+    payload = json.dumps(data, ensure_ascii=False)
+    return f'id: {event_id}\nevent: {kind}\ndata: {payload}\n\n'
+
+
+async def stream(last_event_id=None):
+    """Асинхронный генератор SSE для одного клиента.
+
+    Поток завершается через LIVE_EVENTS_MAX_DURATION секунд: EventSource
+    сам переподключается и передает Last-Event-ID, по которому бэкенд db
+    досылает пропущенные события.
+    """
+    heartbeat = getattr(settings, 'LIVE_EVENTS_HEARTBEAT', 15)
+    deadline = time.monotonic() + getattr(settings, 'LIVE_EVENTS_MAX_DURATION', 300)
+    yield 'retry: 3000\n\n'
+    if get_backend() == 'db':
+        async for chunk in _stream_db(last_event_id, heartbeat, deadline):
+            yield chunk
+        return
+
+    subscriber = broker.subscribe()
+    queue = subscriber[1]
+    try:
+        while time.monotonic() < deadline:
+            timeout = min(heartbeat, max(0.0, deadline - time.monotonic()))
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            yield format_event(*event)
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+async def _stream_db(last_event_id, heartbeat, deadline):
+    poll = getattr(settings, 'LIVE_EVENTS_POLL_INTERVAL', 1.0)
+    if last_event_id is None:
+        latest = await LiveEvent.objects.order_by('-pk').afirst()
+        last_event_id = latest.pk if latest else 0
+    idle = 0.0
+    while time.monotonic() < deadline:
+        events = [event async for event in
+                  LiveEvent.objects.filter(pk__gt=last_event_id).order_by('pk')[:100]]
+        for event in events:
+            last_event_id = event.pk
+            yield format_event(event.pk, event.kind, event.payload)
+        if events:
+            idle = 0.0
+            continue
+        if idle >= heartbeat:
+            yield ': ping\n\n'
+            idle = 0.0
+        await asyncio.sleep(poll)
+        idle += poll
+
+
+def parse_last_event_id(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
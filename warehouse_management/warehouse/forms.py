@@ -1,7 +1,65 @@
+from datetime import datetime
+
 from django import forms
-from .models import Product, Rack, Batch, Placement, WarehouseJournal
-from django.db.models import Sum
+from .models import Product, Rack, Batch, Placement, Warehouse, Aisle, WarehouseJournal
+from django.db.models import Q, Sum
 from django.core.exceptions import ValidationError
+from django.urls import reverse_lazy
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from . import jobs, metrics, simulation, slots, stock
+from .scans import ACTIONS
+
+
+class AutocompleteSelect(forms.Select):
+    """Select, который выводит только выбранный вариант.
+
+    Остальные варианты подгружает скрипт из base.html через JSON-эндпоинт
+    data-autocomplete-url, поэтому размер страницы не зависит от размера
+    каталога. Проверка при отправке формы по-прежнему выполняется полем
+    ModelChoiceField - одним запросом по присланному идентификатору.
+    """
+
+    def __init__(self, url, attrs=None):
+        attrs = {'class': 'form-select', **(attrs or {})}
+        super().__init__(attrs)
+        self.url = url
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-autocomplete-url'] = str(self.url)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        field = self.choices.field
+        selected_ids = [v for v in value if str(v).isdigit()]
+        options = [('', field.empty_label or '---------')]
+        if selected_ids:
+            options += [(obj.pk, field.label_from_instance(obj))
+                        for obj in field.queryset.filter(pk__in=selected_ids)]
+        return [
+            (None, [self.create_option(name, option_value, label,
+                                       str(option_value) in value, index, attrs=attrs)], index)
+            for index, (option_value, label) in enumerate(options)
+        ]
+
+
+def product_autocomplete_widget():
+    return AutocompleteSelect(reverse_lazy('warehouse:product_autocomplete'))
+
+
+def rack_autocomplete_widget():
+    return AutocompleteSelect(reverse_lazy('warehouse:rack_autocomplete'))
+
+
+class CleanFailureMetricsMixin:
+    """Считает отказы проверки в clean() формы для метрик склада"""
+
+    def full_clean(self):
+        super().full_clean()
+        if self.is_bound and self.non_field_errors():
+            metrics.record_validation_failure(type(self).__name__)
 
 
 class ProductForm(forms.ModelForm):
@@ -22,22 +80,38 @@ class RackForm(forms.ModelForm):
     class Meta:
         model = Rack
         fields = '__all__'
+        widgets = {
+            'aisle': forms.Select(attrs={'class': 'form-select'}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['aisle'].queryset = Aisle.objects.select_related('zone__warehouse')
 
 
 class BatchForm(forms.ModelForm):
     class Meta:
         model = Batch
-        fields = ['product', 'quantity', 'supplier', 'notes']
+        fields = ['product', 'quantity', 'supplier', 'expiry_date', 'notes']
         widgets = {
+            'product': product_autocomplete_widget(),
+            'expiry_date': forms.DateInput(attrs={'type': 'date'}, format='%Y-%m-%d'),
             'notes': forms.Textarea(attrs={'rows': 3}),
         }
 
+    def clean_expiry_date(self):
+        expiry_date = self.cleaned_data.get('expiry_date')
+        if expiry_date and expiry_date < timezone.localdate():
+            raise ValidationError('Срок годности партии уже истек')
+        return expiry_date
+
 
-class PlacementForm(forms.Form):
+class PlacementForm(CleanFailureMetricsMixin, forms.Form):
     batch = forms.ModelChoiceField(
         queryset=Batch.objects.none(), label='Партия')
     rack = forms.ModelChoiceField(
-        queryset=Rack.objects.filter(is_active=True), label='Стеллаж')
+        queryset=Rack.objects.filter(is_active=True), label='Стеллаж',
+        widget=rack_autocomplete_widget())
     quantity = forms.IntegerField(
         min_value=1, label='Количество для размещения')
 
@@ -91,12 +165,19 @@ class PlacementForm(forms.Form):
                 raise ValidationError(
                     f'Недостаточно места на стеллаже. Доступно: {rack.available_volume()/1000:.2f} л')
 
+            # Проверяем непрерывный участок ячеек на полках
+            if slots.is_enabled():
+                error = slots.SlotMap([rack.pk]).reserve(rack, product, quantity)
+                if error:
+                    raise ValidationError(error)
+
         return cleaned_data
 
 
-class IssueForm(forms.Form):
+class IssueForm(CleanFailureMetricsMixin, forms.Form):
     product = forms.ModelChoiceField(
-        queryset=Product.objects.all(), label='Товар')
+        queryset=Product.objects.all(), label='Товар',
+        widget=product_autocomplete_widget())
     quantity = forms.IntegerField(min_value=1, label='Количество для выдачи')
     operator = forms.CharField(max_length=100, label='Кладовщик')
 
@@ -106,20 +187,260 @@ class IssueForm(forms.Form):
         quantity = cleaned_data.get('quantity')
 
         if product and quantity:
-            # Проверка доступного количества товара на складе
-            available_quantity = Placement.objects.filter(
-                product=product,
-                is_active=True
-            ).aggregate(total=Sum('quantity'))['total'] or 0
+            # Проверка доступного количества по счетчикам остатков
+            available_quantity = stock.available([product.pk]).get(product.pk, 0)
+
+            if quantity > available_quantity:
+                raise ValidationError(
+                    f'Недостаточно товара на складе. Доступно: {available_quantity}')
+
+        return cleaned_data
+
+
+class ReservationForm(CleanFailureMetricsMixin, forms.Form):
+    product = forms.ModelChoiceField(
+        queryset=Product.objects.all(), label='Товар',
+        widget=product_autocomplete_widget())
+    quantity = forms.IntegerField(min_value=1, label='Количество')
+    order = forms.CharField(max_length=100, label='Заказ')
+    operator = forms.CharField(max_length=100, label='Кладовщик')
+    ttl = forms.IntegerField(min_value=1, max_value=7 * 24 * 60, initial=30,
+                             label='Срок резерва, мин')
+    batch = forms.IntegerField(required=False, min_value=1, label='Партия')
+    rack = forms.ModelChoiceField(
+        queryset=Rack.objects.filter(is_active=True), required=False, label='Стеллаж',
+        widget=rack_autocomplete_widget())
+
+    def clean_batch(self):
+        batch_id = self.cleaned_data.get('batch')
+        if batch_id is None:
+            return None
+        batch = Batch.objects.filter(pk=batch_id).first()
+        if batch is None:
+            raise ValidationError(f'Партия #{batch_id} не найдена')
+        return batch
+
+    def clean(self):
+        cleaned_data = super().clean()
+        product = cleaned_data.get('product')
+        quantity = cleaned_data.get('quantity')
+        batch = cleaned_data.get('batch')
+        rack = cleaned_data.get('rack')
 
+        if product and quantity:
+            if batch and batch.product_id != product.pk:
+                raise ValidationError('Партия относится к другому товару')
+            # Доступный остаток по счетчикам уже учитывает действующие резервы
+            available_quantity = stock.available([product.pk]).get(product.pk, 0)
             if quantity > available_quantity:
                 raise ValidationError(
                     f'Недостаточно товара на складе. Доступно: {available_quantity}')
+            if batch or rack:
+                # Привязанный резерв должен помещаться в остаток выбранного места
+                placements = Placement.objects.filter(product=product, is_active=True)
+                if batch:
+                    placements = placements.filter(batch=batch)
+                if rack:
+                    placements = placements.filter(rack=rack)
+                located = placements.aggregate(total=Sum('quantity', default=0))['total']
+                if quantity > located:
+                    raise ValidationError(
+                        f'Недостаточно товара в выбранной партии или на стеллаже. Доступно: {located}')
+
+        return cleaned_data
+
+
+def job_choices():
+    return [(kind, title) for kind, (title, _) in jobs.TASKS.items()]
 
+
+class JobForm(forms.Form):
+    """Постановка фоновой задачи со страницы очереди"""
+    kind = forms.ChoiceField(choices=job_choices, label='Задача')
+    date_from = forms.DateField(required=False, label='С даты')
+    date_to = forms.DateField(required=False, label='По дату')
+    fix = forms.BooleanField(required=False, label='Исправить расхождения')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('kind') == 'wave_labels' and not cleaned_data.get('date_from'):
+            raise ValidationError('Для этикеток волны укажите дату приемки в поле "С даты"')
         return cleaned_data
 
+    def get_payload(self):
+        """Параметры обработчика выбранной задачи"""
+        data = self.cleaned_data
+        kind = data['kind']
+        if kind == 'export_journal':
+            return {key: data[key].isoformat() for key in ('date_from', 'date_to') if data[key]}
+        if kind == 'wave_labels':
+            return {'date': data['date_from'].isoformat()}
+        if kind == 'reconcile_stock':
+            return {'fix': data['fix']}
+        return {}
+
+
+class UtilizationHistoryForm(forms.Form):
+    """Выбор ряда истории загрузки: все зоны или один стеллаж"""
+    DAYS_CHOICES = [(30, '30 дней'), (90, '90 дней'), (365, 'Год')]
+
+    rack = forms.ModelChoiceField(
+        queryset=Rack.objects.all(), required=False, label='Стеллаж',
+        widget=rack_autocomplete_widget())
+    days = forms.TypedChoiceField(
+        choices=DAYS_CHOICES, coerce=int, required=False, empty_value=365, label='Период',
+        widget=forms.Select(attrs={'class': 'form-select'}))
+
 
 class CheckCapacityForm(forms.Form):
     product = forms.ModelChoiceField(
-        queryset=Product.objects.all(), label='Товар')
+        queryset=Product.objects.all(), label='Товар',
+        widget=product_autocomplete_widget())
     quantity = forms.IntegerField(min_value=1, label='Планируемое количество')
+    warehouse = forms.ModelChoiceField(
+        queryset=Warehouse.objects.all(), required=False, empty_label='Все склады', label='Склад',
+        widget=forms.Select(attrs={'class': 'form-select'}))
+
+
+class CapacityPlanForm(forms.Form):
+    """Сценарий симулятора вместимости: график приходов и прогноз расхода"""
+    schedule = forms.CharField(
+        label='Ожидаемые приходы',
+        widget=forms.Textarea(attrs={'rows': 12, 'placeholder': '2026-11-02; SKU-000123; 120'}),
+        help_text='По строке на партию: дата (ГГГГ-ММ-ДД или ДД.ММ.ГГГГ); артикул; количество')
+    days = forms.IntegerField(min_value=1, max_value=365, initial=30, label='Горизонт, дней')
+    lookback_days = forms.IntegerField(
+        min_value=1, max_value=365, initial=28, label='Расход по журналу за, дней')
+    outbound_factor = forms.FloatField(
+        min_value=0, max_value=10, initial=1.0, label='Множитель расхода')
+
+    def clean_schedule(self):
+        """Разбирает строки графика в [(дата, товар, количество)], товары - одним запросом"""
+        rows, errors = [], []
+        for number, line in enumerate(self.cleaned_data['schedule'].splitlines(), start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            parts = [part.strip() for part in line.replace('\t', ';').split(';')]
+            if len(parts) != 3:
+                errors.append(f'Строка {number}: нужно три поля через ";"')
+                continue
+            raw_date, sku, raw_quantity = parts
+            try:
+                day = (parse_date(raw_date) or
+                       datetime.strptime(raw_date, '%d.%m.%Y').date())
+                quantity = int(raw_quantity)
+            except ValueError:
+                errors.append(f'Строка {number}: неверная дата или количество')
+                continue
+            if quantity <= 0:
+                errors.append(f'Строка {number}: количество должно быть больше нуля')
+                continue
+            rows.append((number, day, sku, quantity))
+        limit = getattr(settings, 'CAPACITY_PLAN_MAX_EVENTS', 20000)
+        if len(rows) > limit:
+            errors.append(f'Не больше {limit} строк за один прогон')
+        products = dict(Product.objects.filter(
+            sku__in={sku for _, _, sku, _ in rows}).values_list('sku', 'pk'))
+        errors += [f'Строка {number}: товар с артикулом {sku} не найден'
+                   for number, _, sku, _ in rows if sku not in products]
+        if errors:
+            raise ValidationError(errors[:20])
+        if not rows:
+            raise ValidationError('График приходов пуст')
+        return [(day, products[sku], quantity) for _, day, sku, quantity in rows]
+
+    def get_inbound(self, today):
+        return [simulation.Inbound((day - today).days, product_id, quantity)
+                for day, product_id, quantity in self.cleaned_data['schedule']]
+
+
+class ProductFilterForm(forms.Form):
+    """Фильтры каталога: категория, начало названия или артикула, диапазоны габаритов"""
+    search = forms.CharField(required=False, max_length=200, label='Название или SKU')
+    category = forms.IntegerField(required=False, min_value=1, label='Категория')
+    min_length = forms.FloatField(required=False, min_value=0, label='Длина от')
+    max_length = forms.FloatField(required=False, min_value=0, label='Длина до')
+    min_width = forms.FloatField(required=False, min_value=0, label='Ширина от')
+    max_width = forms.FloatField(required=False, min_value=0, label='Ширина до')
+    min_height = forms.FloatField(required=False, min_value=0, label='Высота от')
+    max_height = forms.FloatField(required=False, min_value=0, label='Высота до')
+
+    DIMENSIONS = ('length', 'width', 'height')
+
+    def filter_queryset(self, queryset):
+        """Применяет заполненные фильтры; некорректные значения игнорируются"""
+        if not self.is_valid():
+            return queryset
+        data = self.cleaned_data
+        if data['category']:
+            queryset = queryset.filter(category_id=data['category'])
+        prefix = data['search'].strip()
+        if prefix:
+            # Диапазоны вместо startswith: LIKE с ESCAPE не использует индексы в SQLite
+            names = {prefix, prefix[:1].upper() + prefix[1:]}
+            condition = Q()
+            for value in names:
+                condition |= Q(name__gte=value, name__lt=value + '\uffff')
+            for value in {prefix, prefix.upper()}:
+                condition |= Q(sku__gte=value, sku__lt=value + '\uffff')
+            queryset = queryset.filter(condition)
+        for dimension in self.DIMENSIONS:
+            if data[f'min_{dimension}'] is not None:
+                queryset = queryset.filter(**{f'{dimension}__gte': data[f'min_{dimension}']})
+            if data[f'max_{dimension}'] is not None:
+                queryset = queryset.filter(**{f'{dimension}__lte': data[f'max_{dimension}']})
+        return queryset
+
+
+class ProductReferenceMixin:
+    """Товар в элементе API задается идентификатором или артикулом"""
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('product') and not cleaned_data.get('sku'):
+            raise ValidationError('Укажите товар: product (идентификатор) или sku')
+        return cleaned_data
+
+
+class ApiBatchItemForm(ProductReferenceMixin, forms.Form):
+    """Элемент пакетного создания партий (api/v1/batches/)"""
+    product = forms.IntegerField(required=False, min_value=1)
+    sku = forms.CharField(required=False, max_length=50)
+    quantity = forms.IntegerField(min_value=1)
+    supplier = forms.CharField(max_length=200)
+    notes = forms.CharField(required=False)
+    expiry_date = forms.DateField(required=False)
+
+
+class ApiPlacementItemForm(forms.Form):
+    """Элемент пакетного размещения (api/v1/placements/).
+
+    Партия и стеллаж проверяются не здесь, а по снимку склада для всего запроса.
+    """
+    batch = forms.IntegerField(min_value=1)
+    rack = forms.IntegerField(min_value=1)
+    quantity = forms.IntegerField(min_value=1)
+
+
+class ApiIssueItemForm(ProductReferenceMixin, forms.Form):
+    """Строка пакетной выдачи (api/v1/issues/)"""
+    product = forms.IntegerField(required=False, min_value=1)
+    sku = forms.CharField(required=False, max_length=50)
+    quantity = forms.IntegerField(min_value=1)
+    operator = forms.CharField(required=False, max_length=100)
+
+
+class ApiScanItemForm(forms.Form):
+    """Сканирование терминала (api/v1/scans/).
+
+    code - содержимое штрихкода: этикетка партии (артикул/партия) или артикул.
+    """
+    key = forms.CharField(max_length=64)
+    action = forms.ChoiceField(choices=ACTIONS)
+    code = forms.CharField(max_length=100)
+    rack = forms.IntegerField(required=False, min_value=1)
+    quantity = forms.IntegerField(required=False, min_value=1)
+
+    def clean_quantity(self):
+        return self.cleaned_data['quantity'] or 1
@@ -0,0 +1,93 @@
+"""История загрузки стеллажей и зон для отчетов о трендах.
+
+take() снимает текущую загрузку по объему, занятый вес и число артикулов
+каждого активного стеллажа и каждой зоны и записывает их одним bulk_create
+в UtilizationSnapshot. Стеллажи читаются одним агрегирующим запросом,
+зоны - по свернутым показателям (locations.py) плюс один запрос числа
+артикулов. Снимок запускается периодически: командой snapshot_utilization
+из cron или задачей utilization_snapshot очереди.
+
+downsample() сворачивает сырые точки старше SNAPSHOT_RAW_DAYS в одну
+среднесуточную на стеллаж или зону и удаляет точки старше
+SNAPSHOT_KEEP_DAYS. Граница свертки - полночь, так что день не делится
+между сырыми и дневными точками. Годовой отчет читает только эту таблицу:
+ни журнал, ни размещения не перебираются.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Avg, Count, Max, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Placement, Rack, UtilizationSnapshot, Zone
+
+CHUNK_SIZE = 1000
+
+
+def take(now=None):
+    """Записывает снимок загрузки всех активных стеллажей и зон; возвращает число точек"""
+    now = now or timezone.now()
+    points = []
+    racks = Rack.objects.filter(is_active=True).with_occupancy().annotate(
+        sku_count=Count('placements__product', filter=Q(placements__is_active=True), distinct=True))
+    for rack in racks:
+        points.append(UtilizationSnapshot(
+            taken_at=now, kind=UtilizationSnapshot.RACK, object_id=rack.pk,
+            utilization=rack.get_utilization_percent(),
+            weight=round(rack.occupied_weight_sum or 0, 2), sku_count=rack.sku_count))
+    zone_skus = dict(Placement.objects.filter(
+        is_active=True, rack__is_active=True, rack__aisle__isnull=False).values(
+        'rack__aisle__zone').annotate(n=Count('product', distinct=True)).values_list(
+        'rack__aisle__zone', 'n'))
+    for zone in Zone.objects.filter(racks_count__gt=0):
+        points.append(UtilizationSnapshot(
+            taken_at=now, kind=UtilizationSnapshot.ZONE, object_id=zone.pk,
+            utilization=zone.get_utilization_percent(), weight=round(zone.occupied_weight, 2),
+            sku_count=zone_skus.get(zone.pk, 0)))
+    UtilizationSnapshot.objects.bulk_create(points, batch_size=CHUNK_SIZE)
+    return len(points)
+
+
+def _midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def downsample(now=None):
+    """Сворачивает старые сырые точки в среднесуточные; возвращает (свернуто, удалено)"""
+    now = now or timezone.now()
+    raw_days = getattr(settings, 'SNAPSHOT_RAW_DAYS', 14)
+    keep_days = getattr(settings, 'SNAPSHOT_KEEP_DAYS', 730)
+    today = timezone.localdate(now)
+    boundary = _midnight(today - timedelta(days=raw_days))
+    old = UtilizationSnapshot.objects.filter(
+        resolution=UtilizationSnapshot.RAW, taken_at__lt=boundary)
+    rows = old.annotate(day=TruncDate('taken_at')).order_by().values(
+        'kind', 'object_id', 'day').annotate(
+        avg_utilization=Avg('utilization'), avg_weight=Avg('weight'), max_sku=Max('sku_count'))
+    UtilizationSnapshot.objects.bulk_create([
+        UtilizationSnapshot(
+            taken_at=_midnight(row['day']),
+            kind=row['kind'], object_id=row['object_id'], resolution=UtilizationSnapshot.DAILY,
+            utilization=round(row['avg_utilization'], 1), weight=round(row['avg_weight'], 2),
+            sku_count=row['max_sku'])
+        for row in rows
+    ], batch_size=CHUNK_SIZE)
+    folded, _ = old.delete()
+    expired, _ = UtilizationSnapshot.objects.filter(
+        taken_at__lt=_midnight(today - timedelta(days=keep_days))).delete()
+    return folded, expired
+
+
+def series(kind, object_ids=None, days=365, now=None):
+    """Точки за days дней: {объект: [(время, загрузка, вес, артикулов)]} по времени"""
+    since = (now or timezone.now()) - timedelta(days=days)
+    points = UtilizationSnapshot.objects.filter(kind=kind, taken_at__gte=since)
+    if object_ids is not None:
+        points = points.filter(object_id__in=object_ids)
+    result = defaultdict(list)
+    for object_id, *point in points.order_by('object_id', 'taken_at').values_list(
+            'object_id', 'taken_at', 'utilization', 'weight', 'sku_count'):
+        result[object_id].append(tuple(point))
+    return result
@@ -0,0 +1,310 @@
+"""Очередь фоновых задач в базе данных склада.
+
+enqueue() добавляет строку Job, команда run_workers запускает N процессов,
+каждый из которых забирает задачи через claim() и выполняет обработчик,
+зарегистрированный декоратором @task. Внешний брокер не нужен.
+
+Захват задачи:
+
+- SELECT ... FOR UPDATE SKIP LOCKED там, где он поддерживается
+  (PostgreSQL, MySQL 8): обработчики не ждут друг друга;
+- иначе (SQLite) условный UPDATE ... WHERE status='queued' по выбранной
+  строке: из двух обработчиков, выбравших одну задачу, ее получит тот,
+  чей UPDATE изменил строку, второй берет следующую.
+
+Обработчик получает задачу и параметры (payload) и сообщает прогресс
+через progress(). Исключение возвращает задачу в очередь с задержкой,
+растущей вдвое, пока не исчерпано max_attempts. Пока обработчик работает,
+отдельный поток раз в JOB_HEARTBEAT_INTERVAL обновляет отклик (heartbeat),
+так что долгий пересчет одним запросом не считается зависшим. Задачи, чей
+обработчик перестал откликаться дольше JOB_STALE_AFTER (процесс убит),
+возвращаются в очередь функцией requeue_stale(). Итог задачи сохраняется,
+только если она все еще принадлежит этому обработчику: задачу, которую
+успели вернуть в очередь и отдать другому, он не перезаписывает.
+"""
+import csv
+import logging
+import threading
+import time
+import traceback
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from . import history, labels, locations, reservations, services, stock
+from .models import Job, Placement, Product, Reservation, WarehouseJournal
+
+logger = logging.getLogger('warehouse.jobs')
+
+# Тип задачи -> (название, обработчик)
+TASKS = {}
+
+
+def task(kind, title):
+    """Регистрирует обработчик задач типа kind: func(job, **payload) -> результат (JSON)"""
+    def register(func):
+        TASKS[kind] = (title, func)
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, created_by='', max_attempts=None, delay=None):
+    if kind not in TASKS:
+        raise ValueError(f'Неизвестный тип задачи: {kind}')
+    return Job.objects.create(
+        kind=kind, payload=payload or {}, created_by=created_by,
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 3),
+        run_after=timezone.now() + (delay or timedelta()))
+
+
+def _start(pk, worker, now):
+    """Переводит задачу в RUNNING; False, если ее уже забрал другой обработчик"""
+    return Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+        status=Job.RUNNING, worker=worker, started=now, heartbeat=now,
+        attempts=F('attempts') + 1, progress=0, message='') == 1
+
+
+def claim(worker, candidates=10):
+    """Забирает следующую готовую задачу или возвращает None"""
+    now = timezone.now()
+    queryset = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by('run_after', 'pk')
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pk = queryset.select_for_update(skip_locked=True).values_list('pk', flat=True).first()
+            if pk is None or not _start(pk, worker, now):
+                return None
+        return Job.objects.get(pk=pk)
+    for pk in queryset.values_list('pk', flat=True)[:candidates]:
+        if _start(pk, worker, now):
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def _owned(job):
+    """Строка задачи, пока она выполняется этим обработчиком"""
+    return Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker)
+
+
+def progress(job, percent, message=''):
+    """Сохраняет прогресс задачи; заодно это отклик обработчика для requeue_stale"""
+    job.progress = max(0, min(100, int(percent)))
+    job.message = message[:200]
+    _owned(job).update(progress=job.progress, message=job.message, heartbeat=timezone.now())
+
+
+class Heartbeat:
+    """Поток, обновляющий отклик задачи, пока выполняется ее обработчик.
+
+    Обработчики вроде stock.rebuild() работают одним долгим запросом и не
+    вызывают progress(); без этого потока requeue_stale() вернул бы такую
+    задачу в очередь и она выполнилась бы дважды.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.interval = getattr(settings, 'JOB_HEARTBEAT_INTERVAL', 60)
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.beat, name=f'heartbeat-{job.pk}', daemon=True)
+
+    def beat(self):
+        try:
+            while not self.stop.wait(self.interval):
+                try:
+                    _owned(self.job).update(heartbeat=timezone.now())
+                except DatabaseError:
+                    # База занята записью самой задачи (SQLite): следующий отклик позже
+                    logger.warning('Не удалось обновить отклик задачи #%s', self.job.pk)
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop.set()
+        self.thread.join()
+
+
+def get_retry_delay(attempt):
+    return timedelta(seconds=getattr(settings, 'JOB_RETRY_DELAY', 30) * 2 ** (attempt - 1))
+
+
+def run(job):
+    """Выполняет захваченную задачу и сохраняет результат; True при успехе"""
+    title, func = TASKS.get(job.kind, (job.kind, None))
+    started = time.monotonic()
+    try:
+        if func is None:
+            raise LookupError(f'Обработчик задачи {job.kind} не зарегистрирован')
+        with Heartbeat(job):
+            result = func(job, **job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        now = timezone.now()
+        retry = func is not None and job.attempts < job.max_attempts
+        logger.exception('Задача %s #%s завершилась ошибкой (попытка %s из %s)',
+                         job.kind, job.pk, job.attempts, job.max_attempts)
+        if retry:
+            _owned(job).update(status=Job.QUEUED, worker='', error=error,
+                               run_after=now + get_retry_delay(job.attempts))
+        else:
+            _owned(job).update(status=Job.FAILED, error=error, finished=now)
+        return False
+    if not _owned(job).update(status=Job.DONE, progress=100, result=result, error='',
+                              finished=timezone.now()):
+        logger.warning('Задача %s #%s возвращена в очередь во время выполнения; '
+                       'результат обработчика %s не сохранен', job.kind, job.pk, job.worker)
+        return False
+    logger.info('Задача %s #%s выполнена за %.1f с', job.kind, job.pk, time.monotonic() - started)
+    return True
+
+
+def requeue_stale(now=None):
+    """Возвращает в очередь задачи обработчиков, не откликавшихся JOB_STALE_AFTER"""
+    now = now or timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        heartbeat__lt=now - getattr(settings, 'JOB_STALE_AFTER', timedelta(minutes=10)))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished=now, error='Обработчик перестал отвечать')
+    return failed + stale.update(status=Job.QUEUED, worker='', run_after=now)
+
+
+def work(worker, stop=None, burst=False, max_jobs=None):
+    """Цикл обработчика: забирает и выполняет задачи до stop.is_set().
+
+    burst=True - выйти, когда очередь опустела (cron, тесты).
+    Возвращает число выполненных задач.
+    """
+    poll_interval = getattr(settings, 'JOB_POLL_INTERVAL', 1.0)
+    done = 0
+    last_requeue = 0
+    while not (stop and stop.is_set()) and (max_jobs is None or done < max_jobs):
+        close_old_connections()
+        if time.monotonic() - last_requeue > 60:
+            requeue_stale()
+            last_requeue = time.monotonic()
+        job = claim(worker)
+        if job is None:
+            if burst:
+                break
+            time.sleep(poll_interval)
+            continue
+        logger.info('%s: задача %s #%s, попытка %s', worker, job.kind, job.pk, job.attempts)
+        run(job)
+        done += 1
+    close_old_connections()
+    return done
+
+
+def get_output_dir():
+    path = Path(getattr(settings, 'JOB_OUTPUT_DIR', Path(settings.MEDIA_ROOT) / 'jobs'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def output_result(path, **extra):
+    """Результат задачи с файлом в JOB_OUTPUT_DIR (ссылка через MEDIA_URL)"""
+    return {'file': path.name, 'url': f'{settings.MEDIA_URL}jobs/{path.name}', **extra}
+
+
+@task('rebuild_stock_counters', 'Пересчет счетчиков остатков')
+def rebuild_stock_counters(job):
+    with transaction.atomic():
+        products = stock.rebuild()
+    return {'products': products}
+
+
+@task('rebuild_locations', 'Пересчет вместимости складов, зон и рядов')
+def rebuild_locations(job):
+    with transaction.atomic():
+        aisles = locations.rebuild()
+    return {'aisles': aisles}
+
+
+@task('utilization_snapshot', 'Снимок загрузки стеллажей и зон')
+def utilization_snapshot(job, downsample=True):
+    with transaction.atomic():
+        points = history.take()
+    result = {'points': points}
+    if downsample:
+        with transaction.atomic():
+            result['folded'], result['expired'] = history.downsample()
+    return result
+
+
+@task('expire_reservations', 'Закрытие истекших резервов')
+def expire_reservations(job, batch_size=1000):
+    expire = services.retry_on_conflict(transaction.atomic(reservations.expire))
+    total = 0
+    while True:
+        expired = expire(limit=batch_size)
+        total += expired
+        progress(job, 0, f'Закрыто резервов: {total}')
+        if expired < batch_size:
+            return {'expired': total}
+
+
+@task('reconcile_stock', 'Сверка счетчиков остатков с размещениями')
+def reconcile_stock(job, fix=False, chunk_size=500):
+    """Сравнивает счетчики с размещениями за вычетом резервов по частям каталога"""
+    product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+    mismatched = []
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size]
+        placed = dict(Placement.objects.filter(product__in=chunk, is_active=True).values(
+            'product').annotate(total=Sum('quantity')).values_list('product', 'total'))
+        reserved = dict(Reservation.objects.filter(
+            product__in=chunk, status=Reservation.ACTIVE).values('product').annotate(
+            total=Sum('quantity')).values_list('product', 'total'))
+        counters = stock.available(chunk)
+        mismatched += [pk for pk in chunk if counters.get(pk, 0) !=
+                       placed.get(pk, 0) - reserved.get(pk, 0)]
+        done = start + len(chunk)
+        progress(job, done * 100 / len(product_ids),
+                 f'Проверено товаров: {done} из {len(product_ids)}')
+    if fix and mismatched:
+        with transaction.atomic():
+            stock.rebuild(mismatched)
+    return {'checked': len(product_ids), 'mismatched': mismatched[:100],
+            'mismatched_count': len(mismatched), 'fixed': bool(fix and mismatched)}
+
+
+@task('export_journal', 'Выгрузка журнала операций в CSV')
+def export_journal(job, date_from=None, date_to=None, chunk_size=2000):
+    entries = WarehouseJournal.objects.order_by('pk')
+    if date_from:
+        entries = entries.filter(operation_date__date__gte=parse_date(date_from))
+    if date_to:
+        entries = entries.filter(operation_date__date__lte=parse_date(date_to))
+    total = entries.count()
+    path = get_output_dir() / f'journal-{job.pk}.csv'
+    rows = entries.values_list('operation_date', 'operation_type', 'product__sku', 'product__name',
+                               'quantity', 'rack__name', 'batch_id', 'operator', 'notes')
+    with open(path, 'w', newline='', encoding='utf-8-sig') as output:
+        writer = csv.writer(output, delimiter=';')
+        writer.writerow(['Дата', 'Операция', 'Артикул', 'Товар', 'Количество', 'Стеллаж',
+                         'Партия', 'Оператор', 'Описание'])
+        for number, row in enumerate(rows.iterator(chunk_size=chunk_size), start=1):
+            writer.writerow([timezone.localtime(row[0]).strftime('%d.%m.%Y %H:%M'), *row[1:]])
+            if number % chunk_size == 0:
+                progress(job, number * 100 / total, f'Выгружено строк: {number} из {total}')
+    return output_result(path, rows=total)
+
+
+@task('wave_labels', 'Этикетки волны приемки (PDF)')
+def wave_labels(job, date, per='placement'):
+    pages = labels.paginate(labels.labels_for_batches(
+        labels.batches_for_wave(parse_date(date)), per=per))
+    path = get_output_dir() / f'labels-wave-{date}-{job.pk}.pdf'
+    progress(job, 0, f'Листов: {len(pages)}')
+    with open(path, 'wb') as output:
+        for chunk in labels.stream_pdf(pages):
+            output.write(chunk)
+    return output_result(path, pages=len(pages))
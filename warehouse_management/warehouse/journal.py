@@ -0,0 +1,85 @@
+"""Буферизованная запись журнала операций.
+
+Складские операции не пишут WarehouseJournal сами, а передают записи в
+journal.record(). Внутри unit_of_work() записи копятся в буфере и
+вставляются одним bulk_create при завершении блока, сколько бы размещений
+ни затронула операция и сколько бы операций ни выполнил запрос.
+
+Режимы (JOURNAL_DURABLE или аргумент durable):
+
+- durable=True - буфер сбрасывается в конце блока внутри той же транзакции:
+  журнал фиксируется или откатывается вместе с размещениями;
+- durable=False - буфер сбрасывается в transaction.on_commit отдельной
+  короткой транзакцией: блокировка записи удерживается меньше, но при сбое
+  между двумя фиксациями записи журнала будут потеряны.
+
+При исключении внутри блока буфер отбрасывается в обоих режимах.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import WarehouseJournal
+
+_local = threading.local()
+
+
+class JournalWriter:
+    def __init__(self):
+        self.entries = []
+
+    def add(self, entries):
+        self.entries.extend(entries)
+
+    def flush(self):
+        entries, self.entries = self.entries, []
+        if entries:
+            WarehouseJournal.objects.bulk_create(entries)
+        return entries
+
+
+def current_writer():
+    return getattr(_local, 'writer', None)
+
+
+@contextmanager
+def unit_of_work(durable=None):
+    """transaction.atomic с буфером журнала; вложенные блоки пишут во внешний буфер.
+
+    Как и transaction.atomic, годится и как декоратор.
+    """
+    writer = current_writer()
+    if writer is not None:
+        mark = len(writer.entries)
+        try:
+            with transaction.atomic():
+                yield writer
+        except BaseException:
+            # Откат точки сохранения отменяет и записи вложенного блока
+            del writer.entries[mark:]
+            raise
+        return
+
+    if durable is None:
+        durable = getattr(settings, 'JOURNAL_DURABLE', True)
+    writer = _local.writer = JournalWriter()
+    try:
+        with transaction.atomic():
+            yield writer
+            if durable:
+                writer.flush()
+            elif writer.entries:
+                transaction.on_commit(writer.flush)
+    finally:
+        _local.writer = None
+
+
+def record(entries):
+    """Добавляет записи журнала в текущий unit_of_work или вставляет сразу"""
+    writer = current_writer()
+    if writer is None:
+        WarehouseJournal.objects.bulk_create(entries)
+    else:
+        writer.add(entries)
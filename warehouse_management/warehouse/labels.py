@@ -0,0 +1,335 @@
+"""Листы этикеток партий со штрихкодом Code128.
+
+Данные этикеток (артикул, партия, стеллаж) собираются из БД в процессе
+запроса, а листы рисуются Pillow в пуле процессов: рендер растровых страниц
+упирается в CPU, и потоки здесь не помогают из-за GIL. Готовые страницы
+сразу отдаются клиенту - PDF пишется потоково, страница за страницей.
+"""
+import os
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+
+from django.conf import settings
+
+from .models import Batch, Placement
+
+# Ширины штрихов и пробелов для значений 0..106 (103-105 - START A/B/C, 106 - STOP)
+CODE128_PATTERNS = (
+    '212222', '222122', '222221', '121223', '121322', '131222', '122213', '122312',
+    '132212', '221213', '221312', '231212', '112232', '122132', '122231', '113222',
+    '123122', '123221', '223211', '221132', '221231', '213212', '223112', '312131',
+    '311222', '321122', '321221', '312212', '322112', '322211', '212123', '212321',
+    '232121', '111323', '131123', '131321', '112313', '132113', '132311', '211313',
+    '231113', '231311', '112133', '112331', '132131', '113123', '113321', '133121',
+    '313121', '211331', '231131', '213113', '213311', '213131', '311123', '311321',
+    '331121', '312113', '312311', '332111', '314111', '221411', '431111', '111224',
+    '111422', '121124', '121421', '141122', '141221', '112214', '112412', '122114',
+    '122411', '142112', '142211', '241211', '221114', '413111', '241112', '134111',
+    '111242', '121142', '121241', '114212', '124112', '124211', '411212', '421112',
+    '421211', '212141', '214121', '412121', '111143', '111341', '131141', '114113',
+    '114311', '411113', '411311', '113141', '114131', '311141', '411131', '211412',
+    '211214', '211232', '2331112',
+)
+START_B = 104
+START_C = 105
+CODE_B = 100
+CODE_C = 99
+STOP = 106
+
+# Лист A4 при 200 dpi, 3 x 8 этикеток
+DPI = 200
+PAGE_SIZE = (1654, 2339)
+GRID = (3, 8)
+MARGIN = 40
+
+
+def code128_values(data):
+    """Коды символов Code128 с контрольной суммой, без STOP.
+
+    Длинные серии цифр кодируются набором C (две цифры на символ),
+    остальное - набором B (ASCII 32..126).
+    """
+    if not data or any(not 32 <= ord(char) <= 126 for char in data):
+        raise ValueError(f'Code128-B не кодирует строку {data!r}')
+
+    values = []
+    current = None
+    i = 0
+    while i < len(data):
+        digits = 0
+        while i + digits < len(data) and data[i + digits].isdigit():
+            digits += 1
+        # Набор C выгоден для серии от 4 цифр или для строки только из цифр
+        if digits >= 4 or (i == 0 and 2 <= digits == len(data)):
+            if current is None:
+                values.append(START_C)
+            elif current != START_C:
+                values.append(CODE_C)
+            current = START_C
+            for _ in range(digits // 2):
+                values.append(int(data[i:i + 2]))
+                i += 2
+            continue
+        if current is None:
+            values.append(START_B)
+        elif current != START_B:
+            values.append(CODE_B)
+        current = START_B
+        values.append(ord(data[i]) - 32)
+        i += 1
+
+    checksum = values[0] + sum(position * value for position, value in enumerate(values[1:], 1))
+    return values + [checksum % 103]
+
+
+def code128_modules(data):
+    """Последовательность модулей штрихкода: True - штрих, False - пробел"""
+    modules = []
+    for value in code128_values(data) + [STOP]:
+        for index, width in enumerate(CODE128_PATTERNS[value]):
+            modules.extend([index % 2 == 0] * int(width))
+    return modules
+
+
+def draw_code128(draw, data, box):
+    """Рисует штрихкод в прямоугольнике box = (x, y, ширина, высота) с тихими зонами"""
+    x, y, width, height = box
+    modules = code128_modules(data)
+    # Тихая зона - 10 модулей с каждой стороны
+    module = max(1, width // (len(modules) + 20))
+    left = x + (width - module * len(modules)) // 2
+    for index, is_bar in enumerate(modules):
+        if is_bar:
+            start = left + index * module
+            draw.rectangle([start, y, start + module - 1, y + height - 1], fill=0)
+    return module
+
+
+@dataclass
+class Label:
+    sku: str
+    product: str
+    batch_id: int
+    rack: str
+    quantity: int
+
+    @property
+    def payload(self):
+        return label_payload(self.sku, self.batch_id)
+
+
+def label_payload(sku, batch_id):
+    """Содержимое штрихкода этикетки: артикул и номер партии"""
+    return f'{sku}/{batch_id}'
+
+
+def parse_label_payload(code):
+    """Разбор штрихкода этикетки: (артикул, номер партии или None для голого артикула)"""
+    code = code.strip()
+    sku, separator, batch_id = code.rpartition('/')
+    if separator and sku and batch_id.isdigit():
+        return sku, int(batch_id)
+    return code, None
+
+
+def labels_for_batches(batches, per='placement'):
+    """Этикетки партий (queryset): по одной на размещение или на единицу товара.
+
+    Для неразмещенного остатка партии этикетки печатаются без стеллажа.
+    """
+    batches = list(batches.select_related('product').with_placement_totals())
+    placements = Placement.objects.filter(
+        batch__in=batches, is_active=True).select_related('rack').order_by('batch', 'pk')
+    by_batch = {}
+    for placement in placements:
+        by_batch.setdefault(placement.batch_id, []).append(placement)
+
+    labels = []
+    for batch in batches:
+        product = batch.product
+        lines = [(p.rack.name, p.quantity) for p in by_batch.get(batch.pk, [])]
+        unplaced = batch.get_initial_remaining()
+        if unplaced > 0:
+            lines.append(('', unplaced))
+        for rack_name, quantity in lines:
+            if per == 'unit':
+                labels.extend(Label(product.sku, product.name, batch.pk, rack_name, 1)
+                              for _ in range(quantity))
+            else:
+                labels.append(Label(product.sku, product.name, batch.pk, rack_name, quantity))
+    return labels
+
+
+def batches_for_wave(date):
+    """Все партии одной волны приемки - пришедшие в указанный день"""
+    return Batch.objects.filter(arrival_date__date=date).order_by('pk')
+
+
+def _fit(draw, text, font, width):
+    while text and draw.textlength(text, font=font) > width:
+        text = text[:-2] + '…' if len(text) > 2 else ''
+    return text
+
+
+def render_page(labels, font_path=None):
+    """Рисует один лист этикеток; выполняется в процессе пула без обращения к БД.
+
+    labels - список словарей Label, возвращается изображение режима '1'.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    def font(size):
+        if font_path and os.path.exists(font_path):
+            return ImageFont.truetype(font_path, size)
+        return ImageFont.load_default(size=size)
+
+    page = Image.new('L', PAGE_SIZE, 255)
+    draw = ImageDraw.Draw(page)
+    title_font, text_font = font(34), font(26)
+    columns, rows = GRID
+    cell_w = (PAGE_SIZE[0] - 2 * MARGIN) // columns
+    cell_h = (PAGE_SIZE[1] - 2 * MARGIN) // rows
+    pad = 16
+
+    for index, item in enumerate(labels):
+        label = Label(**item)
+        x = MARGIN + (index % columns) * cell_w
+        y = MARGIN + (index // columns) * cell_h
+        draw.rectangle([x, y, x + cell_w - 1, y + cell_h - 1], outline=0)
+        inner = cell_w - 2 * pad
+        draw.text((x + pad, y + pad), _fit(draw, label.sku, title_font, inner),
+                  font=title_font, fill=0)
+        draw.text((x + pad, y + pad + 40), _fit(draw, label.product, text_font, inner),
+                  font=text_font, fill=0)
+        details = f'Партия #{label.batch_id}  Стеллаж: {label.rack or "-"}  Кол-во: {label.quantity}'
+        draw.text((x + pad, y + pad + 72), _fit(draw, details, text_font, inner),
+                  font=text_font, fill=0)
+        draw_code128(draw, label.payload, (x + pad, y + pad + 112, inner, cell_h - 2 * pad - 112))
+
+    return page.convert('1', dither=Image.Dither.NONE)
+
+
+def _render_pdf_page(labels, font_path=None):
+    """Лист в виде пары (ширина, высота, сжатые 1-битные строки) для PDF"""
+    page = render_page(labels, font_path)
+    return page.size, zlib.compress(page.tobytes(), 6)
+
+
+def _render_png_page(labels, font_path=None):
+    from io import BytesIO
+
+    output = BytesIO()
+    render_page(labels, font_path).save(output, 'PNG', optimize=True, dpi=(DPI, DPI))
+    return output.getvalue()
+
+
+def paginate(labels):
+    per_page = GRID[0] * GRID[1]
+    return [[asdict(label) for label in labels[i:i + per_page]]
+            for i in range(0, len(labels), per_page)]
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_workers():
+    """Размер пула: LABEL_WORKERS, по умолчанию число процессоров; 0 - без пула"""
+    workers = getattr(settings, 'LABEL_WORKERS', None)
+    if workers is None:
+        return os.cpu_count() or 1
+    return workers
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=get_workers())
+        return _executor
+
+
+def render_pages(pages, renderer):
+    """Результаты renderer для страниц по порядку по мере готовности.
+
+    Одна страница рисуется в текущем процессе. Иначе в пуле находится не больше
+    двух страниц на процесс, чтобы большая волна не держала в памяти весь PDF.
+    """
+    font_path = getattr(settings, 'LABEL_FONT', None)
+    if len(pages) <= 1 or get_workers() == 0:
+        for page in pages:
+            yield renderer(page, font_path)
+        return
+
+    executor = get_executor()
+    window = 2 * get_workers()
+    pending = deque()
+    for page in pages:
+        pending.append(executor.submit(renderer, page, font_path))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def stream_pdf(pages):
+    """Многостраничный PDF, который пишется по мере готовности страниц.
+
+    Каждая страница - одно 1-битное изображение (FlateDecode) во весь лист.
+    Смещения объектов считаются на лету, таблица xref пишется в конце.
+    """
+    offsets = []
+    position = 0
+
+    def emit(chunk):
+        nonlocal position
+        position += len(chunk)
+        return chunk
+
+    def begin_object(number):
+        offsets.append((number, position))
+        return emit(f'{number} 0 obj\n'.encode())
+
+    page_count = len(pages)
+    # 1 - каталог, 2 - дерево страниц, далее по три объекта на страницу
+    page_ids = [3 + 3 * index for index in range(page_count)]
+    yield emit(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    yield begin_object(1) + emit(b'<< /Type /Catalog /Pages 2 0 R >>\nendobj\n')
+    kids = ' '.join(f'{pid} 0 R' for pid in page_ids)
+    yield begin_object(2) + emit(
+        f'<< /Type /Pages /Kids [{kids}] /Count {page_count} >>\nendobj\n'.encode())
+
+    width_pt = PAGE_SIZE[0] * 72 / DPI
+    height_pt = PAGE_SIZE[1] * 72 / DPI
+    for pid, ((width, height), data) in zip(page_ids, render_pages(pages, _render_pdf_page)):
+        image_id, content_id = pid + 1, pid + 2
+        yield begin_object(pid) + emit(
+            (f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width_pt:.2f} {height_pt:.2f}] '
+             f'/Resources << /XObject << /Im0 {image_id} 0 R >> >> '
+             f'/Contents {content_id} 0 R >>\nendobj\n').encode())
+        yield begin_object(image_id) + emit(
+            (f'<< /Type /XObject /Subtype /Image /Width {width} /Height {height} '
+             f'/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /FlateDecode '
+             f'/Length {len(data)} >>\nstream\n').encode()) + emit(data) + emit(
+            b'\nendstream\nendobj\n')
+        content = f'q {width_pt:.2f} 0 0 {height_pt:.2f} 0 0 cm /Im0 Do Q'.encode()
+        yield begin_object(content_id) + emit(
+            f'<< /Length {len(content)} >>\nstream\n'.encode()) + emit(content) + emit(
+            b'\nendstream\nendobj\n')
+
+    xref_position = position
+    size = 3 + 3 * page_count
+    offsets.sort()
+    xref = [f'xref\n0 {size}\n', '0000000000 65535 f \n']
+    xref += [f'{offset:010d} 00000 n \n' for _, offset in offsets]
+    yield emit(''.join(xref).encode())
+    yield emit(f'trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_position}\n%%EOF\n'.encode())
+
+
+def render_png(pages, number):
+    """Один лист этикеток в PNG (нумерация с 1)"""
+    page = pages[number - 1]
+    return next(render_pages([page], _render_png_page))
@@ -0,0 +1,277 @@
+"""Нагрузочный тест: много операторов одновременно работают с WSGI-приложением склада"""
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.signals import got_request_exception
+from django.db.models import Sum, F, Q
+from django.test import Client
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from . import stock
+from .benchmark import percentile
+from .models import Product, Rack, Batch, Placement, Reservation, WarehouseJournal
+
+# Границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+DEFAULT_MIX = {'place': 3, 'issue': 3, 'read': 4}
+
+READ_PAGES = ('warehouse:dashboard', 'warehouse:rack_list', 'warehouse:batch_list',
+              'warehouse:journal', 'warehouse:search_product')
+
+
+def parse_mix(value):
+    """Разбирает строку вида 'place=3,issue=3,read=4'"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f'Неизвестная операция: {name}')
+        mix[name] = int(weight)
+    return mix
+
+
+class LoadTestStats:
+    """Потокобезопасный сбор результатов операций"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(Counter)
+        self.exceptions = Counter()
+
+    def add(self, operation, outcome, latency_ms):
+        with self.lock:
+            self.latencies[operation].append(latency_ms)
+            self.outcomes[operation][outcome] += 1
+
+    def add_exception(self, exc):
+        with self.lock:
+            self.exceptions[f'{type(exc).__name__}: {exc}'] += 1
+
+    @property
+    def lock_errors(self):
+        return sum(n for message, n in self.exceptions.items() if 'locked' in message)
+
+
+def histogram(latencies):
+    """Количество операций по корзинам задержек"""
+    counts = Counter()
+    for value in latencies:
+        for bound in LATENCY_BUCKETS:
+            if value <= bound:
+                counts[f'<={bound}ms'] += 1
+                break
+        else:
+            counts[f'>{LATENCY_BUCKETS[-1]}ms'] += 1
+    labels = [f'<={bound}ms' for bound in LATENCY_BUCKETS] + [f'>{LATENCY_BUCKETS[-1]}ms']
+    return {label: counts[label] for label in labels}
+
+
+def stock_by_product():
+    return dict(Placement.objects.filter(is_active=True).values(
+        'product').annotate(total=Sum('quantity')).values_list('product', 'total'))
+
+
+def check_invariants(stock_before, journal_before):
+    """Проверяет согласованность склада после нагрузки.
+
+    - ни один стеллаж не переполнен по объему или весу;
+    - ни одна партия не размещена сверх своего количества;
+    - изменение остатков совпадает с приходом и расходом в журнале за прогон;
+    - счетчики остатков (stock.py) совпадают с размещениями за вычетом резервов.
+    """
+    violations = []
+    for rack in Rack.objects.with_occupancy():
+        if rack.available_volume() < -1e-6 or rack.available_weight() < -1e-6:
+            violations.append(f'Стеллаж {rack.name} переполнен')
+    over_placed = Batch.objects.with_placement_totals().filter(placed_total__gt=F('quantity'))
+    for batch in over_placed:
+        violations.append(f'Партия #{batch.pk} размещена сверх количества')
+    if Placement.objects.filter(is_active=True, quantity__lte=0).exists():
+        violations.append('Активные размещения с неположительным количеством')
+
+    stock_after = stock_by_product()
+    counters = stock.available(list(stock_after))
+    reserved = dict(Reservation.objects.filter(status=Reservation.ACTIVE).values('product')
+                    .annotate(total=Sum('quantity')).values_list('product', 'total'))
+    for product_id, quantity in stock_after.items():
+        if counters.get(product_id, 0) != quantity - reserved.get(product_id, 0):
+            violations.append(f'Счетчик остатка товара #{product_id} расходится с размещениями')
+    journal = WarehouseJournal.objects.filter(pk__gt=journal_before).values('product').annotate(
+        delta=Sum('quantity', filter=Q(operation_type='IN'), default=0) -
+        Sum('quantity', filter=Q(operation_type='OUT'), default=0))
+    deltas = {row['product']: row['delta'] for row in journal}
+    for product_id in set(stock_before) | set(stock_after) | set(deltas):
+        before = stock_before.get(product_id, 0)
+        after = stock_after.get(product_id, 0)
+        if after < 0:
+            violations.append(f'Отрицательный остаток товара #{product_id}')
+        if after - before != deltas.get(product_id, 0):
+            violations.append(
+                f'Товар #{product_id}: остаток изменился на {after - before}, '
+                f'по журналу на {deltas.get(product_id, 0)}')
+    return violations
+
+
+class Operator:
+    """Один симулированный кладовщик со своей сессией"""
+
+    def __init__(self, application, session_key, host, rnd, batch_ids, product_ids, racks):
+        self.application = application
+        self.host = host
+        self.rnd = rnd
+        self.batch_ids = batch_ids
+        self.product_ids = product_ids
+        self.racks = racks
+        csrf_secret = get_random_string(32)
+        self.cookie = (f'{settings.SESSION_COOKIE_NAME}={session_key}; '
+                       f'{settings.CSRF_COOKIE_NAME}={csrf_secret}')
+        self.csrf_token = csrf_secret
+
+    def request(self, method, path, data=None, query=None):
+        body = urlencode(data or {}).encode()
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': urlencode(query or {}),
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': self.host,
+            'HTTP_COOKIE': self.cookie,
+            'HTTP_X_CSRFTOKEN': self.csrf_token,
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.url_scheme': 'http',
+            'wsgi.version': (1, 0),
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        status = []
+
+        def start_response(status_line, headers, exc_info=None):
+            status.append(int(status_line.split()[0]))
+
+        result = self.application(environ, start_response)
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                # Закрытие ответа отправляет request_finished и освобождает соединение
+                result.close()
+        return status[0]
+
+    def place(self):
+        batch_id = self.rnd.choice(self.batch_ids)
+        rack_id = self.rnd.choice(self.racks)
+        path = reverse('warehouse:place_batch', kwargs={'batch_id': batch_id})
+        return self.request('POST', path, {
+            'batch': batch_id, 'rack': rack_id, 'quantity': self.rnd.randint(1, 5)})
+
+    def issue(self):
+        return self.request('POST', reverse('warehouse:issue_product'), {
+            'product': self.rnd.choice(self.product_ids),
+            'quantity': self.rnd.randint(1, 5),
+            'operator': 'Нагрузочный тест',
+        })
+
+    def read(self):
+        name = self.rnd.choice(READ_PAGES)
+        query = {'q': 'Товар 00'} if name == 'warehouse:search_product' else None
+        return self.request('GET', reverse(name), query=query)
+
+
+def _outcome(operation, status):
+    if status >= 500:
+        return 'error'
+    if operation == 'read':
+        return 'ok' if status == 200 else f'http_{status}'
+    # Успешная операция заканчивается редиректом, повторный показ формы - отказ валидации
+    return 'ok' if status == 302 else 'rejected' if status == 200 else f'http_{status}'
+
+
+def run_load_test(application, user, operators=8, ops_per_operator=50, mix=None,
+                  seed=1, host='localhost'):
+    """Запускает операторов в пуле потоков и возвращает отчет с метриками"""
+    mix = mix or DEFAULT_MIX
+    operations = [name for name, weight in mix.items() for _ in range(weight)]
+    if not operations:
+        raise ValueError('Пустой набор операций')
+
+    client = Client()
+    client.force_login(user)
+    session_key = client.session.session_key
+
+    batch_ids = list(Batch.objects.values_list('pk', flat=True)) or [0]
+    product_ids = list(Product.objects.values_list('pk', flat=True)) or [0]
+    racks = list(Rack.objects.filter(is_active=True).values_list('pk', flat=True)) or [0]
+    stock_before = stock_by_product()
+    journal_before = WarehouseJournal.objects.order_by('-pk').values_list(
+        'pk', flat=True).first() or 0
+
+    stats = LoadTestStats()
+
+    def on_exception(sender, request=None, **kwargs):
+        stats.add_exception(sys.exc_info()[1])
+
+    def work(index):
+        rnd = random.Random(seed * 1000 + index)
+        operator = Operator(application, session_key, host, rnd,
+                            batch_ids, product_ids, racks)
+        for _ in range(ops_per_operator):
+            operation = rnd.choice(operations)
+            start = time.perf_counter()
+            try:
+                status = getattr(operator, operation)()
+            except Exception as exc:
+                stats.add_exception(exc)
+                status = 500
+            stats.add(operation, _outcome(operation, status),
+                      (time.perf_counter() - start) * 1000)
+
+    got_request_exception.connect(on_exception)
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=operators) as pool:
+            list(pool.map(work, range(operators)))
+    finally:
+        got_request_exception.disconnect(on_exception)
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [v for values in stats.latencies.values() for v in values]
+    return {
+        'operators': operators,
+        'elapsed_s': round(elapsed, 3),
+        'total_ops': len(all_latencies),
+        'ops_per_sec': round(len(all_latencies) / elapsed, 1) if elapsed else 0.0,
+        'operations': {
+            name: {
+                'count': len(values),
+                'ops_per_sec': round(len(values) / elapsed, 1) if elapsed else 0.0,
+                'p50_ms': round(percentile(values, 50), 2),
+                'p95_ms': round(percentile(values, 95), 2),
+                'p99_ms': round(percentile(values, 99), 2),
+                'outcomes': dict(stats.outcomes[name]),
+                'histogram': histogram(values),
+            }
+            for name, values in stats.latencies.items()
+        },
+        'lock_errors': stats.lock_errors,
+        'exceptions': dict(stats.exceptions),
+        'invariant_violations': check_invariants(stock_before, journal_before),
+    }
@@ -0,0 +1,184 @@
+"""Иерархия склад - зона - ряд - стеллаж и свернутая вместимость уровней.
+
+Ряд, зона и склад хранят суммы по активным стеллажам (объем, нагрузка,
+занятое) и максимумы (свободное место одного стеллажа, габариты), см.
+CapacityNode. Подбор стеллажей сначала отсекает зоны и ряды, куда товар
+не поместится, и читает с занятостью только стеллажи оставшихся рядов, а
+сводка по складам и зонам вообще не читает стеллажи.
+
+Показатели пересчитываются снизу вверх только для затронутой ветки:
+ряд - по своим стеллажам, зона - по своим рядам, склад - по зонам.
+Складские операции (services) вызывают racks_changed() с изменившимися
+стеллажами, сохранение размещений, стеллажей, рядов и зон - через сигналы.
+Строки уровней блокируются перед пересчетом (где есть SELECT FOR UPDATE),
+чтобы параллельные операции не записали показатели, посчитанные по
+устаревшему снимку. Массовые изменения в обход этих путей (seed) требуют
+rebuild() или команды rebuild_locations.
+"""
+from django.db import connection
+from django.db.models import Max, Sum
+
+from . import slots
+from .models import Aisle, Rack, Warehouse, Zone
+
+SUM_FIELDS = ('racks_count', 'total_volume', 'occupied_volume', 'total_load', 'occupied_weight')
+MAX_FIELDS = ('max_free_volume', 'max_free_weight', 'max_length', 'max_width', 'max_height')
+FIELDS = SUM_FIELDS + MAX_FIELDS
+
+
+def _lock(model, ids):
+    if connection.features.has_select_for_update:
+        list(model.objects.select_for_update().filter(pk__in=ids).order_by('pk')
+             .values_list('pk', flat=True))
+
+
+def _save(model, totals):
+    model.objects.bulk_update([model(pk=pk, **values) for pk, values in totals.items()], FIELDS)
+
+
+def _refresh_aisles(ids):
+    _lock(Aisle, ids)
+    totals = {pk: dict.fromkeys(FIELDS, 0) for pk in ids}
+    for rack in Rack.objects.filter(aisle__in=ids, is_active=True).with_occupancy():
+        values = totals[rack.aisle_id]
+        free_volume = rack.available_volume()
+        free_weight = rack.available_weight()
+        values['racks_count'] += 1
+        values['total_volume'] += rack.volume
+        values['occupied_volume'] += rack.volume - free_volume
+        values['total_load'] += rack.max_load
+        values['occupied_weight'] += rack.max_load - free_weight
+        for field, value in (('max_free_volume', free_volume), ('max_free_weight', free_weight),
+                             ('max_length', rack.length), ('max_width', rack.width),
+                             ('max_height', rack.height)):
+            values[field] = max(values[field], value)
+    _save(Aisle, totals)
+
+
+def _roll_up(model, child_model, link, ids):
+    """Пересчитывает уровни model по дочерним строкам одним агрегирующим запросом"""
+    _lock(model, ids)
+    totals = {pk: dict.fromkeys(FIELDS, 0) for pk in ids}
+    rows = child_model.objects.filter(**{f'{link}__in': ids}).order_by().values(link).annotate(
+        **{field: Sum(field) for field in SUM_FIELDS}, **{field: Max(field) for field in MAX_FIELDS})
+    for row in rows:
+        totals[row.pop(link)].update(row)
+    _save(model, totals)
+
+
+def refresh(aisle_ids=(), zone_ids=(), warehouse_ids=()):
+    """Пересчитывает ряды, затем зоны, затем склады; родители передаются явно"""
+    aisle_ids, zone_ids, warehouse_ids = (
+        {pk for pk in ids if pk is not None} for ids in (aisle_ids, zone_ids, warehouse_ids))
+    if aisle_ids:
+        _refresh_aisles(aisle_ids)
+    if zone_ids:
+        _roll_up(Zone, Aisle, 'zone', zone_ids)
+    if warehouse_ids:
+        _roll_up(Warehouse, Zone, 'warehouse', warehouse_ids)
+
+
+def racks_changed(rack_ids):
+    """Занятость стеллажей изменилась: пересчитать их ряды, зоны и склады"""
+    if rack_ids:
+        aisles_changed(Rack.objects.filter(pk__in=rack_ids, aisle__isnull=False).values('aisle'))
+
+
+def aisles_changed(aisle_ids):
+    """Пересчитывает ряды и их ветку; цепочка родителей читается одним запросом"""
+    branches = list(Aisle.objects.filter(pk__in=aisle_ids).values_list('pk', 'zone', 'zone__warehouse'))
+    if branches:
+        refresh(*zip(*branches))
+
+
+def zones_changed(zone_ids):
+    branches = list(Zone.objects.filter(pk__in=zone_ids).values_list('pk', 'warehouse'))
+    if branches:
+        zones, warehouses = zip(*branches)
+        refresh(zone_ids=zones, warehouse_ids=warehouses)
+
+
+def rebuild():
+    """Пересчитывает все уровни; возвращает число рядов"""
+    aisle_ids = list(Aisle.objects.values_list('pk', flat=True))
+    refresh(aisle_ids, Zone.objects.values_list('pk', flat=True),
+            Warehouse.objects.values_list('pk', flat=True))
+    return len(aisle_ids)
+
+
+def candidate_racks(product, warehouse=None):
+    """Активные стеллажи, куда может поместиться единица товара, с занятостью.
+
+    Зоны и ряды отсекаются по свернутым показателям до чтения стеллажей.
+    Стеллажи вне иерархии (без ряда) проверяются, если склад не задан.
+    """
+    zones = Zone.objects.fitting(product)
+    if warehouse is not None:
+        zones = zones.filter(warehouse=warehouse)
+    racks = Rack.objects.filter(
+        is_active=True, length__gte=product.length, width__gte=product.width,
+        height__gte=product.height, max_load__gte=product.weight)
+    located = racks.filter(aisle__in=Aisle.objects.fitting(product).filter(zone__in=zones))
+    if warehouse is None:
+        located = located | racks.filter(aisle__isnull=True)
+    return located.select_related('aisle__zone__warehouse').with_occupancy()
+
+
+def plan_placement(product, quantity, warehouse=None):
+    """Распределяет quantity единиц по подходящим стеллажам, начиная с самых свободных.
+
+    Возвращает ([(стеллаж, сколько помещается, сколько предложено)], не поместилось).
+    При SLOT_ALLOCATION на стеллаже с полками помещается не больше, чем дает
+    самый длинный свободный участок ячеек.
+    """
+    racks = sorted(candidate_racks(product, warehouse), key=lambda rack: rack.available_volume(),
+                   reverse=True)
+    slot_map = slots.SlotMap([rack.pk for rack in racks]) if slots.is_enabled() and racks else None
+    plan = []
+    remaining = quantity
+    for rack in racks:
+        if remaining <= 0:
+            break
+        max_quantity = min(int(rack.available_volume() // product.get_volume()),
+                           int(rack.available_weight() // product.weight))
+        if slot_map is not None and slot_map.has_shelves(rack):
+            max_quantity = min(max_quantity, slot_map.capacity(rack, product))
+        if max_quantity > 0:
+            suggested = min(max_quantity, remaining)
+            plan.append((rack, max_quantity, suggested))
+            remaining -= suggested
+    return plan, remaining
+
+
+# Сигналы: pre_save запоминает прежнего родителя, post_save и post_delete
+# пересчитывают ветки прежнего и нового родителя
+PARENT_FIELDS = {Rack: 'aisle_id', Aisle: 'zone_id', Zone: 'warehouse_id'}
+
+
+def remember_parent(sender, instance, raw=False, **kwargs):
+    instance._old_parent = None
+    if raw or instance._state.adding:
+        return
+    instance._old_parent = sender.objects.filter(pk=instance.pk).values_list(
+        PARENT_FIELDS[sender], flat=True).first()
+
+
+def track_location_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    parents = {getattr(instance, PARENT_FIELDS[sender]), getattr(instance, '_old_parent', None)}
+    parents.discard(None)
+    if not parents:
+        return
+    if sender is Rack:
+        aisles_changed(parents)
+    elif sender is Aisle:
+        zones_changed(parents)
+    else:
+        refresh(warehouse_ids=parents)
+
+
+def track_placement_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        # Размещение могли перенести на другой стеллаж (stock.remember_stock)
+        racks_changed({instance.rack_id, getattr(instance, '_counted_rack', None)} - {None})
@@ -0,0 +1,57 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.benchmark import compare, load_baseline, run_benchmark, save_baseline
+
+
+class Command(BaseCommand):
+    help = 'Замеряет задержки и число SQL-запросов всех страниц склада и сравнивает с базовой линией'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Количество замеров на каждый URL')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='Количество прогревочных запросов')
+        parser.add_argument('--url-name', action='append', dest='names',
+                            help='Замерить только указанные маршруты (можно повторять)')
+        parser.add_argument('--username', default='bench',
+                            help='Пользователь, от имени которого выполняются запросы')
+        parser.add_argument('--save', metavar='PATH',
+                            help='Сохранить результаты как базовую линию в JSON')
+        parser.add_argument('--compare', metavar='PATH',
+                            help='Сравнить результаты с базовой линией из JSON')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимый рост p95 относительно базовой линии (доля)')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Завершиться с ошибкой при обнаружении регрессий')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть не меньше 1')
+        # Сотрудник, чтобы служебные страницы тоже попадали в замеры
+        user, _ = User.objects.get_or_create(
+            username=options['username'], defaults={'is_staff': True})
+
+        data = run_benchmark(user, repeat=options['repeat'],
+                             warmup=options['warmup'], names=options['names'])
+
+        self.stdout.write(f"{'Маршрут':<20} {'Статус':>6} {'p50, мс':>9} {'p95, мс':>9} {'SQL':>5}")
+        for name, result in data['results'].items():
+            self.stdout.write(
+                f"{name:<20} {result['status']:>6} {result['p50_ms']:>9.2f} "
+                f"{result['p95_ms']:>9.2f} {result['queries']:>5}")
+
+        if options['save']:
+            save_baseline(data, options['save'])
+            self.stdout.write(self.style.SUCCESS(f"Базовая линия сохранена в {options['save']}"))
+
+        if options['compare']:
+            regressions = compare(load_baseline(options['compare']), data,
+                                  tolerance=options['tolerance'])
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS('Регрессий не обнаружено'))
+                return
+            for line in regressions:
+                self.stdout.write(self.style.WARNING(line))
+            if options['fail_on_regression']:
+                raise CommandError(f'Обнаружено регрессий: {len(regressions)}')
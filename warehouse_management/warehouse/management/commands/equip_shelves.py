@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from warehouse import slots
+from warehouse.models import Rack
+
+
+class Command(BaseCommand):
+    help = ('Делит стеллажи на полки с ячейками и раскладывает по ним текущие размещения '
+            '(--rebuild: только пересчитать карты занятости)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('racks', nargs='*', help='Названия стеллажей (по умолчанию все активные)')
+        parser.add_argument('--levels', type=int, default=4, help='Полок на стеллаж')
+        parser.add_argument('--slots', type=int, default=20, help='Ячеек на полке')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Пересчитать карты занятости по размещениям, не меняя полки')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            with transaction.atomic():
+                shelves = slots.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Карты занятости пересчитаны, полок: {shelves}'))
+            return
+        if not 1 <= options['levels'] <= 50 or not 1 <= options['slots'] <= 1000:
+            raise CommandError('Допустимо от 1 до 50 полок и от 1 до 1000 ячеек на полке')
+        racks = Rack.objects.filter(is_active=True)
+        if options['racks']:
+            racks = Rack.objects.filter(name__in=options['racks'])
+            missing = set(options['racks']) - set(racks.values_list('name', flat=True))
+            if missing:
+                raise CommandError(f'Стеллажи не найдены: {", ".join(sorted(missing))}')
+        unplaced = 0
+        with transaction.atomic():
+            for rack in racks:
+                for placement in slots.equip(rack, options['levels'], options['slots']):
+                    unplaced += 1
+                    self.stderr.write(f'{rack.name}: размещению #{placement.pk} не хватило ячеек')
+        self.stdout.write(self.style.SUCCESS(
+            f'Полки созданы, стеллажей: {racks.count()}, размещений без ячеек: {unplaced}'))
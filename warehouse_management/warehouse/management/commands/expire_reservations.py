@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from warehouse import journal, reservations, services
+
+
+@services.retry_on_conflict
+@journal.unit_of_work()
+def expire_batch(limit):
+    return reservations.expire(limit=limit)
+
+
+class Command(BaseCommand):
+    help = 'Закрывает истекшие резервы и возвращает их количество в остаток (для cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько резервов закрывать в одной транзакции')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            expired = expire_batch(options['batch_size'])
+            total += expired
+            if expired < options['batch_size']:
+                break
+        self.stdout.write(self.style.SUCCESS(f'Закрыто истекших резервов: {total}'))
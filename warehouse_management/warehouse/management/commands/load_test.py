@@ -0,0 +1,69 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.loadtest import DEFAULT_MIX, parse_mix, run_load_test
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест: параллельные операторы размещают, выдают товар и читают '
+            'страницы через WSGI-приложение. Изменяет данные - запускайте на тестовой базе')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operators', type=int, default=8,
+                            help='Количество одновременных операторов (потоков)')
+        parser.add_argument('--ops', type=int, default=50,
+                            help='Количество операций на одного оператора')
+        parser.add_argument('--mix', default=','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()),
+                            help='Веса операций, например place=3,issue=3,read=4')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--username', default='loadtest',
+                            help='Пользователь, от имени которого работают операторы')
+        parser.add_argument('--host', default='localhost',
+                            help='Значение заголовка Host (должно быть в ALLOWED_HOSTS)')
+        parser.add_argument('--json', action='store_true',
+                            help='Вывести отчет в формате JSON')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if options['operators'] < 1 or options['ops'] < 1:
+            raise CommandError('--operators и --ops должны быть положительными')
+
+        from warehouse_management.wsgi import application
+
+        user, _ = User.objects.get_or_create(username=options['username'])
+        report = run_load_test(application, user, operators=options['operators'],
+                               ops_per_operator=options['ops'], mix=mix,
+                               seed=options['seed'], host=options['host'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            self._print_report(report)
+        if report['invariant_violations']:
+            raise CommandError(
+                f"Нарушены инварианты склада: {len(report['invariant_violations'])}")
+
+    def _print_report(self, report):
+        self.stdout.write(
+            f"Операторов: {report['operators']}, операций: {report['total_ops']}, "
+            f"время: {report['elapsed_s']} с, пропускная способность: {report['ops_per_sec']} оп/с")
+        for name, data in report['operations'].items():
+            outcomes = ', '.join(f'{k}={v}' for k, v in sorted(data['outcomes'].items()))
+            self.stdout.write(
+                f"  {name:<6} {data['count']:>6} оп {data['ops_per_sec']:>8} оп/с  "
+                f"p50={data['p50_ms']} p95={data['p95_ms']} p99={data['p99_ms']} мс  [{outcomes}]")
+            histogram = ' '.join(f'{k}:{v}' for k, v in data['histogram'].items() if v)
+            self.stdout.write(f'         {histogram}')
+        style = self.style.ERROR if report['lock_errors'] else self.style.SUCCESS
+        self.stdout.write(style(f"Ошибок блокировки (database is locked): {report['lock_errors']}"))
+        for message, count in report['exceptions'].items():
+            self.stdout.write(self.style.WARNING(f'  {count} x {message}'))
+        for violation in report['invariant_violations']:
+            self.stdout.write(self.style.ERROR(f'Нарушение: {violation}'))
+        if not report['invariant_violations']:
+            self.stdout.write(self.style.SUCCESS('Инварианты склада соблюдены'))
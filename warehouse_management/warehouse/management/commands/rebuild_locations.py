@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from warehouse import locations
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает свернутую вместимость рядов, зон и складов по стеллажам'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            aisles = locations.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Показатели пересчитаны, рядов: {aisles}'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from warehouse import stock
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает шардированные счетчики остатков по активным размещениям'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            products = stock.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Счетчики пересчитаны, товаров с остатком: {products}'))
@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from warehouse.models import Product
+from warehouse.thumbnails import generate, run_job
+
+
+class Command(BaseCommand):
+    help = 'Строит миниатюры для изображений товаров, у которых их еще нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Проверить все товары с изображениями, а не только без миниатюр')
+        parser.add_argument('--workers', type=int,
+                            default=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+                            help='Количество потоков обработки (1 - без пула)')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            products = products.filter(image_digest='')
+        ids = list(products.values_list('pk', flat=True))
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                digests = list(pool.map(run_job, ids))
+        else:
+            digests = [generate(pk) for pk in ids]
+        unique = len({digest for digest in digests if digest})
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано товаров: {len(ids)}, уникальных изображений: {unique}'))
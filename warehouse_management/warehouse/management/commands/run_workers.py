@@ -0,0 +1,59 @@
+import multiprocessing
+import signal
+import socket
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+def worker_main(name, stop, burst):
+    """Точка входа процесса-обработчика (годится и для fork, и для spawn)"""
+    # Ctrl+C получает вся группа процессов: текущую задачу обработчик
+    # доводит до конца, а останавливает его событие stop от родителя
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if not apps.ready:
+        django.setup()
+    from warehouse import jobs
+    jobs.work(name, stop=stop, burst=burst)
+
+
+class Command(BaseCommand):
+    help = 'Запускает N процессов-обработчиков очереди фоновых задач (warehouse.jobs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Количество процессов-обработчиков')
+        parser.add_argument('--burst', action='store_true',
+                            help='Завершиться, когда очередь опустеет (для cron)')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers должен быть не меньше 1')
+        # Соединения родителя не должны наследоваться дочерними процессами
+        connections.close_all()
+        stop = multiprocessing.Event()
+        host = socket.gethostname()
+        processes = []
+        for number in range(1, options['workers'] + 1):
+            name = f'{host}:{number}'
+            process = multiprocessing.Process(
+                target=worker_main, args=(name, stop, options['burst']), name=name)
+            process.start()
+            processes.append(process)
+            self.stdout.write(f'Обработчик {name} запущен (pid {process.pid})')
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            self.stdout.write('Остановка: обработчики завершают текущие задачи')
+            stop.set()
+            for process in processes:
+                process.join()
+        failed = [p.name for p in processes if p.exitcode]
+        if failed:
+            raise CommandError(f'Обработчики завершились с ошибкой: {", ".join(failed)}')
+        self.stdout.write(self.style.SUCCESS('Обработчики остановлены'))
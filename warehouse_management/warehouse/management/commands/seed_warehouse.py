@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.models import Product, Rack, Category
+from warehouse.seed import DEFAULT_SCALE, clear_warehouse, seed_warehouse
+
+
+class Command(BaseCommand):
+    help = 'Генерирует воспроизводимый синтетический склад заданного масштаба'
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_SCALE.items():
+            parser.add_argument(f'--{name}', type=int, default=default,
+                                help=f'Количество записей ({name}), по умолчанию {default}')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Зерно генератора случайных чисел')
+        parser.add_argument('--flush', action='store_true',
+                            help='Удалить существующие складские данные перед генерацией')
+
+    def handle(self, *args, **options):
+        scale = {name: options[name] for name in DEFAULT_SCALE}
+        if any(value < 0 for value in scale.values()):
+            raise CommandError('Количество записей не может быть отрицательным')
+        if scale['products'] and not scale['categories']:
+            raise CommandError('Для товаров нужна хотя бы одна категория')
+        if scale['batches'] and not scale['products']:
+            raise CommandError('Для партий нужен хотя бы один товар')
+        if scale['placements'] and not scale['racks']:
+            raise CommandError('Для размещений нужен хотя бы один стеллаж')
+
+        if options['flush']:
+            clear_warehouse()
+        elif Product.objects.exists() or Rack.objects.exists() or Category.objects.exists():
+            raise CommandError(
+                'База уже содержит складские данные. Используйте --flush, чтобы заменить их')
+
+        created = seed_warehouse(seed=options['seed'], **scale)
+        summary = ', '.join(f'{name}: {count}' for name, count in created.items())
+        self.stdout.write(self.style.SUCCESS(f'Склад сгенерирован ({summary})'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from warehouse import history
+
+
+class Command(BaseCommand):
+    help = ('Записывает снимок загрузки стеллажей и зон и сворачивает старые точки '
+            '(запускается из cron, например раз в час)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-downsample', action='store_true',
+                            help='Не сворачивать старые точки в среднесуточные')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            points = history.take()
+        message = f'Снимок записан, точек: {points}'
+        if not options['no_downsample']:
+            with transaction.atomic():
+                folded, expired = history.downsample()
+            message += f'; свернуто: {folded}, удалено устаревших: {expired}'
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,344 @@
+"""Метрики в формате Prometheus, корректно агрегируемые между процессами.
+
+Каждый процесс пишет свои значения в собственный файл, отображенный в память
+(``metrics_<pid>.db`` в METRICS_DIR). Эндпоинт /metrics читает все файлы и
+складывает значения, поэтому счетчики и гистограммы суммируются по всем
+воркерам, включая уже завершившиеся. Каталог METRICS_DIR нужно очищать при
+перезапуске сервиса.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum, F, FloatField
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .models import Batch, Placement, Rack, StockShard, Warehouse
+
+INITIAL_SIZE = 64 * 1024
+HEADER = struct.Struct('<Q')  # количество занятых байт
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SCAN_BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+
+# Имя семейства -> (тип, описание)
+FAMILIES = {
+    'warehouse_http_request_duration_seconds': (
+        'histogram', 'Длительность обработки запроса по маршрутам'),
+    'warehouse_http_request_db_seconds': (
+        'histogram', 'Суммарное время SQL-запросов за один HTTP-запрос'),
+    'warehouse_http_request_queries': (
+        'histogram', 'Количество SQL-запросов за один HTTP-запрос'),
+    'warehouse_placements_total': ('counter', 'Выполненные размещения товара'),
+    'warehouse_issues_total': ('counter', 'Выполненные выдачи товара'),
+    'warehouse_units_moved_total': ('counter', 'Перемещенные единицы товара'),
+    'warehouse_validation_failures_total': (
+        'counter', 'Отказы проверки в clean() складских форм'),
+    'warehouse_write_conflicts_total': (
+        'counter', 'Конфликты блокировок при записи (ожидание повтора или отказ)'),
+    'warehouse_scans_total': (
+        'counter', 'Принятые сканирования по действию и результату'),
+    'warehouse_scan_flush_size': (
+        'histogram', 'Количество сканирований в одной групповой фиксации'),
+    'warehouse_rack_utilization_ratio': (
+        'gauge', 'Общая загрузка активных стеллажей по объему (0..1)'),
+    'warehouse_open_batches': ('gauge', 'Партии, размещенные не полностью'),
+    'warehouse_stock_units': (
+        'gauge', 'Доступный остаток товара по счетчикам (за вычетом резервов)'),
+}
+
+
+def _sample_key(name, labels):
+    if not labels:
+        return name
+    rendered = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for key, value in sorted(labels.items()))
+    return f'{name}{{{rendered}}}'
+
+
+class MmapedDict:
+    """Словарь строка -> float в файле, отображенном в память.
+
+    Формат записи: длина ключа (uint32), ключ в UTF-8 с выравниванием до
+    8 байт, значение (double). Заголовок с количеством занятых байт
+    обновляется после записи, поэтому читатель видит только целые записи.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(INITIAL_SIZE)
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+        self._positions = {}
+        self._used = HEADER.unpack_from(self._mmap, 0)[0] or HEADER.size
+        for key, value, position in _read_entries(self._mmap, self._used):
+            self._positions[key] = position
+
+    def _grow(self, needed):
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        self._mmap.close()
+        self._file.truncate(capacity)
+        self._capacity = capacity
+        self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+
+    def _init_key(self, key):
+        encoded = key.encode('utf-8')
+        padded = encoded + b' ' * (8 - (len(encoded) + 4) % 8)
+        entry = struct.pack(f'<I{len(padded)}sd', len(encoded), padded, 0.0)
+        if self._used + len(entry) > self._capacity:
+            self._grow(self._used + len(entry))
+        self._mmap[self._used:self._used + len(entry)] = entry
+        self._positions[key] = self._used + len(entry) - 8
+        self._used += len(entry)
+        HEADER.pack_into(self._mmap, 0, self._used)
+
+    def add(self, key, amount):
+        if key not in self._positions:
+            self._init_key(key)
+        position = self._positions[key]
+        value = struct.unpack_from('<d', self._mmap, position)[0]
+        struct.pack_into('<d', self._mmap, position, value + amount)
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+def _read_entries(buffer, used):
+    position = HEADER.size
+    while position < used:
+        length = struct.unpack_from('<I', buffer, position)[0]
+        key_end = position + 4 + length
+        padded_end = key_end + (8 - (length + 4) % 8)
+        key = bytes(buffer[position + 4:key_end]).decode('utf-8')
+        value = struct.unpack_from('<d', buffer, padded_end)[0]
+        yield key, value, padded_end
+        position = padded_end + 8
+
+
+def read_file(path):
+    """Все значения из файла метрик другого процесса"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        return {}
+    used = HEADER.unpack_from(data, 0)[0]
+    return {key: value for key, value, _ in _read_entries(data, used)}
+
+
+class MetricsStore:
+    """Хранилище метрик текущего процесса (пересоздается после fork)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._values = None
+
+    def _get_values(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            directory = get_metrics_dir()
+            self._values = MmapedDict(directory / f'metrics_{pid}.db')
+            self._pid = pid
+        return self._values
+
+    def add(self, key, amount=1.0):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return
+        with self._lock:
+            self._get_values().add(key, amount)
+
+    def reset(self):
+        """Закрывает файл текущего процесса (используется в тестах)"""
+        with self._lock:
+            if self._values is not None:
+                self._values.close()
+            self._values = None
+            self._pid = None
+
+
+store = MetricsStore()
+
+
+def get_metrics_dir():
+    path = Path(getattr(settings, 'METRICS_DIR', settings.BASE_DIR / 'var' / 'metrics'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def inc(name, amount=1, **labels):
+    store.add(_sample_key(name, labels), amount)
+
+
+def observe(name, value, buckets, **labels):
+    """Наблюдение для гистограммы (кумулятивные корзины, _sum и _count)"""
+    for bound in buckets:
+        if value <= bound:
+            store.add(_sample_key(f'{name}_bucket', dict(labels, le=bound)))
+    store.add(_sample_key(f'{name}_bucket', dict(labels, le='+Inf')))
+    store.add(_sample_key(f'{name}_sum', labels), value)
+    store.add(_sample_key(f'{name}_count', labels))
+
+
+def _count_moves(name, direction, quantities):
+    inc(name, len(quantities))
+    inc('warehouse_units_moved_total', sum(quantities), direction=direction)
+
+
+def record_placements(quantities):
+    """Счетчики размещений; увеличиваются после фиксации транзакции операции"""
+    if quantities:
+        transaction.on_commit(lambda: _count_moves('warehouse_placements_total', 'in', quantities))
+
+
+def record_issues(quantities):
+    """Счетчики выдач; увеличиваются после фиксации транзакции операции"""
+    if quantities:
+        transaction.on_commit(lambda: _count_moves('warehouse_issues_total', 'out', quantities))
+
+
+def record_validation_failure(form_name):
+    inc('warehouse_validation_failures_total', form=form_name)
+
+
+def record_write_conflict():
+    inc('warehouse_write_conflicts_total')
+
+
+def record_scan_flush(results):
+    """results - [(действие, результат)] одной групповой фиксации сканирований"""
+    observe('warehouse_scan_flush_size', len(results), SCAN_BATCH_BUCKETS)
+    for action, result in results:
+        inc('warehouse_scans_total', action=action, result=result)
+
+
+def collect():
+    """Суммы значений по всем файлам процессов"""
+    totals = {}
+    for path in sorted(get_metrics_dir().glob('metrics_*.db')):
+        for key, value in read_file(path).items():
+            totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+def compute_gauges():
+    """Загрузка стеллажей, открытые партии и остаток, кешируются на METRICS_GAUGE_TTL секунд.
+
+    Загрузка читается из свернутых показателей складов (locations.py), и
+    только стеллажи вне иерархии считаются по своим размещениям. Открытые
+    партии - по счетчику Batch.units_placed, остаток - сумма шардов
+    счетчиков (stock.py), без чтения размещений.
+    """
+    def _compute():
+        rolled_up = Warehouse.objects.aggregate(
+            total=Sum('total_volume'), occupied=Sum('occupied_volume'))
+        unzoned = Rack.objects.filter(is_active=True, aisle__isnull=True)
+        total_volume = (rolled_up['total'] or 0) + (unzoned.aggregate(
+            total=Sum(F('length') * F('width') * F('height'), output_field=FloatField())
+        )['total'] or 0)
+        occupied = (rolled_up['occupied'] or 0) + (Placement.objects.filter(
+            is_active=True, rack__in=unzoned).aggregate(
+            total=Sum(F('quantity') * F('product__length') * F('product__width') *
+                      F('product__height'), output_field=FloatField())
+        )['total'] or 0)
+        open_batches = Batch.objects.filter(units_placed__lt=F('quantity')).count()
+        units = StockShard.objects.aggregate(total=Sum('quantity'))['total'] or 0
+        return {
+            'warehouse_rack_utilization_ratio': occupied / total_volume if total_volume else 0.0,
+            'warehouse_open_batches': float(open_batches),
+            'warehouse_stock_units': float(units),
+        }
+
+    ttl = getattr(settings, 'METRICS_GAUGE_TTL', 15)
+    return cache.get_or_set('warehouse:metrics:gauges', _compute, ttl)
+
+
+def _family(key):
+    name = key.split('{', 1)[0]
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in FAMILIES:
+            return name[:-len(suffix)]
+    return name
+
+
+def render():
+    """Текст в формате Prometheus exposition 0.0.4"""
+    samples = collect()
+    samples.update(compute_gauges())
+    by_family = {}
+    for key, value in samples.items():
+        by_family.setdefault(_family(key), []).append((key, value))
+
+    lines = []
+    for family in sorted(by_family):
+        kind, description = FAMILIES.get(family, ('untyped', ''))
+        lines.append(f'# HELP {family} {description}')
+        lines.append(f'# TYPE {family} {kind}')
+        for key, value in by_family[family]:
+            lines.append(f'{key} {value!r}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Эндпоинт /metrics, доступный только с адресов METRICS_ALLOWED_IPS"""
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden('Метрики доступны только локально')
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class MetricsMiddleware:
+    """Гистограммы длительности, времени БД и числа запросов по именам маршрутов.
+
+    Ставится перед QueryBudgetMiddleware и берет статистику SQL из
+    request.db_stats, которую та заполняет.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        return self.record_request(request, response, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        return self.record_request(request, response, time.perf_counter() - started)
+
+    def record_request(self, request, response, duration):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        if view == 'metrics':
+            return response
+        observe('warehouse_http_request_duration_seconds', duration, LATENCY_BUCKETS,
+                view=view, method=request.method)
+        db_stats = getattr(request, 'db_stats', None)
+        if db_stats is not None:
+            observe('warehouse_http_request_db_seconds', db_stats.duration,
+                    LATENCY_BUCKETS, view=view)
+            observe('warehouse_http_request_queries', db_stats.count,
+                    QUERY_BUCKETS, view=view)
+        return response
@@ -0,0 +1,141 @@
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('warehouse.queries')
+
+
+class QueryBudgetExceeded(Exception):
+    """Представление выполнило больше SQL-запросов, чем разрешено бюджетом"""
+
+
+class QueryRecorder:
+    """Собирает количество, время и отпечатки SQL-запросов (execute_wrapper)"""
+
+    def __init__(self, keep_queries=False):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        # Полный список запросов нужен только профилировщику
+        self.keep_queries = keep_queries
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.duration += elapsed
+            self.count += 1
+            # Параметры передаются отдельно, поэтому текст SQL уже является отпечатком
+            self.fingerprints[sql] += 1
+            if self.keep_queries:
+                self.queries.append({
+                    'alias': context['connection'].alias,
+                    'sql': sql,
+                    'params': None if many else params,
+                    'many': many,
+                    'time_ms': round(elapsed * 1000, 3),
+                })
+
+    def record(self):
+        """Контекстный менеджер, подключающий запись ко всем базам данных"""
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(self))
+        return stack
+
+    async def arecord(self):
+        """Подключает запись в async-запросе и возвращает корутину отключения.
+
+        Соединения с БД привязаны к потоку, а async ORM выполняет запросы в
+        потоке sync_to_async запроса, поэтому обертка ставится именно там.
+        """
+        stack = await sync_to_async(self.record)()
+        return sync_to_async(stack.close)
+
+    def duplicates(self, threshold=None):
+        """Отпечатки, повторившиеся threshold и более раз (признак N+1)"""
+        if threshold is None:
+            threshold = getattr(settings, 'QUERY_DUPLICATE_THRESHOLD', 3)
+        return {sql: n for sql, n in self.fingerprints.items() if n >= threshold}
+
+
+def get_query_budget(view_name):
+    """Бюджет запросов для представления из settings.QUERY_BUDGETS"""
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    return budgets.get(view_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', None))
+
+
+class QueryBudgetMiddleware:
+    """Измеряет SQL-нагрузку каждого запроса и проверяет бюджет представления"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+        return self.check_budget(request, response, recorder)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        stop = await recorder.arecord()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await stop()
+        return self.check_budget(request, response, recorder)
+
+    def check_budget(self, request, response, recorder):
+        # Статистику использует MetricsMiddleware
+        request.db_stats = recorder
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else None
+        duplicates = recorder.duplicates()
+        duplicate_count = sum(duplicates.values())
+        budget = get_query_budget(view_name)
+
+        response['X-DB-Queries'] = str(recorder.count)
+        response['X-DB-Time-Ms'] = f'{recorder.duration * 1000:.1f}'
+        response['X-DB-Duplicates'] = str(duplicate_count)
+        if budget is not None:
+            response['X-DB-Budget'] = str(budget)
+
+        logger.info(json.dumps({
+            'event': 'request_queries',
+            'view': view_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_time_ms': round(recorder.duration * 1000, 1),
+            'duplicates': duplicate_count,
+            'budget': budget,
+        }, ensure_ascii=False))
+
+        if budget is not None and recorder.count > budget:
+            message = (f'{view_name}: {recorder.count} SQL-запросов при бюджете {budget}; '
+                       f'повторы: {list(duplicates.values())}')
+            logger.warning(message)
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+
+        return response
+
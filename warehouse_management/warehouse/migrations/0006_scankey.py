@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0005_liveevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='Ключ')),
+                ('action', models.CharField(max_length=10, verbose_name='Действие')),
+                ('result', models.JSONField(default=dict, verbose_name='Результат')),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Ключ сканирования',
+                'verbose_name_plural': 'Ключи сканирований',
+            },
+        ),
+    ]
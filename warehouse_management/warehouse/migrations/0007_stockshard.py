@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-18 23:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_counters(apps, schema_editor):
+    """Начальные счетчики: весь остаток товара в шарде 0"""
+    Placement = apps.get_model('warehouse', 'Placement')
+    StockShard = apps.get_model('warehouse', 'StockShard')
+    totals = (Placement.objects.filter(is_active=True).values('product')
+              .annotate(total=Sum('quantity')).values_list('product', 'total'))
+    StockShard.objects.bulk_create(
+        [StockShard(product_id=product_id, shard=0, quantity=total)
+         for product_id, total in totals], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0006_scankey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Шард')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Количество')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_shards', to='warehouse.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Шард остатка',
+                'verbose_name_plural': 'Шарды остатков',
+                'constraints': [models.UniqueConstraint(fields=('product', 'shard'), name='unique_stock_shard')],
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0007_stockshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('order', models.CharField(max_length=100, verbose_name='Заказ')),
+                ('operator', models.CharField(max_length=100, verbose_name='Оператор')),
+                ('status', models.CharField(choices=[('active', 'Действует'), ('fulfilled', 'Выдан'), ('released', 'Снят'), ('expired', 'Истек')], default='active', max_length=10, verbose_name='Статус')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Создан')),
+                ('expires_at', models.DateTimeField(verbose_name='Действует до')),
+                ('batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='warehouse.batch', verbose_name='Партия')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='warehouse.product', verbose_name='Товар')),
+                ('rack', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='warehouse.rack', verbose_name='Стелаж')),
+            ],
+            options={
+                'verbose_name': 'Резерв',
+                'verbose_name_plural': 'Резервы',
+                'ordering': ['expires_at'],
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='reservation_expiry_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0009_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='expiry_date',
+            field=models.DateField(blank=True, help_text='Для скоропортящихся товаров', null=True, verbose_name='Годен до'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='issue_strategy',
+            field=models.CharField(choices=[('fifo', 'FIFO - первым пришел, первым ушел'), ('fefo', 'FEFO - первым истекает, первым ушел'), ('lifo', 'LIFO - последним пришел, первым ушел')], default='fifo', max_length=4, verbose_name='Порядок выдачи'),
+        ),
+        migrations.AddField(
+            model_name='placement',
+            name='expiry_date',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Годен до'),
+        ),
+        migrations.AddIndex(
+            model_name='placement',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['product', 'expiry_date', 'date_placed'], name='placement_issue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='placement',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['expiry_date'], name='placement_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0010_batch_expiry_issue_strategy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Aisle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('racks_count', models.PositiveIntegerField(default=0, editable=False, verbose_name='Стеллажей')),
+                ('total_volume', models.FloatField(default=0, editable=False, verbose_name='Объем')),
+                ('occupied_volume', models.FloatField(default=0, editable=False, verbose_name='Занятый объем')),
+                ('total_load', models.FloatField(default=0, editable=False, verbose_name='Допустимая нагрузка')),
+                ('occupied_weight', models.FloatField(default=0, editable=False, verbose_name='Занятый вес')),
+                ('max_free_volume', models.FloatField(default=0, editable=False)),
+                ('max_free_weight', models.FloatField(default=0, editable=False)),
+                ('max_length', models.FloatField(default=0, editable=False)),
+                ('max_width', models.FloatField(default=0, editable=False)),
+                ('max_height', models.FloatField(default=0, editable=False)),
+                ('name', models.CharField(max_length=50, verbose_name='Название')),
+            ],
+            options={
+                'verbose_name': 'Ряд',
+                'verbose_name_plural': 'Ряды',
+                'ordering': ['zone', 'name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Warehouse',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('racks_count', models.PositiveIntegerField(default=0, editable=False, verbose_name='Стеллажей')),
+                ('total_volume', models.FloatField(default=0, editable=False, verbose_name='Объем')),
+                ('occupied_volume', models.FloatField(default=0, editable=False, verbose_name='Занятый объем')),
+                ('total_load', models.FloatField(default=0, editable=False, verbose_name='Допустимая нагрузка')),
+                ('occupied_weight', models.FloatField(default=0, editable=False, verbose_name='Занятый вес')),
+                ('max_free_volume', models.FloatField(default=0, editable=False)),
+                ('max_free_weight', models.FloatField(default=0, editable=False)),
+                ('max_length', models.FloatField(default=0, editable=False)),
+                ('max_width', models.FloatField(default=0, editable=False)),
+                ('max_height', models.FloatField(default=0, editable=False)),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Название')),
+                ('address', models.CharField(blank=True, max_length=255, verbose_name='Адрес')),
+            ],
+            options={
+                'verbose_name': 'Склад',
+                'verbose_name_plural': 'Склады',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='rack',
+            name='aisle',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='racks', to='warehouse.aisle', verbose_name='Ряд'),
+        ),
+        migrations.CreateModel(
+            name='Zone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('racks_count', models.PositiveIntegerField(default=0, editable=False, verbose_name='Стеллажей')),
+                ('total_volume', models.FloatField(default=0, editable=False, verbose_name='Объем')),
+                ('occupied_volume', models.FloatField(default=0, editable=False, verbose_name='Занятый объем')),
+                ('total_load', models.FloatField(default=0, editable=False, verbose_name='Допустимая нагрузка')),
+                ('occupied_weight', models.FloatField(default=0, editable=False, verbose_name='Занятый вес')),
+                ('max_free_volume', models.FloatField(default=0, editable=False)),
+                ('max_free_weight', models.FloatField(default=0, editable=False)),
+                ('max_length', models.FloatField(default=0, editable=False)),
+                ('max_width', models.FloatField(default=0, editable=False)),
+                ('max_height', models.FloatField(default=0, editable=False)),
+                ('name', models.CharField(max_length=50, verbose_name='Название')),
+                ('warehouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='zones', to='warehouse.warehouse', verbose_name='Склад')),
+            ],
+            options={
+                'verbose_name': 'Зона',
+                'verbose_name_plural': 'Зоны',
+                'ordering': ['warehouse', 'name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='aisle',
+            name='zone',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aisles', to='warehouse.zone', verbose_name='Зона'),
+        ),
+        migrations.AddConstraint(
+            model_name='zone',
+            constraint=models.UniqueConstraint(fields=('warehouse', 'name'), name='unique_zone_name'),
+        ),
+        migrations.AddConstraint(
+            model_name='aisle',
+            constraint=models.UniqueConstraint(fields=('zone', 'name'), name='unique_aisle_name'),
+        ),
+    ]
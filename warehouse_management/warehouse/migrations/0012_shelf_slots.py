@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0011_warehouse_zone_aisle'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Shelf',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveSmallIntegerField(help_text='1 - нижняя полка', verbose_name='Ярус')),
+                ('height', models.FloatField(help_text='Высота проема в см', verbose_name='Высота')),
+                ('slots', models.PositiveSmallIntegerField(verbose_name='Ячеек')),
+                ('occupancy', models.BinaryField(default=b'', verbose_name='Занятость')),
+                ('rack', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shelves', to='warehouse.rack', verbose_name='Стеллаж')),
+            ],
+            options={
+                'verbose_name': 'Полка',
+                'verbose_name_plural': 'Полки',
+                'ordering': ['rack', 'level'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shelf',
+            constraint=models.UniqueConstraint(fields=('rack', 'level'), name='unique_shelf_level'),
+        ),
+        migrations.AddField(
+            model_name='placement',
+            name='shelf',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='placements', to='warehouse.shelf', verbose_name='Полка'),
+        ),
+        migrations.AddField(
+            model_name='placement',
+            name='first_slot',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, verbose_name='Первая ячейка'),
+        ),
+        migrations.AddField(
+            model_name='placement',
+            name='slot_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Ячеек'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 00:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0012_shelf_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UtilizationSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(verbose_name='Время')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Стеллаж'), (2, 'Зона')], verbose_name='Уровень')),
+                ('object_id', models.PositiveIntegerField(verbose_name='Стеллаж или зона')),
+                ('resolution', models.PositiveSmallIntegerField(choices=[(0, 'Снимок'), (1, 'Среднее за день')], default=0, verbose_name='Точность')),
+                ('utilization', models.FloatField(verbose_name='Загрузка по объему, %')),
+                ('weight', models.FloatField(verbose_name='Занятый вес, кг')),
+                ('sku_count', models.PositiveIntegerField(verbose_name='Артикулов')),
+            ],
+            options={
+                'verbose_name': 'Снимок загрузки',
+                'verbose_name_plural': 'Снимки загрузки',
+                'indexes': [models.Index(fields=['kind', 'object_id', 'taken_at'], name='snapshot_series_idx'), models.Index(fields=['resolution', 'taken_at'], name='snapshot_age_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0013_utilization_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='placement',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['product', 'date_placed'], name='placement_arrival_idx'),
+        ),
+    ]
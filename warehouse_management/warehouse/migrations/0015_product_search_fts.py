@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:25
+
+from django.db import migrations
+
+
+class SQLiteRunSQL(migrations.RunSQL):
+    """RunSQL только для SQLite: на других СУБД поиск работает через LIKE"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+# Базы, созданные до этой миграции, уже содержат индекс (его создавал
+# обработчик post_migrate), поэтому все выражения идемпотентны, а
+# заполняется только пустой индекс
+FORWARD_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS warehouse_product_fts USING fts5(
+        name, sku, category, tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS warehouse_product_fts_ai AFTER INSERT ON warehouse_product BEGIN
+        INSERT INTO warehouse_product_fts(rowid, name, sku, category)
+        VALUES (new.id, new.name, new.sku,
+                (SELECT name FROM warehouse_category WHERE id = new.category_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS warehouse_product_fts_au AFTER UPDATE OF name, sku, category_id ON warehouse_product BEGIN
+        DELETE FROM warehouse_product_fts WHERE rowid = old.id;
+        INSERT INTO warehouse_product_fts(rowid, name, sku, category)
+        VALUES (new.id, new.name, new.sku,
+                (SELECT name FROM warehouse_category WHERE id = new.category_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS warehouse_product_fts_ad AFTER DELETE ON warehouse_product BEGIN
+        DELETE FROM warehouse_product_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS warehouse_product_fts_category_au AFTER UPDATE OF name ON warehouse_category BEGIN
+        UPDATE warehouse_product_fts SET category = new.name
+        WHERE rowid IN (SELECT id FROM warehouse_product WHERE category_id = new.id);
+    END""",
+    """INSERT INTO warehouse_product_fts(rowid, name, sku, category)
+        SELECT p.id, p.name, p.sku, c.name
+        FROM warehouse_product p JOIN warehouse_category c ON c.id = p.category_id
+        WHERE NOT EXISTS (SELECT 1 FROM warehouse_product_fts)""",
+]
+
+REVERSE_SQL = [
+    'DROP TRIGGER IF EXISTS warehouse_product_fts_category_au',
+    'DROP TRIGGER IF EXISTS warehouse_product_fts_ad',
+    'DROP TRIGGER IF EXISTS warehouse_product_fts_au',
+    'DROP TRIGGER IF EXISTS warehouse_product_fts_ai',
+    'DROP TABLE IF EXISTS warehouse_product_fts',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0014_placement_arrival_idx'),
+    ]
+
+    operations = [
+        SQLiteRunSQL(FORWARD_SQL, REVERSE_SQL),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:12
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_placed(apps, schema_editor):
+    """Начальные значения - сумма размещений партии, как в прежней метрике открытых партий"""
+    Batch = apps.get_model('warehouse', 'Batch')
+    Placement = apps.get_model('warehouse', 'Placement')
+    totals = (Placement.objects.order_by().values('batch')
+              .annotate(total=Sum('quantity')).values_list('batch', 'total'))
+    batches = [Batch(pk=batch_id, units_placed=total) for batch_id, total in totals]
+    Batch.objects.bulk_update(batches, ['units_placed'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0015_product_search_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batch',
+            name='units_placed',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Размещено'),
+        ),
+        migrations.RunPython(fill_placed, migrations.RunPython.noop),
+    ]
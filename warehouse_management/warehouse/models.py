@@ -2,14 +2,27 @@
 from django.db import models
 from django.utils import timezone
 from django.core.exceptions import ValidationError
-from django.db.models import Sum, Q
+from django.db.models import Sum, Q, F, FloatField
 
 
 class Category(models.Model):
+    # Порядок, в котором выдача списывает размещения товаров категории
+    FIFO = 'fifo'
+    FEFO = 'fefo'
+    LIFO = 'lifo'
+    ISSUE_STRATEGY_CHOICES = [
+        (FIFO, 'FIFO - первым пришел, первым ушел'),
+        (FEFO, 'FEFO - первым истекает, первым ушел'),
+        (LIFO, 'LIFO - последним пришел, первым ушел'),
+    ]
+
     name = models.CharField(max_length=100, unique=True,
                             verbose_name='Название')
     description = models.TextField(
         blank=True, null=True, verbose_name='Название')
+    issue_strategy = models.CharField(
+        max_length=4, choices=ISSUE_STRATEGY_CHOICES, default=FIFO,
+        verbose_name='Порядок выдачи')
 
     class Meta:
         verbose_name = 'Категория'
@@ -31,11 +44,21 @@ class Product(models.Model):
     weight = models.FloatField(help_text="Вес в кг", verbose_name='Вес')
     image = models.ImageField(
         upload_to='products/', blank=True, null=True, verbose_name='Изображение товара')
+    # SHA-256 оригинала; заполняется, когда миниатюры построены (см. thumbnails.py)
+    image_digest = models.CharField(max_length=64, blank=True, default='', editable=False,
+                                    verbose_name='Дайджест изображения')
 
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
         ordering = ['name']
+        indexes = [
+            # Каталог: сортировка и keyset-пагинация по (name, id), в том числе внутри категории
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            models.Index(fields=['category', 'name', 'id'], name='product_category_name_idx'),
+            # Фильтр по габаритам: диапазон по длине, ширина и высота проверяются по индексу
+            models.Index(fields=['length', 'width', 'height'], name='product_dimensions_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.sku})"
@@ -43,11 +66,131 @@ class Product(models.Model):
     def get_volume(self):
         return self.length * self.width * self.height
 
-    def image_url(self):
+    def image_url(self, variant='list', fmt='webp'):
+        """Миниатюра нужного размера, пока ее нет - оригинал"""
         if self.image and hasattr(self.image, 'url'):
+            if self.image_digest:
+                from .thumbnails import variant_url
+                return variant_url(self.image_digest, variant, fmt)
             return self.image.url
         return '/static/images/default-product.png'
 
+    def image_urls(self):
+        """URL всех вариантов для шаблонов: product.image_urls.card"""
+        from .thumbnails import get_sizes
+        return {variant: self.image_url(variant) for variant in get_sizes()}
+
+
+class CapacityNodeQuerySet(models.QuerySet):
+    def fitting(self, product):
+        """Уровни, где хотя бы один стеллаж может принять единицу товара.
+
+        Условие необходимое, но не достаточное: наибольшие габариты и
+        свободное место могут принадлежать разным стеллажам уровня.
+        """
+        return self.filter(
+            max_length__gte=product.length, max_width__gte=product.width,
+            max_height__gte=product.height, max_free_volume__gte=product.get_volume(),
+            max_free_weight__gte=product.weight)
+
+
+class CapacityNode(models.Model):
+    """Уровень иерархии склада со свернутой вместимостью активных стеллажей.
+
+    Поля пересчитываются из стеллажей (locations.py) при складских
+    операциях, поэтому вопросы о вместимости уровня не читают стеллажи.
+    """
+    racks_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Стеллажей')
+    total_volume = models.FloatField(default=0, editable=False, verbose_name='Объем')
+    occupied_volume = models.FloatField(default=0, editable=False, verbose_name='Занятый объем')
+    total_load = models.FloatField(default=0, editable=False, verbose_name='Допустимая нагрузка')
+    occupied_weight = models.FloatField(default=0, editable=False, verbose_name='Занятый вес')
+    # Наибольшие свободные объем и нагрузка одного стеллажа и наибольшие
+    # габариты стеллажа: по ним отсекаются уровни, куда товар не поместится
+    max_free_volume = models.FloatField(default=0, editable=False)
+    max_free_weight = models.FloatField(default=0, editable=False)
+    max_length = models.FloatField(default=0, editable=False)
+    max_width = models.FloatField(default=0, editable=False)
+    max_height = models.FloatField(default=0, editable=False)
+
+    objects = CapacityNodeQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def free_volume(self):
+        return self.total_volume - self.occupied_volume
+
+    def free_weight(self):
+        return self.total_load - self.occupied_weight
+
+    def get_utilization_percent(self):
+        if not self.total_volume:
+            return 0
+        return round(self.occupied_volume / self.total_volume * 100, 1)
+
+
+class Warehouse(CapacityNode):
+    name = models.CharField(max_length=100, unique=True, verbose_name='Название')
+    address = models.CharField(max_length=255, blank=True, verbose_name='Адрес')
+
+    class Meta:
+        verbose_name = 'Склад'
+        verbose_name_plural = 'Склады'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class Zone(CapacityNode):
+    warehouse = models.ForeignKey(
+        Warehouse, on_delete=models.CASCADE, related_name='zones', verbose_name='Склад')
+    name = models.CharField(max_length=50, verbose_name='Название')
+
+    class Meta:
+        verbose_name = 'Зона'
+        verbose_name_plural = 'Зоны'
+        ordering = ['warehouse', 'name']
+        constraints = [
+            models.UniqueConstraint(fields=['warehouse', 'name'], name='unique_zone_name'),
+        ]
+
+    def __str__(self):
+        return f"{self.warehouse.name} / {self.name}"
+
+
+class Aisle(CapacityNode):
+    zone = models.ForeignKey(
+        Zone, on_delete=models.CASCADE, related_name='aisles', verbose_name='Зона')
+    name = models.CharField(max_length=50, verbose_name='Название')
+
+    class Meta:
+        verbose_name = 'Ряд'
+        verbose_name_plural = 'Ряды'
+        ordering = ['zone', 'name']
+        constraints = [
+            models.UniqueConstraint(fields=['zone', 'name'], name='unique_aisle_name'),
+        ]
+
+    def __str__(self):
+        return f"{self.zone} / {self.name}"
+
+
+class RackQuerySet(models.QuerySet):
+    def with_occupancy(self):
+        """Аннотирует занятые объем и вес одним запросом (без N+1 в списках)"""
+        active = Q(placements__is_active=True)
+        return self.annotate(
+            occupied_volume_sum=Sum(
+                F('placements__quantity') * F('placements__product__length') *
+                F('placements__product__width') * F('placements__product__height'),
+                filter=active, output_field=FloatField()),
+            occupied_weight_sum=Sum(
+                F('placements__quantity') * F('placements__product__weight'),
+                filter=active, output_field=FloatField()),
+        )
+
 
 class Rack(models.Model):
     name = models.CharField(max_length=50, unique=True,
@@ -58,6 +201,12 @@ class Rack(models.Model):
     width = models.FloatField(help_text="Ширина в см", verbose_name='Ширина')
     height = models.FloatField(help_text="Высота в см", verbose_name='Высота')
     is_active = models.BooleanField(default=True, verbose_name='Активен')
+    # Место в иерархии склад - зона - ряд; стеллажи без ряда остаются вне иерархии
+    aisle = models.ForeignKey(
+        Aisle, on_delete=models.SET_NULL, null=True, blank=True, related_name='racks',
+        verbose_name='Ряд')
+
+    objects = RackQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Стелаж'
@@ -84,6 +233,8 @@ class Rack(models.Model):
 
     def available_volume(self):
         """Расчет свободного объема на стеллаже"""
+        if hasattr(self, 'occupied_volume_sum'):
+            return self.volume - (self.occupied_volume_sum or 0)
         occupied_volume = sum(
             placement.quantity * placement.product.get_volume()
             for placement in self.placements.filter(is_active=True)
@@ -92,6 +243,8 @@ class Rack(models.Model):
 
     def available_weight(self):
         """Расчет доступной нагрузки на стеллаже"""
+        if hasattr(self, 'occupied_weight_sum'):
+            return self.max_load - (self.occupied_weight_sum or 0)
         occupied_weight = sum(
             placement.quantity * placement.product.weight
             for placement in self.placements.filter(is_active=True)
@@ -106,6 +259,56 @@ class Rack(models.Model):
         return round((occupied_volume / self.volume) * 100, 1)
 
 
+class Shelf(models.Model):
+    """Полка стеллажа, разбитая по длине на одинаковые ячейки.
+
+    Занятость ячеек хранится битовой картой (бит i - ячейка i) и
+    пересчитывается из размещений, которые ее занимают (см. slots.py).
+    """
+    rack = models.ForeignKey(
+        Rack, on_delete=models.CASCADE, related_name='shelves', verbose_name='Стеллаж')
+    level = models.PositiveSmallIntegerField(verbose_name='Ярус', help_text="1 - нижняя полка")
+    height = models.FloatField(help_text="Высота проема в см", verbose_name='Высота')
+    slots = models.PositiveSmallIntegerField(verbose_name='Ячеек')
+    occupancy = models.BinaryField(default=b'', editable=False, verbose_name='Занятость')
+
+    class Meta:
+        verbose_name = 'Полка'
+        verbose_name_plural = 'Полки'
+        ordering = ['rack', 'level']
+        constraints = [
+            models.UniqueConstraint(fields=['rack', 'level'], name='unique_shelf_level'),
+        ]
+
+    def __str__(self):
+        return f"{self.rack.name}, ярус {self.level}"
+
+    def clean(self):
+        errors = {}
+        if self.slots is not None and self.slots < 1:
+            errors['slots'] = 'На полке должна быть хотя бы одна ячейка'
+        if self.height is not None and self.height <= 0:
+            errors['height'] = 'Высота проема должна быть больше нуля'
+        if errors:
+            raise ValidationError(errors)
+
+    @property
+    def bits(self):
+        return int.from_bytes(self.occupancy, 'little')
+
+    def occupied_slots(self):
+        return self.bits.bit_count()
+
+    def free_slots(self):
+        return self.slots - self.occupied_slots()
+
+
+class BatchQuerySet(models.QuerySet):
+    def with_placement_totals(self):
+        """Аннотирует суммарно размещенное количество для списков партий"""
+        return self.annotate(placed_total=Sum('placement__quantity'))
+
+
 class Batch(models.Model):
     product = models.ForeignKey(
         Product, on_delete=models.CASCADE, verbose_name='Товар')
@@ -114,6 +317,14 @@ class Batch(models.Model):
         default=timezone.now, verbose_name='Дата привоза')
     supplier = models.CharField(max_length=200, verbose_name='Поставщик')
     notes = models.TextField(blank=True, null=True)
+    expiry_date = models.DateField(
+        null=True, blank=True, help_text="Для скоропортящихся товаров", verbose_name='Годен до')
+    # Сколько всего размещено из партии; ведет services.place_many, выдача не уменьшает.
+    # Метрика открытых партий считается по нему без агрегата по размещениям
+    units_placed = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Размещено')
+
+    objects = BatchQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Партия'
@@ -123,10 +334,20 @@ class Batch(models.Model):
     def __str__(self):
         return f"Партия {self.product.name} x {self.quantity} от {self.arrival_date.date()}"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if not adding:
+            # Размещения хранят копию срока годности (Placement.expiry_date)
+            self.placement_set.update(expiry_date=self.expiry_date)
+
     def get_initial_remaining(self):
         """Возвращает количество товара из партии, которое еще не было размещено изначально"""
-        total_placed = self.placement_set.aggregate(
-            total=Sum('quantity'))['total'] or 0
+        if hasattr(self, 'placed_total'):
+            total_placed = self.placed_total or 0
+        else:
+            total_placed = self.placement_set.aggregate(
+                total=Sum('quantity'))['total'] or 0
         return max(0, self.quantity - total_placed)
 
     def get_actual_remaining(self):
@@ -169,15 +390,52 @@ class Placement(models.Model):
         default=timezone.now, verbose_name='Дата размещения')
     # Активное размещение или нет (если товар был выдан)
     is_active = models.BooleanField(default=True, verbose_name='Активен')
+    # Копия Batch.expiry_date: порядок FEFO и отчет по срокам годности
+    # читаются по индексам размещений без соединения с партиями
+    expiry_date = models.DateField(
+        null=True, blank=True, editable=False, verbose_name='Годен до')
+    # Непрерывный участок ячеек полки, если включено размещение по ячейкам
+    shelf = models.ForeignKey(
+        Shelf, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+        related_name='placements', verbose_name='Полка')
+    first_slot = models.PositiveSmallIntegerField(
+        null=True, blank=True, editable=False, verbose_name='Первая ячейка')
+    slot_count = models.PositiveSmallIntegerField(
+        default=0, editable=False, verbose_name='Ячеек')
 
     class Meta:
         verbose_name = 'Размещение'
         verbose_name_plural = 'Размещения'
         ordering = ['-date_placed']
+        # Частичные индексы по активным размещениям: Django записывает фильтр
+        # is_active=True как WHERE "is_active", и обычный индекс с этим столбцом
+        # не подошел бы для равенства; выданные размещения в индексы не попадают
+        indexes = [
+            # Выбор следующих размещений товара при выдаче (services.active_placements)
+            models.Index(fields=['product', 'expiry_date', 'date_placed'],
+                         condition=Q(is_active=True), name='placement_issue_idx'),
+            # То же для FIFO и LIFO: порядок по дате размещения без сортировки
+            models.Index(fields=['product', 'date_placed'],
+                         condition=Q(is_active=True), name='placement_arrival_idx'),
+            # Отчет об истекающих сроках: диапазон по сроку среди активных
+            models.Index(fields=['expiry_date'], condition=Q(is_active=True),
+                         name='placement_expiry_idx'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} x {self.quantity} на {self.rack.name}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.batch_id is not None and self.expiry_date is None:
+            self.expiry_date = self.batch.expiry_date
+        super().save(*args, **kwargs)
+
+    def days_left(self, today=None):
+        """Дней до конца срока годности (отрицательное - просрочено) или None"""
+        if self.expiry_date is None:
+            return None
+        return (self.expiry_date - (today or timezone.localdate())).days
+
 
 class WarehouseJournal(models.Model):
     OPERATION_CHOICES = [
@@ -206,3 +464,194 @@ class WarehouseJournal(models.Model):
         ordering = ['-operation_date']
         verbose_name = 'Операция'
         verbose_name_plural = 'Операции'
+
+
+class LiveEvent(models.Model):
+    """Событие живых обновлений для бэкенда LIVE_EVENTS_BACKEND='db'"""
+    kind = models.CharField(max_length=32, verbose_name='Тип события')
+    payload = models.JSONField(default=dict, verbose_name='Данные')
+    created = models.DateTimeField(
+        default=timezone.now, db_index=True, verbose_name='Создано')
+
+    class Meta:
+        ordering = ['pk']
+        verbose_name = 'Живое событие'
+        verbose_name_plural = 'Живые события'
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk}"
+
+
+class ScanKey(models.Model):
+    """Ключ идемпотентности сканирования и сохраненный результат его обработки"""
+    key = models.CharField(max_length=64, unique=True, verbose_name='Ключ')
+    action = models.CharField(max_length=10, verbose_name='Действие')
+    result = models.JSONField(default=dict, verbose_name='Результат')
+    created = models.DateTimeField(
+        default=timezone.now, db_index=True, verbose_name='Создано')
+
+    class Meta:
+        verbose_name = 'Ключ сканирования'
+        verbose_name_plural = 'Ключи сканирований'
+
+    def __str__(self):
+        return f"{self.action} {self.key}"
+
+
+class StockShard(models.Model):
+    """Доля остатка товара; остаток товара равен сумме его шардов (см. stock.py)"""
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='stock_shards', verbose_name='Товар')
+    shard = models.PositiveSmallIntegerField(verbose_name='Шард')
+    quantity = models.IntegerField(default=0, verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Шард остатка'
+        verbose_name_plural = 'Шарды остатков'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='unique_stock_shard'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}/{self.shard}: {self.quantity}"
+
+
+class Reservation(models.Model):
+    """Резерв товара под заказ до истечения срока.
+
+    Зарезервированное количество сразу вычитается из счетчиков остатков
+    (stock.py), поэтому доступный к выдаче остаток не требует агрегата
+    по резервам. Привязка к партии или стеллажу задает, откуда отбирать
+    товар при выдаче по резерву.
+    """
+    ACTIVE = 'active'
+    FULFILLED = 'fulfilled'
+    RELEASED = 'released'
+    EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (ACTIVE, 'Действует'),
+        (FULFILLED, 'Выдан'),
+        (RELEASED, 'Снят'),
+        (EXPIRED, 'Истек'),
+    ]
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='reservations', verbose_name='Товар')
+    batch = models.ForeignKey(
+        Batch, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Партия')
+    rack = models.ForeignKey(
+        Rack, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Стелаж')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    order = models.CharField(max_length=100, verbose_name='Заказ')
+    operator = models.CharField(max_length=100, verbose_name='Оператор')
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=ACTIVE, verbose_name='Статус')
+    created = models.DateTimeField(default=timezone.now, verbose_name='Создан')
+    expires_at = models.DateTimeField(verbose_name='Действует до')
+
+    class Meta:
+        ordering = ['expires_at']
+        verbose_name = 'Резерв'
+        verbose_name_plural = 'Резервы'
+        indexes = [
+            # Выборка истекших резервов (reservations.expire) читает только индекс
+            models.Index(fields=['status', 'expires_at'], name='reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.order}: {self.product.name} x {self.quantity}"
+
+    def is_pinned(self):
+        return self.batch_id is not None or self.rack_id is not None
+
+    def matches(self, placement):
+        """Размещение подходит под привязку резерва к партии и стеллажу"""
+        return ((self.batch_id is None or placement.batch_id == self.batch_id) and
+                (self.rack_id is None or placement.rack_id == self.rack_id))
+
+
+class Job(models.Model):
+    """Фоновая задача очереди warehouse.jobs, выполняемая командой run_workers"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    kind = models.CharField(max_length=50, verbose_name='Тип')
+    payload = models.JSONField(default=dict, blank=True, verbose_name='Параметры')
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=QUEUED, verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    max_attempts = models.PositiveSmallIntegerField(default=3, verbose_name='Максимум попыток')
+    run_after = models.DateTimeField(default=timezone.now, verbose_name='Не раньше')
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name='Прогресс, %')
+    message = models.CharField(max_length=200, blank=True, verbose_name='Сообщение')
+    result = models.JSONField(null=True, blank=True, verbose_name='Результат')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    worker = models.CharField(max_length=100, blank=True, verbose_name='Обработчик')
+    created_by = models.CharField(max_length=150, blank=True, verbose_name='Кто поставил')
+    created = models.DateTimeField(default=timezone.now, verbose_name='Создана')
+    started = models.DateTimeField(null=True, blank=True, verbose_name='Начата')
+    finished = models.DateTimeField(null=True, blank=True, verbose_name='Завершена')
+    heartbeat = models.DateTimeField(null=True, blank=True, verbose_name='Последний отклик')
+
+    class Meta:
+        ordering = ['-created']
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            # Выбор следующей задачи (jobs.claim) и поиск зависших (jobs.requeue_stale)
+            models.Index(fields=['status', 'run_after'], name='job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class UtilizationSnapshot(models.Model):
+    """Точка истории загрузки стеллажа или зоны (warehouse.history).
+
+    Без внешних ключей: строка остается компактной, а история переживает
+    удаление стеллажа. Сырые точки старше SNAPSHOT_RAW_DAYS сворачиваются
+    в среднесуточные (resolution=DAILY).
+    """
+    RACK = 1
+    ZONE = 2
+    KIND_CHOICES = [
+        (RACK, 'Стеллаж'),
+        (ZONE, 'Зона'),
+    ]
+    RAW = 0
+    DAILY = 1
+    RESOLUTION_CHOICES = [
+        (RAW, 'Снимок'),
+        (DAILY, 'Среднее за день'),
+    ]
+
+    taken_at = models.DateTimeField(verbose_name='Время')
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES, verbose_name='Уровень')
+    object_id = models.PositiveIntegerField(verbose_name='Стеллаж или зона')
+    resolution = models.PositiveSmallIntegerField(
+        choices=RESOLUTION_CHOICES, default=RAW, verbose_name='Точность')
+    utilization = models.FloatField(verbose_name='Загрузка по объему, %')
+    weight = models.FloatField(verbose_name='Занятый вес, кг')
+    sku_count = models.PositiveIntegerField(verbose_name='Артикулов')
+
+    class Meta:
+        verbose_name = 'Снимок загрузки'
+        verbose_name_plural = 'Снимки загрузки'
+        indexes = [
+            # Ряд точек одного стеллажа или зоны за период (графики, JSON)
+            models.Index(fields=['kind', 'object_id', 'taken_at'], name='snapshot_series_idx'),
+            # Выбор сырых точек для свертки (history.downsample)
+            models.Index(fields=['resolution', 'taken_at'], name='snapshot_age_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.object_id}: {self.utilization}% ({self.taken_at})"
@@ -0,0 +1,123 @@
+"""Keyset-пагинация: страницы по курсору без OFFSET и COUNT(*) по всей таблице.
+
+Курсор - значения полей сортировки последней (или первой) строки страницы,
+закодированные в URL-безопасную строку. Следующая страница выбирается
+условием ``(name, id) > (:name, :id)``, которое обслуживается индексом, поэтому
+стоимость страницы не зависит от ее номера и размера каталога.
+"""
+import base64
+import json
+
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Q
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Значения курсора или None, если курсор поврежден"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def _after(fields, values, reverse=False):
+    """Условие "строка после курсора" для лексикографического порядка полей"""
+    lookup = 'lt' if reverse else 'gt'
+    condition = Q()
+    for index, field in enumerate(fields):
+        step = Q(**{f'{field}__{lookup}': values[index]})
+        for prev_field, prev_value in zip(fields[:index], values[:index]):
+            step &= Q(**{prev_field: prev_value})
+        condition |= step
+    # Условие на первое поле отдельно, чтобы СУБД начала поиск по индексу с курсора
+    return Q(**{f'{fields[0]}__{lookup}e': values[0]}) & condition
+
+
+class KeysetPage:
+    """Страница keyset-пагинации с курсорами соседних страниц"""
+
+    def __init__(self, object_list, fields, has_next, has_previous):
+        self.object_list = object_list
+        self.fields = fields
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def _cursor(self, obj):
+        return encode_cursor([getattr(obj, field) for field in self.fields])
+
+    def next_cursor(self):
+        return self._cursor(self.object_list[-1]) if self._has_next else None
+
+    def previous_cursor(self):
+        return self._cursor(self.object_list[0]) if self._has_previous else None
+
+
+def paginate_keyset(queryset, fields, per_page, after=None, before=None):
+    """Страница queryset, упорядоченного по fields (последнее поле уникально).
+
+    after - курсор, после которого начинается страница (переход вперед),
+    before - курсор, перед которым она заканчивается (переход назад).
+    Выбирается per_page + 1 строк: лишняя строка показывает, есть ли еще страница.
+    """
+    fields = list(fields)
+    after_values = decode_cursor(after, len(fields)) if after else None
+    before_values = None if after_values else (
+        decode_cursor(before, len(fields)) if before else None)
+
+    if before_values is not None:
+        rows = list(queryset.filter(_after(fields, before_values, reverse=True)).order_by(
+            *[f'-{field}' for field in fields])[:per_page + 1])
+        has_previous = len(rows) > per_page
+        return KeysetPage(rows[:per_page][::-1], fields, True, has_previous)
+
+    if after_values is not None:
+        queryset = queryset.filter(_after(fields, after_values))
+    rows = list(queryset.order_by(*fields)[:per_page + 1])
+    return KeysetPage(rows[:per_page], fields, len(rows) > per_page, after_values is not None)
+
+
+async def apaginate(queryset, per_page, number):
+    """Асинхронный аналог Paginator.get_page: acount() и async for вместо sync ORM.
+
+    Некорректный или слишком большой номер страницы, как и в get_page,
+    заменяется ближайшей существующей страницей.
+    """
+    paginator = Paginator(queryset, per_page)
+    # count - cached_property, поэтому значение из acount() сохраняется в экземпляре
+    paginator.count = await queryset.acount()
+    try:
+        number = paginator.validate_number(number)
+    except PageNotAnInteger:
+        number = 1
+    except EmptyPage:
+        number = paginator.num_pages
+    bottom = (number - 1) * per_page
+    object_list = [obj async for obj in queryset[bottom:bottom + per_page]]
+    return Page(object_list, number, paginator)
@@ -0,0 +1,207 @@
+"""Профилирование отдельных запросов по требованию и хранилище профилей"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+import uuid
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .middleware import QueryRecorder
+
+PROFILE_ID_RE = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$')
+
+
+def get_storage_dir():
+    path = Path(getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'var' / 'profiles'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def explain(query):
+    """План выполнения SQL-запроса (только для SELECT)"""
+    if not query['sql'].lstrip().upper().startswith('SELECT') or query['many']:
+        return None
+    connection = connections[query['alias']]
+    prefix = connection.ops.explain_query_prefix()
+    # Служебные EXPLAIN не должны попадать в счетчики QueryBudgetMiddleware
+    wrappers, connection.execute_wrappers = connection.execute_wrappers, []
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"{prefix} {query['sql']}", query['params'])
+            return [' '.join(str(col) for col in row) for row in cursor.fetchall()]
+    except Exception as exc:
+        return [f'EXPLAIN не выполнен: {exc}']
+    finally:
+        connection.execute_wrappers = wrappers
+
+
+def profile_request(request, get_response):
+    """Выполняет запрос под cProfile и сохраняет статистику, SQL и планы запросов"""
+    recorder = QueryRecorder(keep_queries=True)
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    with recorder.record():
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+    duration_ms = (time.perf_counter() - started) * 1000
+    return save_profile(request, response, profiler, recorder, duration_ms)
+
+
+async def aprofile_request(request, get_response):
+    """profile_request для async-запроса.
+
+    cProfile видит только поток цикла событий; время sync-кода ORM попадает
+    в профиль как ожидание, а сами SQL-запросы записываются полностью.
+    """
+    recorder = QueryRecorder(keep_queries=True)
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    stop = await recorder.arecord()
+    try:
+        profiler.enable()
+        try:
+            response = await get_response(request)
+        finally:
+            profiler.disable()
+    finally:
+        await stop()
+    duration_ms = (time.perf_counter() - started) * 1000
+    return await sync_to_async(save_profile)(request, response, profiler, recorder, duration_ms)
+
+
+def save_profile(request, response, profiler, recorder, duration_ms):
+    """Сохраняет статистику, SQL и планы самых медленных запросов"""
+    top = getattr(settings, 'PROFILING_EXPLAIN_TOP', 5)
+    slowest = sorted(range(len(recorder.queries)),
+                     key=lambda i: recorder.queries[i]['time_ms'], reverse=True)[:top]
+    for index in slowest:
+        recorder.queries[index]['explain'] = explain(recorder.queries[index])
+
+    now = timezone.now()
+    profile_id = f"{now.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    storage = get_storage_dir()
+    profiler.dump_stats(storage / f'{profile_id}.prof')
+
+    match = getattr(request, 'resolver_match', None)
+    meta = {
+        'id': profile_id,
+        'created': now.isoformat(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'view': match.view_name if match else None,
+        'user': request.user.get_username(),
+        'status': response.status_code,
+        'duration_ms': round(duration_ms, 1),
+        'query_count': recorder.count,
+        'db_time_ms': round(recorder.duration * 1000, 1),
+        'queries': recorder.queries,
+    }
+    with open(storage / f'{profile_id}.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1, default=str)
+
+    prune(storage)
+    response['X-Profile-Id'] = profile_id
+    return response
+
+
+def prune(storage):
+    """Оставляет только PROFILING_MAX_PROFILES последних профилей"""
+    keep = getattr(settings, 'PROFILING_MAX_PROFILES', 50)
+    metas = sorted(storage.glob('*.json'), reverse=True)
+    for meta in metas[keep:]:
+        for path in (meta, meta.with_suffix('.prof')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(limit=100):
+    """Метаданные последних профилей без списка запросов, новые первыми"""
+    profiles = []
+    for path in sorted(get_storage_dir().glob('*.json'), reverse=True)[:limit]:
+        with open(path, encoding='utf-8') as f:
+            meta = json.load(f)
+        meta.pop('queries', None)
+        profiles.append(meta)
+    return profiles
+
+
+def load_profile(profile_id, limit=40):
+    """Метаданные профиля и текстовый отчет pstats по самым затратным функциям"""
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    storage = get_storage_dir()
+    meta_path = storage / f'{profile_id}.json'
+    if not meta_path.exists():
+        return None
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    output = io.StringIO()
+    stats = pstats.Stats(str(storage / f'{profile_id}.prof'), stream=output)
+    stats.sort_stats('cumulative').print_stats(limit)
+    meta['stats'] = output.getvalue()
+    return meta
+
+
+def stats_path(profile_id):
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    path = get_storage_dir() / f'{profile_id}.prof'
+    return path if path.exists() else None
+
+
+class ProfilerMiddleware:
+    """Профилирует запрос под cProfile по запросу сотрудника склада.
+
+    Включается заголовком ``X-Profile: 1`` или параметром ``?_profile=1``
+    только для пользователей с is_staff. Должен стоять после
+    AuthenticationMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if self.is_requested(request):
+            return profile_request(request, self.get_response)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.is_flagged(request) and self.is_allowed(await request.auser()):
+            return await aprofile_request(request, self.get_response)
+        return await self.get_response(request)
+
+    @classmethod
+    def is_requested(cls, request):
+        return cls.is_flagged(request) and cls.is_allowed(getattr(request, 'user', None))
+
+    @staticmethod
+    def is_flagged(request):
+        if not getattr(settings, 'PROFILING_ENABLED', True):
+            return False
+        flag = request.headers.get('X-Profile') or request.GET.get('_profile')
+        return flag in ('1', 'true', 'yes')
+
+    @staticmethod
+    def is_allowed(user):
+        return bool(user and user.is_authenticated and user.is_staff)
@@ -0,0 +1,99 @@
+"""Резервы товара под заказы со сроком действия.
+
+Резерв сразу списывает количество со счетчиков остатков (stock.reserve),
+поэтому проверка "хватит ли товара" у следующего сборщика видит чужие
+резервы без агрегата по таблице резервов. Выдача по резерву (fulfill)
+списывает размещения, не трогая счетчик; снятие (release) и истечение
+(expire) возвращают количество в счетчик.
+
+Переход из статуса ACTIVE выполняется условным UPDATE, так что выдача,
+снятие и чистка истекших резервов не могут закрыть один резерв дважды.
+Функции вызываются внутри journal.unit_of_work() или transaction.atomic().
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from . import events, services, stock
+from .models import Reservation
+
+
+def get_ttl():
+    return getattr(settings, 'RESERVATION_TTL', timedelta(minutes=30))
+
+
+def create(product, quantity, order, operator, ttl=None, batch=None, rack=None):
+    """Резервирует товар; количество должно быть проверено заранее (ReservationForm).
+
+    Если конкурент успел забрать остаток после проверки, StockConflict
+    откатывает транзакцию и retry_on_conflict повторяет операцию.
+    """
+    reserved = stock.reserve(product.pk, quantity)
+    if reserved != quantity:
+        raise services.StockConflict(f'Остаток товара #{product.pk} изменен конкурентной операцией')
+    reservation = Reservation.objects.create(
+        product=product, batch=batch, rack=rack, quantity=quantity, order=order,
+        operator=operator, expires_at=timezone.now() + (ttl or get_ttl()))
+    events.stock_changed(product, -quantity)
+    return reservation
+
+
+def _close(reservation, status, now=None):
+    """Переводит действующий резерв в status; False, если его уже закрыли"""
+    queryset = Reservation.objects.filter(pk=reservation.pk, status=Reservation.ACTIVE)
+    if now is not None:
+        queryset = queryset.filter(expires_at__gt=now)
+    if not queryset.update(status=status):
+        return False
+    reservation.status = status
+    return True
+
+
+def fulfill(reservation, operator):
+    """Выдает товар по резерву; возвращает строку выдачи или None, если резерв не действует"""
+    if not _close(reservation, Reservation.FULFILLED, now=timezone.now()):
+        return None
+    line = services.IssueLine(reservation.product, reservation.quantity, operator,
+                              reservation=reservation)
+    return services.issue_lines([line])[0]
+
+
+def release(reservation):
+    """Снимает резерв и возвращает количество в счетчик; False, если резерв уже закрыт"""
+    if not _close(reservation, Reservation.RELEASED):
+        return False
+    stock.add(reservation.product_id, reservation.quantity)
+    events.stock_changed(reservation.product, reservation.quantity)
+    return True
+
+
+def expire(now=None, limit=1000):
+    """Закрывает до limit истекших резервов; возвращает их число.
+
+    Выборка идет по индексу (status, expires_at). Строки блокируются до
+    закрытия (в SQLite конфликт с параллельной выдачей проявится как
+    OperationalError при записи), поэтому количество каждого резерва
+    возвращается в счетчик ровно один раз.
+    """
+    now = now or timezone.now()
+    queryset = Reservation.objects.filter(status=Reservation.ACTIVE, expires_at__lte=now)
+    features = connection.features
+    if features.has_select_for_update:
+        # Параллельная чистка пропускает строки, которые уже закрывает другая;
+        # блокируются только резервы, но не товары из select_related
+        queryset = queryset.select_for_update(
+            skip_locked=features.has_select_for_update_skip_locked,
+            of=('self',) if features.has_select_for_update_of else ())
+    expired = list(queryset.select_related('product__category').order_by('expires_at')[:limit])
+    if not expired:
+        return 0
+    Reservation.objects.filter(pk__in=[r.pk for r in expired]).update(status=Reservation.EXPIRED)
+    returned = defaultdict(int)
+    for reservation in expired:
+        returned[reservation.product] += reservation.quantity
+    stock.add_many({product.pk: quantity for product, quantity in returned.items()})
+    events.stock_changes(returned)
+    return len(expired)
@@ -0,0 +1,240 @@
+"""Прием сканирований с терминалов: идемпотентность и групповая фиксация.
+
+Терминал присваивает каждому сканированию ключ идемпотентности и при
+обрыве связи повторяет запрос с тем же ключом. Ключи хранятся в таблице
+ScanKey (уникальный индекс) вместе с результатом, поэтому повтор получает
+сохраненный ответ и не списывает товар второй раз.
+
+Сканирования из одновременных запросов собираются в буфер и фиксируются
+пачкой: первый запрос, заставший буфер пустым, становится ведущим, ждет
+SCAN_COALESCE_WINDOW секунд и обрабатывает все накопленное в одной
+транзакции. Сканирования одной партии на один стеллаж объединяются в одно
+размещение, строки выдачи одного товара - в одну строку выдачи, поэтому
+размещения обновляются одним bulk_update, а журнал пишется одним bulk_create.
+Остальные запросы ждут результата своих сканирований.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+
+from . import journal, metrics, services
+from .labels import parse_label_payload
+from .models import Product, ScanKey
+
+logger = logging.getLogger(__name__)
+
+PLACE = 'place'
+ISSUE = 'issue'
+COUNT = 'count'
+ACTIONS = [(PLACE, 'Размещение'), (ISSUE, 'Выдача'), (COUNT, 'Пересчет')]
+
+
+@dataclass(eq=False)
+class Scan:
+    key: str
+    action: str
+    code: str
+    rack: int = None
+    quantity: int = 1
+    operator: str = ''
+    result: dict = None
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+
+def error(*messages):
+    return {'status': 'error', 'errors': list(messages)}
+
+
+class ScanBuffer:
+    """Буфер сканирований с групповой фиксацией (group commit)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._flushing = False
+
+    def submit(self, scans):
+        """Ставит сканирования в очередь и возвращает их результаты"""
+        with self._lock:
+            self._pending.extend(scans)
+            leader = not self._flushing
+            self._flushing = True
+        if leader:
+            self._drain()
+
+        deadline = time.monotonic() + getattr(settings, 'SCAN_WAIT_TIMEOUT', 10)
+        for scan in scans:
+            if not scan.done.wait(max(0.0, deadline - time.monotonic())):
+                # Ключ не сохранен: терминал может безопасно повторить сканирование
+                scan.result = {'status': 'pending'}
+        return [scan.result for scan in scans]
+
+    def _drain(self):
+        window = getattr(settings, 'SCAN_COALESCE_WINDOW', 0.02)
+        limit = getattr(settings, 'SCAN_BATCH_MAX', 500)
+        if window:
+            time.sleep(window)
+        while True:
+            with self._lock:
+                batch = self._pending[:limit]
+                del self._pending[:limit]
+                if not batch:
+                    self._flushing = False
+                    return
+            try:
+                flush(batch)
+            except services.ConflictRetriesExhausted:
+                logger.warning('Групповая фиксация %d сканирований не прошла из-за конфликтов',
+                               len(batch))
+                for scan in batch:
+                    scan.result = error('Склад занят параллельными операциями, '
+                                        'повторите сканирование')
+            except Exception:
+                logger.exception('Ошибка групповой фиксации %d сканирований', len(batch))
+                for scan in batch:
+                    scan.result = error('Внутренняя ошибка, повторите сканирование')
+            finally:
+                for scan in batch:
+                    scan.done.set()
+
+
+buffer = ScanBuffer()
+_last_prune = 0.0
+
+
+@services.retry_on_conflict
+def flush(scans):
+    """Обрабатывает пачку сканирований в одной транзакции"""
+    for attempt in range(2):
+        try:
+            with journal.unit_of_work():
+                results = process(scans)
+            break
+        except IntegrityError:
+            # Тот же ключ успел зафиксировать другой процесс; при повторе
+            # сканирование будет распознано как дубликат
+            if attempt:
+                raise
+    for scan, result in zip(scans, results):
+        scan.result = result
+    metrics.record_scan_flush([(scan.action, 'duplicate' if result.get('duplicate')
+                                else result['status']) for scan, result in zip(scans, results)])
+    prune()
+
+
+def process(scans):
+    results = [None] * len(scans)
+    known = dict(ScanKey.objects.filter(key__in={scan.key for scan in scans})
+                 .values_list('key', 'result'))
+    first, fresh, repeated = {}, [], []
+    for index, scan in enumerate(scans):
+        if scan.key in known:
+            results[index] = {**known[scan.key], 'duplicate': True}
+        elif scan.key in first:
+            repeated.append((index, first[scan.key]))
+        else:
+            first[scan.key] = index
+            fresh.append(index)
+
+    codes = {index: parse_label_payload(scans[index].code) for index in fresh}
+    products = {product.sku: product for product in Product.objects.select_related(
+        'category').filter(sku__in={sku for sku, _ in codes.values()})}
+    places = [index for index in fresh if scans[index].action == PLACE]
+    snapshot = services.CapacitySnapshot(
+        batch_ids=[codes[index][1] for index in places if codes[index][1]],
+        rack_ids=[scans[index].rack for index in places if scans[index].rack],
+        products=[product for product in products.values()])
+
+    place_groups, issue_groups, count_groups = {}, {}, {}
+    for index in fresh:
+        scan = scans[index]
+        sku, batch_id = codes[index]
+        product = products.get(sku)
+        if product is None:
+            results[index] = error(f'Товар с артикулом {sku} не найден')
+        elif scan.action == PLACE:
+            batch = snapshot.batches.get(batch_id)
+            if batch_id is None:
+                results[index] = error('Для размещения сканируйте этикетку партии')
+            elif scan.rack is None:
+                results[index] = error('Не указан стеллаж')
+            elif batch is not None and batch.product_id != product.pk:
+                results[index] = error(f'Партия #{batch_id} не относится к товару {sku}')
+            else:
+                errors = snapshot.reserve_placement(batch_id, scan.rack, scan.quantity)
+                if errors:
+                    results[index] = error(*errors)
+                else:
+                    group = place_groups.setdefault((batch_id, scan.rack, scan.operator), [0, []])
+                    group[0] += scan.quantity
+                    group[1].append(index)
+        elif scan.action == ISSUE:
+            errors = snapshot.reserve_issue(product, scan.quantity)
+            if errors:
+                results[index] = error(*errors)
+            else:
+                line, indexes = issue_groups.setdefault(
+                    (product.pk, scan.operator),
+                    (services.IssueLine(product, 0, scan.operator), []))
+                line.quantity += scan.quantity
+                indexes.append(index)
+        elif scan.rack is None:
+            results[index] = error('Не указан стеллаж')
+        else:
+            group = count_groups.setdefault((product, scan.rack), [0, []])
+            group[0] += scan.quantity
+            group[1].append(index)
+
+    by_operator = {}
+    for (batch_id, rack_id, operator), (quantity, indexes) in place_groups.items():
+        by_operator.setdefault(operator, []).append(
+            ((snapshot.batches[batch_id], snapshot.racks[rack_id], quantity), indexes))
+    for operator, groups in by_operator.items():
+        placements = services.place_many([item for item, _ in groups], operator)
+        for placement, (_, indexes) in zip(placements, groups):
+            snapshot.placements.setdefault(placement.product_id, []).append(placement)
+            for index in indexes:
+                results[index] = {'status': 'ok', 'placement': placement.pk,
+                                  'batch': placement.batch_id, 'rack': placement.rack_id,
+                                  'quantity': scans[index].quantity}
+
+    if issue_groups:
+        services.issue_lines([line for line, _ in issue_groups.values()], snapshot.placements)
+    for line, indexes in issue_groups.values():
+        for index in indexes:
+            results[index] = {'status': 'ok', 'product': line.product.pk,
+                              'quantity': scans[index].quantity, 'racks': sorted(line.rack_ids)}
+
+    # Пересчет сравнивается с остатком после размещений и выдач этой же пачки
+    for (product, rack_id), (counted, indexes) in count_groups.items():
+        expected = sum(placement.quantity for placement in snapshot.placements.get(product.pk, [])
+                       if placement.is_active and placement.rack_id == rack_id)
+        for index in indexes:
+            results[index] = {'status': 'ok', 'product': product.pk, 'rack': rack_id,
+                              'counted': counted, 'expected': expected,
+                              'difference': counted - expected}
+
+    for index, original in repeated:
+        results[index] = {**results[original], 'duplicate': True}
+    ScanKey.objects.bulk_create([
+        ScanKey(key=scans[index].key, action=scans[index].action, result=results[index])
+        for index in fresh
+    ])
+    return results
+
+
+def prune():
+    """Удаляет ключи старше SCAN_KEY_RETENTION (не чаще раза в час)"""
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < 3600:
+        return
+    _last_prune = now
+    retention = getattr(settings, 'SCAN_KEY_RETENTION', timedelta(days=7))
+    ScanKey.objects.filter(created__lt=timezone.now() - retention).delete()
@@ -0,0 +1,164 @@
+"""Полнотекстовый индекс товаров (SQLite FTS5) с ранжированием и префиксным поиском.
+
+Индекс ``warehouse_product_fts`` поддерживается триггерами на таблицах
+товаров и категорий, поэтому любые записи (формы, админка, bulk_create)
+попадают в него без участия Python-кода. Таблицу и триггеры создает
+миграция 0015_product_search_fts; create_index() повторяет ее для баз,
+построенных без миграций (тесты). На других СУБД поиск откатывается на
+обычные LIKE-запросы.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product, Category
+
+FTS_TABLE = 'warehouse_product_fts'
+# Веса столбцов для bm25: name, sku, category
+RANK_WEIGHTS = (5.0, 10.0, 1.0)
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _schema_sql():
+    product = Product._meta.db_table
+    category = Category._meta.db_table
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            name, sku, category, tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {product} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, sku, category)
+            VALUES (new.id, new.name, new.sku,
+                    (SELECT name FROM {category} WHERE id = new.category_id));
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, sku, category_id ON {product} BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            INSERT INTO {FTS_TABLE}(rowid, name, sku, category)
+            VALUES (new.id, new.name, new.sku,
+                    (SELECT name FROM {category} WHERE id = new.category_id));
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {product} BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_category_au AFTER UPDATE OF name ON {category} BEGIN
+            UPDATE {FTS_TABLE} SET category = new.name
+            WHERE rowid IN (SELECT id FROM {product} WHERE category_id = new.id);
+        END""",
+    ]
+
+
+def is_supported(using=None):
+    return (using or connection).vendor == 'sqlite'
+
+
+def create_index(using=None):
+    """Создает таблицу индекса и триггеры (идемпотентно) и заполняет пустой индекс"""
+    conn = using or connection
+    if not is_supported(conn):
+        return
+    with conn.cursor() as cursor:
+        for statement in _schema_sql():
+            cursor.execute(statement)
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {FTS_TABLE})')
+        if not cursor.fetchone()[0]:
+            _fill(cursor)
+
+
+def rebuild_index(using=None):
+    """Полностью перестраивает индекс по текущим товарам"""
+    conn = using or connection
+    if not is_supported(conn):
+        return
+    create_index(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        _fill(cursor)
+
+
+def _fill(cursor):
+    cursor.execute(
+        f"""INSERT INTO {FTS_TABLE}(rowid, name, sku, category)
+            SELECT p.id, p.name, p.sku, c.name
+            FROM {Product._meta.db_table} p JOIN {Category._meta.db_table} c
+            ON c.id = p.category_id""")
+
+
+def build_match_query(query):
+    """Преобразует ввод оператора в выражение FTS5.
+
+    Каждое слово становится префиксной фразой: ``SKU-0012`` превращается в
+    ``"SKU 0012"*``, что находит все артикулы, начинающиеся с SKU-0012.
+    Слова объединяются через AND.
+    """
+    phrases = []
+    for word in query.split():
+        tokens = TOKEN_RE.findall(word)
+        if tokens:
+            phrases.append('"{}"*'.format(' '.join(tokens)))
+    return ' AND '.join(phrases)
+
+
+def search_product_ids(query, offset=0, limit=20):
+    """Идентификаторы найденных товаров по релевантности и их общее количество"""
+    match = build_match_query(query)
+    if not match:
+        return [], 0
+    if not is_supported():
+        queryset = Product.objects.filter(
+            Q(sku__istartswith=query) | Q(name__icontains=query) |
+            Q(category__name__icontains=query)).order_by('name')
+        return list(queryset.values_list('pk', flat=True)[offset:offset + limit]), queryset.count()
+
+    weights = ', '.join(str(w) for w in RANK_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, {weights}), rowid LIMIT %s OFFSET %s',
+            [match, limit, offset])
+        ids = [row[0] for row in cursor.fetchall()]
+        if offset == 0 and len(ids) < limit:
+            return ids, len(ids)
+        cursor.execute(
+            f'SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        total = cursor.fetchone()[0]
+    return ids, total
+
+
+class SearchPage:
+    """Страница результатов поиска, совместимая с шаблонами пагинации Django"""
+
+    def __init__(self, object_list, number, per_page, total):
+        self.object_list = object_list
+        self.number = number
+        self.per_page = per_page
+        self.count = total
+        self.num_pages = max(1, -(-total // per_page))
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_next(self):
+        return self.number < self.num_pages
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+
+def search_products(query, page=1, per_page=20):
+    """Страница товаров, отсортированных по релевантности, с категориями"""
+    page = max(1, page)
+    ids, total = search_product_ids(query, offset=(page - 1) * per_page, limit=per_page)
+    products = Product.objects.select_related('category').in_bulk(ids)
+    return SearchPage([products[pk] for pk in ids if pk in products], page, per_page, total)
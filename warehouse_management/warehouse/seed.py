@@ -0,0 +1,180 @@
+"""Генератор синтетического склада для нагрузочных тестов и бенчмарков"""
+import random
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+
+from . import locations, stock
+from .models import (Category, Product, Rack, Batch, Placement, WarehouseJournal, Warehouse, Zone,
+                     Aisle)
+
+# Фиксированная точка отсчета, чтобы одинаковый seed давал одинаковые данные
+BASE_DATE = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+CHUNK_SIZE = 1000
+# Стеллажей в ряду и рядов в зоне синтетического склада
+RACKS_PER_AISLE = 10
+AISLES_PER_ZONE = 5
+
+DEFAULT_SCALE = {
+    'categories': 20,
+    'products': 2000,
+    'racks': 200,
+    'batches': 4000,
+    'placements': 8000,
+    'journal': 20000,
+}
+
+
+def clear_warehouse():
+    """Удаляет все складские данные (пользователи не затрагиваются)"""
+    for model in (WarehouseJournal, Placement, Batch, Product, Rack, Category, Warehouse):
+        model.objects.all().delete()
+
+
+@transaction.atomic
+def seed_warehouse(categories=20, products=2000, racks=200, batches=4000,
+                   placements=8000, journal=20000, seed=42):
+    """Создает воспроизводимый склад заданного масштаба через bulk_create.
+
+    Размещения не превышают вместимость стеллажей и остаток партий,
+    поэтому сгенерированные данные проходят те же проверки, что и реальные.
+    """
+    rnd = random.Random(seed)
+
+    # Каждая четвертая категория - скоропортящиеся товары с выдачей по FEFO
+    category_objs = Category.objects.bulk_create([
+        Category(name=f'Категория {i:03d}', description=f'Синтетическая категория {i}',
+                 issue_strategy=Category.FEFO if i % 4 == 0 else Category.FIFO)
+        for i in range(categories)
+    ], batch_size=CHUNK_SIZE)
+
+    product_objs = Product.objects.bulk_create([
+        Product(
+            name=f'Товар {i:06d}',
+            category=category_objs[i % len(category_objs)],
+            sku=f'SKU-{i:06d}',
+            length=rnd.randint(5, 60),
+            width=rnd.randint(5, 40),
+            height=rnd.randint(2, 40),
+            weight=round(rnd.uniform(0.1, 15), 2),
+        )
+        for i in range(products)
+    ], batch_size=CHUNK_SIZE)
+
+    # Один склад: стеллажи по порядку заполняют ряды, ряды - зоны
+    aisle_objs = []
+    if racks:
+        warehouse = Warehouse.objects.create(name='Основной склад')
+        aisles_count = (racks - 1) // RACKS_PER_AISLE + 1
+        zone_objs = Zone.objects.bulk_create([
+            Zone(warehouse=warehouse, name=f'Зона {i + 1:02d}')
+            for i in range((aisles_count - 1) // AISLES_PER_ZONE + 1)
+        ])
+        aisle_objs = Aisle.objects.bulk_create([
+            Aisle(zone=zone_objs[i // AISLES_PER_ZONE], name=f'Ряд {i + 1:03d}')
+            for i in range(aisles_count)
+        ], batch_size=CHUNK_SIZE)
+
+    rack_objs = Rack.objects.bulk_create([
+        Rack(
+            name=f'R-{i:05d}',
+            aisle=aisle_objs[i // RACKS_PER_AISLE],
+            max_load=rnd.choice([500, 1000, 2000]),
+            length=rnd.choice([100, 200, 300]),
+            width=rnd.choice([60, 80, 100]),
+            height=rnd.choice([150, 200, 250]),
+            is_active=rnd.random() > 0.05,
+        )
+        for i in range(racks)
+    ], batch_size=CHUNK_SIZE)
+
+    batch_objs = Batch.objects.bulk_create([
+        Batch(
+            product=rnd.choice(product_objs),
+            quantity=rnd.randint(10, 200),
+            arrival_date=BASE_DATE + timedelta(minutes=i * 7),
+            supplier=f'Поставщик {rnd.randint(1, 50)}',
+        )
+        for i in range(batches)
+    ], batch_size=CHUNK_SIZE)
+    for i, batch in enumerate(batch_objs):
+        if batch.product.category.issue_strategy == Category.FEFO:
+            # Сроки без обращения к rnd, чтобы остальные данные не зависели от них
+            batch.expiry_date = (batch.arrival_date + timedelta(days=30 + i % 180)).date()
+    Batch.objects.bulk_update([batch for batch in batch_objs if batch.expiry_date],
+                              ['expiry_date'], batch_size=CHUNK_SIZE)
+
+    # Отслеживаем свободное место и остаток партий, чтобы не переполнять стеллажи
+    free_volume = {rack.pk: rack.volume for rack in rack_objs}
+    free_weight = {rack.pk: rack.max_load for rack in rack_objs}
+    batch_left = {batch.pk: batch.quantity for batch in batch_objs}
+    active_racks = [rack for rack in rack_objs if rack.is_active] or rack_objs
+
+    placement_objs = []
+    attempts = 0
+    while len(placement_objs) < placements and attempts < placements * 5 and batch_objs:
+        attempts += 1
+        batch = rnd.choice(batch_objs)
+        rack = rnd.choice(active_racks)
+        product = batch.product
+        if not rack.can_fit_product(product) or batch_left[batch.pk] <= 0:
+            continue
+        max_quantity = min(
+            batch_left[batch.pk],
+            int(free_volume[rack.pk] // product.get_volume()),
+            int(free_weight[rack.pk] // product.weight),
+        )
+        if max_quantity <= 0:
+            continue
+        quantity = rnd.randint(1, min(max_quantity, 50))
+        batch_left[batch.pk] -= quantity
+        free_volume[rack.pk] -= quantity * product.get_volume()
+        free_weight[rack.pk] -= quantity * product.weight
+        placement_objs.append(Placement(
+            rack=rack, product=product, batch=batch, quantity=quantity,
+            date_placed=batch.arrival_date + timedelta(hours=rnd.randint(1, 48)),
+            expiry_date=batch.expiry_date,
+        ))
+    Placement.objects.bulk_create(placement_objs, batch_size=CHUNK_SIZE)
+    for batch in batch_objs:
+        batch.units_placed = batch.quantity - batch_left[batch.pk]
+    Batch.objects.bulk_update(batch_objs, ['units_placed'], batch_size=CHUNK_SIZE)
+    # bulk_create не вызывает сигналы: счетчики остатков и вместимость
+    # уровней склада пересчитываются целиком
+    stock.rebuild()
+    locations.rebuild()
+
+    # Сначала приход по каждому размещению, затем произвольная история операций
+    journal_objs = []
+    for i in range(journal):
+        if i < len(placement_objs):
+            placement = placement_objs[i]
+            operation_type, quantity = 'IN', placement.quantity
+            product, rack, batch = placement.product, placement.rack, placement.batch
+        elif placement_objs:
+            placement = rnd.choice(placement_objs)
+            operation_type, quantity = rnd.choice(['IN', 'OUT']), rnd.randint(1, 20)
+            product, rack, batch = placement.product, placement.rack, placement.batch
+        else:
+            operation_type, quantity = rnd.choice(['IN', 'OUT']), rnd.randint(1, 20)
+            product, rack, batch = rnd.choice(product_objs), None, None
+        journal_objs.append(WarehouseJournal(
+            operation_type=operation_type,
+            product=product,
+            quantity=quantity,
+            rack=rack,
+            batch=batch,
+            operation_date=BASE_DATE + timedelta(minutes=i * 3),
+            operator=f'Кладовщик {rnd.randint(1, 30)}',
+            notes='Сгенерировано seed_warehouse',
+        ))
+    WarehouseJournal.objects.bulk_create(journal_objs, batch_size=CHUNK_SIZE)
+
+    return {
+        'categories': len(category_objs),
+        'products': len(product_objs),
+        'racks': len(rack_objs),
+        'batches': len(batch_objs),
+        'placements': len(placement_objs),
+        'journal': len(journal_objs),
+    }
@@ -0,0 +1,356 @@
+"""Складские операции: размещение партий и выдача товара.
+
+Функции используются HTML-представлениями и JSON API. Они не открывают
+транзакцию сами: вызывающий код выполняет их внутри journal.unit_of_work(),
+который вставляет записи журнала одним bulk_create в конце блока.
+Счетчики остатков (stock.py) изменяются в той же транзакции.
+"""
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.db.models import BooleanField, Case, F, IntegerField, Q, Value, When
+
+from . import events, journal, locations, metrics, slots, stock
+from .models import Batch, Category, Placement, Product, Rack, WarehouseJournal
+
+
+class StockConflict(OperationalError):
+    """Остаток изменен конкурентной выдачей после чтения; операция повторяется"""
+
+
+class ConflictRetriesExhausted(OperationalError):
+    """Конфликт записи не разрешился за CONFLICT_RETRY_ATTEMPTS попыток"""
+
+
+# Признаки ожидания блокировки в тексте ошибки: SQLite, PostgreSQL, MySQL
+LOCK_ERRORS = (
+    'database is locked', 'database table is locked',
+    'deadlock', 'could not serialize access', 'could not obtain lock', 'lock wait timeout',
+)
+
+
+def is_write_conflict(error):
+    """Можно ли повторить операцию после ошибки: конфликт, а не сбой базы или запроса"""
+    if isinstance(error, (StockConflict, slots.SlotConflict)):
+        return True
+    message = str(error).lower()
+    return any(text in message for text in LOCK_ERRORS)
+
+
+def retry_on_conflict(func):
+    """Повторяет единицу работы при конфликте записи.
+
+    Это StockConflict/SlotConflict, взаимоблокировка или таймаут блокировки
+    строки в PostgreSQL/MySQL, а в SQLite - "database is locked" при
+    одновременной записи (is_write_conflict). Прочие OperationalError
+    (нет таблицы, разрыв соединения) не повторяются. Повтор выполняется
+    заново с чтения, поэтому проверка вместимости видит результат
+    конкурента. Побочные эффекты вне базы (сообщения пользователю, события,
+    метрики) откладываются в transaction.on_commit и при откате попытки
+    отменяются вместе с ней.
+    Исчерпав попытки, декоратор выбрасывает ConflictRetriesExhausted:
+    представления показывают его как ошибку формы или HTTP 409. Внутри уже
+    открытой транзакции повторять нечего: ошибка передается внешнему коду.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if connection.in_atomic_block:
+            return func(*args, **kwargs)
+        attempts = getattr(settings, 'CONFLICT_RETRY_ATTEMPTS', 3)
+        delay = getattr(settings, 'CONFLICT_RETRY_DELAY', 0.05)
+        for attempt in range(1, attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if not is_write_conflict(error):
+                    raise
+                metrics.record_write_conflict()
+                if attempt == attempts:
+                    raise ConflictRetriesExhausted(
+                        f'Операция не выполнена за {attempts} попыток: {error}') from error
+                # Случайная задержка разводит повторы конкурентов во времени
+                time.sleep(random.uniform(0, delay * 2 ** attempt))
+    return wrapper
+
+
+def lock_rows(batch_ids=(), rack_ids=()):
+    """Блокирует строки стеллажей и партий до конца транзакции (SELECT ... FOR UPDATE).
+
+    Проверка вместимости выполняется после блокировки, поэтому два
+    размещения на один стеллаж не могут оба пройти проверку, а размещения
+    на разные стеллажи друг друга не ждут. Строки блокируются в порядке
+    первичного ключа, чтобы встречные операции не взаимоблокировались.
+    SQLite не поддерживает FOR UPDATE и сериализует запись блокировкой всей
+    базы; конфликт там проявляется как OperationalError (см. retry_on_conflict).
+    """
+    if not connection.features.has_select_for_update:
+        return
+    for model, ids in ((Rack, rack_ids), (Batch, batch_ids)):
+        ids = {pk for pk in ids if pk}
+        if ids:
+            list(model.objects.select_for_update().filter(pk__in=ids).order_by(
+                'pk').values_list('pk', flat=True))
+
+
+def place_many(items, operator):
+    """Размещает [(партия, стеллаж, количество)] пакетными INSERT"""
+    placements = [
+        Placement(rack=rack, product=batch.product, batch=batch,
+                  quantity=quantity, is_active=True, expiry_date=batch.expiry_date)
+        for batch, rack, quantity in items
+    ]
+    if slots.is_enabled():
+        slot_map = slots.SlotMap({rack.pk for _, rack, _ in items})
+        for placement in placements:
+            slots.assign(slot_map, placement)
+        slot_map.save()
+    placements = Placement.objects.bulk_create(placements)
+    journal.record([
+        WarehouseJournal(operation_type='IN', product=batch.product, quantity=quantity,
+                         rack=rack, batch=batch, operator=operator,
+                         notes=f'Размещение партии #{batch.id}')
+        for batch, rack, quantity in items
+    ])
+    received, per_batch = defaultdict(int), defaultdict(int)
+    for placement in placements:
+        received[placement.product_id] += placement.quantity
+        per_batch[placement.batch_id] += placement.quantity
+    # Строки партий уже заблокированы проверкой (CapacitySnapshot), обновляем одним UPDATE
+    Batch.objects.filter(pk__in=per_batch).update(units_placed=Case(
+        *[When(pk=pk, then=F('units_placed') + quantity) for pk, quantity in per_batch.items()],
+        output_field=IntegerField()))
+    metrics.record_placements([placement.quantity for placement in placements])
+    stock.add_many(received)
+    locations.racks_changed({rack.pk for _, rack, _ in items})
+    events.placements_created(placements, operator)
+    return placements
+
+
+def place(batch, rack, quantity, operator):
+    return place_many([(batch, rack, quantity)], operator)[0]
+
+
+@dataclass
+class IssueLine:
+    """Строка выдачи и ее результат после списания"""
+    product: object
+    quantity: int
+    operator: str
+    issued: int = 0
+    deactivated: int = 0
+    rack_ids: set = field(default_factory=set)
+    # Резерв, по которому выдается строка: количество уже списано со счетчика
+    reservation: object = None
+
+
+# Порядок списания размещений для Category.issue_strategy. Размещения без
+# срока годности при FEFO идут после всех размещений со сроком. Ведущий
+# product_id совпадает с первым столбцом индекса, поэтому выборка по
+# нескольким товарам читается из индекса без сортировки; порядок между
+# товарами не важен - active_placements раскладывает их по товарам.
+ISSUE_ORDERING = {
+    Category.FIFO: ('product_id', 'date_placed', 'pk'),
+    Category.FEFO: ('product_id', F('expiry_date').asc(nulls_last=True), 'date_placed', 'pk'),
+    Category.LIFO: ('-product_id', '-date_placed', '-pk'),
+}
+
+
+def claim_placements(queryset):
+    """Блокирует размещения для списания, пропуская занятые другой выдачей.
+
+    С FOR UPDATE SKIP LOCKED (PostgreSQL, MySQL 8) конкуренты за один товар
+    не ждут голову очереди FIFO, а берут следующие свободные строки: порядок
+    стратегии нарушается только между размещениями, которые списываются
+    одновременно. Если свободных строк не хватило, списанное не сойдется с
+    резервом, и issue_lines выбросит StockConflict для повтора. В SQLite
+    запрос не меняется: запись сериализуется блокировкой всей базы, и
+    выдачи одного товара выполняются по одной.
+    """
+    if not connection.features.has_select_for_update_skip_locked:
+        return queryset
+    return queryset.select_for_update(skip_locked=True)
+
+
+def active_placements(products):
+    """Активные размещения товаров в порядке выдачи их категорий.
+
+    Товары группируются по стратегии категории, и размещения каждой группы
+    выбираются одним запросом в порядке индекса: placement_issue_idx для
+    FEFO, placement_arrival_idx для FIFO и LIFO. Строки выбираются через
+    claim_placements, поэтому параллельные выдачи одного товара списывают
+    разные размещения.
+    """
+    strategies = defaultdict(list)
+    for product_id, strategy in Product.objects.filter(
+            pk__in={getattr(product, 'pk', product) for product in products}
+    ).values_list('pk', 'category__issue_strategy'):
+        strategies[strategy].append(product_id)
+    by_product = defaultdict(list)
+    for strategy, product_ids in strategies.items():
+        queryset = claim_placements(Placement.objects.filter(
+            product__in=product_ids, is_active=True).order_by(*ISSUE_ORDERING[strategy]))
+        for placement in queryset:
+            by_product[placement.product_id].append(placement)
+    return by_product
+
+
+def _compare_and_update(changed):
+    """Сохраняет размещения одним UPDATE, если их никто не изменил после чтения.
+
+    changed - {pk: (размещение, прочитанное количество)}. Строка обновляется
+    только при прежнем количестве и активности; если совпали не все строки,
+    конкурент успел списать их раньше и выдача повторяется заново.
+    """
+    if not changed:
+        return
+    condition = Q()
+    for pk, (placement, quantity) in changed.items():
+        condition |= Q(pk=pk, quantity=quantity, is_active=True)
+    updated = Placement.objects.filter(condition).update(
+        quantity=Case(*[When(pk=pk, then=Value(placement.quantity))
+                        for pk, (placement, _) in changed.items()],
+                      output_field=IntegerField()),
+        is_active=Case(*[When(pk=pk, then=Value(placement.is_active))
+                         for pk, (placement, _) in changed.items()],
+                       output_field=BooleanField()))
+    if updated != len(changed):
+        raise StockConflict('Размещения изменены конкурентной выдачей')
+
+
+def issue_lines(lines, placements=None):
+    """Списывает строки выдачи в порядке стратегии категории товара (FIFO, FEFO, LIFO).
+
+    placements - активные размещения по товарам (см. active_placements), если
+    они уже загружены для проверки. Сначала количество резервируется на
+    шардах счетчика товара (для строки по резерву оно уже списано), затем
+    списывается с размещений; размещения
+    сохраняются одним условным UPDATE (_compare_and_update), записи журнала
+    передаются в journal.record(). Расхождение резерва со списанным значит,
+    что остаток изменила конкурентная выдача: StockConflict откатывает
+    транзакцию, и retry_on_conflict повторяет операцию с новой проверкой.
+    """
+    if placements is None:
+        placements = active_placements({line.product for line in lines})
+    changed, entries = {}, []
+    for line in lines:
+        candidates = placements.get(line.product.pk, [])
+        if line.reservation is None:
+            reserved = stock.reserve(line.product.pk, line.quantity)
+        else:
+            reserved = line.quantity
+            if line.reservation.is_pinned():
+                # Сначала размещения из партии или стеллажа резерва, дальше по стратегии
+                candidates = sorted(candidates, key=lambda p: not line.reservation.matches(p))
+        remaining = line.quantity
+        for placement in candidates:
+            if remaining <= 0:
+                break
+            if not placement.is_active:
+                continue
+            line.rack_ids.add(placement.rack_id)
+            changed.setdefault(placement.pk, (placement, placement.quantity))
+            if placement.quantity > remaining:
+                # Частичное списание с текущего размещения
+                taken, notes = remaining, 'Частичная выдача товара'
+                placement.quantity -= remaining
+            else:
+                # Полное списание текущего размещения
+                taken, notes = placement.quantity, 'Полная выдача товара'
+                placement.is_active = False
+                line.deactivated += 1
+            remaining -= taken
+            entries.append(WarehouseJournal(
+                operation_type='OUT', product=line.product, quantity=taken,
+                rack_id=placement.rack_id, operator=line.operator, notes=notes))
+        line.issued = line.quantity - remaining
+        if reserved != line.issued:
+            raise StockConflict(f'Остаток товара #{line.product.pk} изменен конкурентной выдачей')
+
+    _compare_and_update(changed)
+    slots.shrink([placement for placement, _ in changed.values()],
+                 {line.product.pk: line.product for line in lines})
+    locations.racks_changed({placement.rack_id for placement, _ in changed.values()})
+    journal.record(entries)
+    metrics.record_issues([line.issued for line in lines])
+    events.issues_done(lines)
+    return lines
+
+
+def issue(product, quantity, operator):
+    return issue_lines([IssueLine(product, quantity, operator)])[0]
+
+
+class CapacitySnapshot:
+    """Состояние склада для проверки набора операций одним запросом на сущность.
+
+    Каждая успешная проверка сразу резервирует остаток партии, место на
+    стеллаже или товар в снимке (остаток товара - по счетчикам stock.py,
+    за вычетом активных резервов), так что следующие элементы того же запроса
+    проверяются с учетом предыдущих. Строки стеллажей и партий блокируются
+    до чтения (lock_rows), поэтому снимок актуален до конца транзакции.
+    """
+
+    def __init__(self, batch_ids=(), rack_ids=(), products=()):
+        lock_rows(batch_ids, rack_ids)
+        self.batches = Batch.objects.select_related('product').with_placement_totals(
+        ).in_bulk(set(batch_ids)) if batch_ids else {}
+        self.racks = Rack.objects.filter(is_active=True).with_occupancy().in_bulk(
+            set(rack_ids)) if rack_ids else {}
+        self.placements = active_placements(products) if products else {}
+        self.slots = slots.SlotMap(rack_ids) if rack_ids and slots.is_enabled() else None
+
+        self.unplaced = {pk: batch.get_initial_remaining() for pk, batch in self.batches.items()}
+        self.free_volume = {pk: rack.available_volume() for pk, rack in self.racks.items()}
+        self.free_weight = {pk: rack.available_weight() for pk, rack in self.racks.items()}
+        # Доступный остаток - по счетчикам, за вычетом активных резервов
+        # (как в IssueForm): иначе выдача из резерва проходит проверку и
+        # падает на stock.reserve внутри issue_lines
+        self.stock = stock.available(
+            {getattr(product, 'pk', product) for product in products}) if products else {}
+
+    def reserve_placement(self, batch_id, rack_id, quantity):
+        """Проверяет размещение и резервирует его; возвращает список ошибок"""
+        batch, rack = self.batches.get(batch_id), self.racks.get(rack_id)
+        errors = []
+        if batch is None:
+            errors.append(f'Партия #{batch_id} не найдена')
+        if rack is None:
+            errors.append(f'Активный стеллаж #{rack_id} не найден')
+        if errors:
+            return errors
+
+        product = batch.product
+        if quantity > self.unplaced[batch_id]:
+            return [f'Нельзя разместить больше товара, чем осталось в партии. '
+                    f'Доступно: {self.unplaced[batch_id]}']
+        if not rack.can_fit_product(product):
+            return ['Товар не помещается на выбранный стеллаж по габаритам']
+        if product.weight * quantity > self.free_weight[rack_id]:
+            return [f'Превышена допустимая нагрузка на стеллаж. '
+                    f'Доступно: {self.free_weight[rack_id]} кг']
+        if product.get_volume() * quantity > self.free_volume[rack_id]:
+            return [f'Недостаточно места на стеллаже. '
+                    f'Доступно: {self.free_volume[rack_id] / 1000:.2f} л']
+        if self.slots is not None:
+            error = self.slots.reserve(rack, product, quantity)
+            if error:
+                return [error]
+
+        self.unplaced[batch_id] -= quantity
+        self.free_weight[rack_id] -= product.weight * quantity
+        self.free_volume[rack_id] -= product.get_volume() * quantity
+        return []
+
+    def reserve_issue(self, product, quantity):
+        """Проверяет наличие товара и резервирует его; возвращает список ошибок"""
+        available = self.stock.get(product.pk, 0)
+        if quantity > available:
+            return [f'Недостаточно товара на складе. Доступно: {available}']
+        self.stock[product.pk] = available - quantity
+        return []
+
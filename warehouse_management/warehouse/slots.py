@@ -0,0 +1,243 @@
+"""Размещение по ячейкам полок с битовыми картами занятости.
+
+Объем и нагрузка стеллажа - общий пул: товар "помещается", даже если
+свободное место раздроблено между чужими коробками. При SLOT_ALLOCATION
+стеллаж с полками (Shelf) принимает товар только на непрерывный участок
+свободных ячеек одной полки; стеллажи без полок учитываются по-прежнему.
+
+Полка делится по длине стеллажа на slots одинаковых ячеек. Товар ставится
+полосами: полоса - ceil(длина товара / длина ячейки) соседних ячеек на всю
+глубину стеллажа, в нее входит (глубина // ширина товара) * (высота полки //
+высота товара) единиц. Размещение занимает целое число полос одним
+участком и хранит его в Placement (shelf, first_slot, slot_count).
+
+Карта полки - Shelf.occupancy, бит i - ячейка i. В памяти это целое число
+Python, так что поиск участка из n свободных ячеек - log2(n) сдвигов и AND
+по всей полке, без цикла по ячейкам. SlotMap читает полки набора стеллажей
+одним запросом и сохраняет измененные карты условным UPDATE по прочитанному
+значению: если карту успел изменить конкурент, SlotConflict откатывает
+транзакцию, и retry_on_conflict повторяет операцию.
+
+Источник истины - участки активных размещений; rebuild() пересчитывает
+карты по ним (после правок в админке или массовых изменений).
+"""
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import OperationalError
+from django.db.models import F
+
+from .models import Placement, Shelf
+
+
+class SlotConflict(OperationalError):
+    """Карта полки изменена конкурентной операцией после чтения; операция повторяется"""
+
+
+def is_enabled():
+    return getattr(settings, 'SLOT_ALLOCATION', False)
+
+
+def to_bytes(bits, slots):
+    return bits.to_bytes((slots + 7) // 8, 'little')
+
+
+def run_mask(first, count):
+    return ((1 << count) - 1) << first
+
+
+def find_run(occupied, slots, length):
+    """Первая ячейка непрерывного свободного участка из length ячеек или None"""
+    if length <= 0 or length > slots:
+        return None
+    starts = ~occupied & ((1 << slots) - 1)
+    # Бит i остается, пока свободны все ячейки i..i+covered-1
+    covered = 1
+    while covered < length and starts:
+        step = min(covered, length - covered)
+        starts &= starts >> step
+        covered += step
+    if not starts:
+        return None
+    return (starts & -starts).bit_length() - 1
+
+
+def longest_run(occupied, slots):
+    """Длина самого длинного свободного участка полки"""
+    free = ~occupied & ((1 << slots) - 1)
+    best = 0
+    while free:
+        free >>= (free & -free).bit_length() - 1
+        run = (free ^ (free + 1)).bit_length() - 1
+        best = max(best, run)
+        free >>= run
+    return best
+
+
+def lane(shelf, rack, product):
+    """(ячеек в полосе, единиц в полосе) товара на полке или None, если не помещается"""
+    if (shelf.slots <= 0 or product.length > rack.length or product.width > rack.width
+            or product.height > shelf.height or product.width <= 0 or product.height <= 0):
+        return None
+    slot_length = rack.length / shelf.slots
+    # Поправка на погрешность float: товар ровно в 2 ячейки не должен занять 3
+    width = max(1, math.ceil(product.length / slot_length - 1e-9))
+    per_lane = int(rack.width // product.width) * int(shelf.height // product.height)
+    return width, per_lane
+
+
+class SlotMap:
+    """Полки набора стеллажей с картами занятости в памяти"""
+
+    def __init__(self, rack_ids):
+        self.shelves = defaultdict(list)
+        self.by_pk = {}
+        self.bits = {}
+        self._loaded = {}
+        for shelf in Shelf.objects.filter(rack__in=set(rack_ids)).select_related('rack').order_by(
+                'rack', 'level'):
+            self.shelves[shelf.rack_id].append(shelf)
+            self.by_pk[shelf.pk] = shelf
+            self.bits[shelf.pk] = shelf.bits
+            # Значение для условного UPDATE - ровно то, что прочитано
+            self._loaded[shelf.pk] = bytes(shelf.occupancy)
+
+    def has_shelves(self, rack):
+        return bool(self.shelves.get(rack.pk))
+
+    def _options(self, rack, product):
+        for shelf in self.shelves.get(rack.pk, ()):
+            fit = lane(shelf, rack, product)
+            if fit and fit[1] > 0:
+                yield shelf, *fit
+
+    def capacity(self, rack, product):
+        """Сколько единиц поместится одним размещением; None - стеллаж без полок"""
+        if not self.has_shelves(rack):
+            return None
+        return max((longest_run(self.bits[shelf.pk], shelf.slots) // width * per_lane
+                    for shelf, width, per_lane in self._options(rack, product)), default=0)
+
+    def allocate(self, rack, product, quantity):
+        """Занимает участок под quantity единиц на нижней подходящей полке.
+
+        Возвращает (полка, первая ячейка, ячеек) или None.
+        """
+        for shelf, width, per_lane in self._options(rack, product):
+            count = math.ceil(quantity / per_lane) * width
+            first = find_run(self.bits[shelf.pk], shelf.slots, count)
+            if first is not None:
+                self.bits[shelf.pk] |= run_mask(first, count)
+                return shelf, first, count
+        return None
+
+    def reserve(self, rack, product, quantity):
+        """Проверяет размещение и занимает участок в памяти; текст ошибки или None"""
+        if not self.has_shelves(rack) or self.allocate(rack, product, quantity) is not None:
+            return None
+        return (f'На полках стеллажа нет непрерывного свободного участка под {quantity} ед. '
+                f'Поместится: {self.capacity(rack, product)} ед.')
+
+    def release(self, shelf_id, first, count):
+        if shelf_id in self.bits and count:
+            self.bits[shelf_id] &= ~run_mask(first, count)
+
+    def save(self):
+        """Сохраняет измененные карты; SlotConflict, если карту изменили после чтения"""
+        for pk, bits in self.bits.items():
+            shelf = self.by_pk[pk]
+            occupancy = to_bytes(bits, shelf.slots)
+            if occupancy == self._loaded[pk]:
+                continue
+            if not Shelf.objects.filter(pk=pk, occupancy=self._loaded[pk]).update(occupancy=occupancy):
+                raise SlotConflict(f'Занятость полки #{pk} изменена конкурентной операцией')
+            self._loaded[pk] = occupancy
+
+
+def assign(slot_map, placement):
+    """Занимает ячейки под новое размещение (до bulk_create).
+
+    Проверка при вводе (PlacementForm, CapacitySnapshot) уже нашла участок,
+    поэтому его отсутствие значит, что полку занял конкурент.
+    """
+    rack = placement.rack
+    if not slot_map.has_shelves(rack):
+        return
+    allocation = slot_map.allocate(rack, placement.product, placement.quantity)
+    if allocation is None:
+        raise SlotConflict(f'Ячейки стеллажа {rack.name} заняты конкурентной операцией')
+    placement.shelf, placement.first_slot, placement.slot_count = allocation
+
+
+def shrink(placements, products):
+    """Освобождает ячейки после выдачи.
+
+    Выданное целиком размещение освобождает весь участок, частично - полосы
+    сверх нужных остатку. products - {pk: товар} списанных размещений.
+    """
+    placements = [placement for placement in placements if placement.slot_count]
+    if not placements:
+        return
+    slot_map = SlotMap({placement.rack_id for placement in placements})
+    for placement in placements:
+        shelf = slot_map.by_pk.get(placement.shelf_id)
+        keep = 0
+        if placement.is_active and shelf is not None:
+            fit = lane(shelf, shelf.rack, products[placement.product_id])
+            if fit is None or fit[1] <= 0:
+                # Полку переделали под товаром: участок остается занятым целиком
+                keep = placement.slot_count
+            else:
+                width, per_lane = fit
+                keep = min(placement.slot_count, math.ceil(placement.quantity / per_lane) * width)
+        slot_map.release(placement.shelf_id, placement.first_slot + keep, placement.slot_count - keep)
+        placement.slot_count = keep
+    slot_map.save()
+    Placement.objects.bulk_update(placements, ['slot_count'])
+
+
+def equip(rack, levels, slots):
+    """Делит стеллаж на levels одинаковых полок по slots ячеек.
+
+    Активные размещения стеллажа раскладываются по ячейкам, крупные первыми;
+    возвращает размещения, которым не нашлось участка.
+    """
+    rack.shelves.all().delete()
+    Shelf.objects.bulk_create([
+        Shelf(rack=rack, level=level, height=rack.height / levels, slots=slots)
+        for level in range(1, levels + 1)
+    ])
+    placements = sorted(rack.placements.filter(is_active=True).select_related('product'),
+                        key=lambda placement: placement.quantity * placement.product.get_volume(),
+                        reverse=True)
+    slot_map = SlotMap([rack.pk])
+    unplaced = []
+    for placement in placements:
+        allocation = slot_map.allocate(rack, placement.product, placement.quantity)
+        if allocation is None:
+            allocation = (None, None, 0)
+            unplaced.append(placement)
+        placement.shelf, placement.first_slot, placement.slot_count = allocation
+    Placement.objects.bulk_update(placements, ['shelf', 'first_slot', 'slot_count'])
+    slot_map.save()
+    return unplaced
+
+
+def rebuild(shelves=None):
+    """Пересчитывает карты полок по участкам активных размещений; возвращает число полок"""
+    shelves = dict((shelves if shelves is not None else Shelf.objects.all()).values_list('pk', 'slots'))
+    bits = dict.fromkeys(shelves, 0)
+    for shelf_id, first, count in Placement.objects.filter(
+            shelf__in=shelves, is_active=True, slot_count__gt=0,
+            shelf__rack=F('rack')).values_list('shelf', 'first_slot', 'slot_count'):
+        bits[shelf_id] |= run_mask(first, count)
+    Shelf.objects.bulk_update([Shelf(pk=pk, occupancy=to_bytes(bits[pk], slots))
+                               for pk, slots in shelves.items()], ['occupancy'])
+    return len(shelves)
+
+
+def track_placement_change(sender, instance, raw=False, **kwargs):
+    """post_save/post_delete: размещение изменили через save() или удалили"""
+    if not raw and instance.shelf_id:
+        rebuild(Shelf.objects.filter(pk=instance.shelf_id))
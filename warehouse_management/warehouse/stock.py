@@ -0,0 +1,163 @@
+"""Шардированные счетчики остатков товаров.
+
+Доступный к выдаче остаток товара хранится в STOCK_SHARDS строках StockShard
+и равен их сумме: это активные размещения за вычетом действующих резервов
+(резерв списывает количество со счетчика при создании и возвращает при
+снятии или истечении, см. reservations.py).
+Приход увеличивает случайный шард, резервирование при выдаче уменьшает
+шарды условными UPDATE (quantity >= взятого), начиная со случайного. Поэтому
+одновременные выдачи одного популярного артикула обновляют разные строки,
+а проверка наличия читает несколько строк вместо агрегата по размещениям.
+
+Шарды товара создаются сигналом post_save товара. Счетчики поддерживаются
+складскими операциями (services) и сигналами сохранения размещения; массовые
+вставки и удаления размещений в обход этих путей (seed, ручное удаление)
+требуют пересчета: rebuild() или команда rebuild_stock_counters.
+"""
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+
+from .models import Placement, Product, Reservation, StockShard
+
+
+def get_shard_count():
+    return getattr(settings, 'STOCK_SHARDS', 8)
+
+
+def ensure_shards(product_ids):
+    StockShard.objects.bulk_create(
+        [StockShard(product_id=product_id, shard=shard)
+         for product_id in product_ids for shard in range(get_shard_count())],
+        ignore_conflicts=True)
+
+
+def _update_shards(deltas, shards):
+    """Прибавляет {товар: изменение} к выбранным шардам {товар: шард} одним UPDATE"""
+    condition = Q()
+    for product_id in deltas:
+        condition |= Q(product_id=product_id, shard=shards[product_id])
+    queryset = StockShard.objects.filter(condition)
+    updated = queryset.update(quantity=F('quantity') + Case(
+        *[When(product_id=product_id, then=Value(delta)) for product_id, delta in deltas.items()],
+        output_field=IntegerField()))
+    return queryset, updated
+
+
+def add_many(deltas):
+    """Приход (или принудительное списание при отрицательном изменении) по {товар: изменение}"""
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    shards = {product_id: random.randrange(get_shard_count()) for product_id in deltas}
+    queryset, updated = _update_shards(deltas, shards)
+    if updated == len(deltas):
+        return
+    # Выбранного шарда нет (товар создан в обход сигнала): создаем недостающие
+    present = set(queryset.values_list('product_id', flat=True))
+    missing = {product_id: delta for product_id, delta in deltas.items() if product_id not in present}
+    ensure_shards(missing)
+    _update_shards(missing, shards)
+
+
+def add(product_id, quantity):
+    add_many({product_id: quantity})
+
+
+def reserve(product_id, quantity, passes=3):
+    """Списывает до quantity единиц со счетчиков; возвращает списанное количество.
+
+    Каждый шард уменьшается условным UPDATE, так что конкурент, успевший
+    опустошить шард, не уводит его в минус: такой шард перечитывается
+    на следующем проходе.
+    """
+    remaining = quantity
+    for _ in range(passes):
+        shards = list(StockShard.objects.filter(product_id=product_id, quantity__gt=0)
+                      .values_list('pk', 'quantity'))
+        if not shards:
+            break
+        start = random.randrange(len(shards))
+        for pk, available in shards[start:] + shards[:start]:
+            take = min(available, remaining)
+            if StockShard.objects.filter(pk=pk, quantity__gte=take).update(
+                    quantity=F('quantity') - take):
+                remaining -= take
+            if not remaining:
+                return quantity
+    return quantity - remaining
+
+
+def release(product_id, quantity):
+    """Возвращает неиспользованный резерв"""
+    add(product_id, quantity)
+
+
+def available(product_ids):
+    """Остатки {товар: количество} по сумме шардов, одним запросом"""
+    return dict(StockShard.objects.filter(product_id__in=product_ids).values('product')
+                .annotate(total=Sum('quantity')).values_list('product', 'total'))
+
+
+def rebuild(product_ids=None):
+    """Пересчитывает счетчики по размещениям и резервам; возвращает число товаров"""
+    placements = Placement.objects.filter(is_active=True)
+    reservations = Reservation.objects.filter(status=Reservation.ACTIVE)
+    shards = StockShard.objects.all()
+    if product_ids is not None:
+        placements = placements.filter(product_id__in=product_ids)
+        reservations = reservations.filter(product_id__in=product_ids)
+        shards = shards.filter(product_id__in=product_ids)
+    totals = defaultdict(int, placements.values('product').annotate(total=Sum('quantity'))
+                         .values_list('product', 'total'))
+    for product_id, reserved in (reservations.values('product').annotate(total=Sum('quantity'))
+                                 .values_list('product', 'total')):
+        totals[product_id] -= reserved
+    if product_ids is None:
+        product_ids = Product.objects.values_list('pk', flat=True)
+    shards.delete()
+    StockShard.objects.bulk_create(
+        [StockShard(product_id=product_id, shard=shard,
+                    quantity=totals.get(product_id, 0) if shard == 0 else 0)
+         for product_id in product_ids for shard in range(get_shard_count())],
+        batch_size=1000)
+    return len(totals)
+
+
+def create_shards(sender, instance, created=False, raw=False, **kwargs):
+    """post_save товара: шарды создаются сразу, чтобы приход не искал их"""
+    if created and not raw:
+        ensure_shards([instance.pk])
+
+
+def _counted(placement):
+    return placement.quantity if placement.is_active else 0
+
+
+def remember_stock(sender, instance, raw=False, **kwargs):
+    """pre_save: запоминает учтенный в счетчиках остаток и стеллаж размещения.
+
+    Прежние значения читаются из базы, а не из объекта: объект мог быть
+    загружен до списаний, выполненных UPDATE в обход save().
+    """
+    instance._counted_stock = instance._counted_rack = None
+    if raw or instance._state.adding:
+        return
+    row = Placement.objects.filter(pk=instance.pk).values_list(
+        'product_id', 'quantity', 'is_active', 'rack_id').first()
+    if row is not None:
+        product_id, quantity, is_active, instance._counted_rack = row
+        instance._counted_stock = (product_id, quantity if is_active else 0)
+
+
+def track_placement_save(sender, instance, raw=False, **kwargs):
+    """post_save: переносит в счетчики изменение остатка размещения"""
+    if raw:
+        return
+    product_id, before = instance._counted_stock or (instance.product_id, 0)
+    deltas = defaultdict(int)
+    deltas[product_id] -= before
+    deltas[instance.product_id] += _counted(instance)
+    add_many(deltas)
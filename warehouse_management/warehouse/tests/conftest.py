@@ -1,7 +1,26 @@
 import pytest
 from django.contrib.auth.models import User
 from django.utils import timezone
+from warehouse import metrics, search
+from warehouse.middleware import get_query_budget
 from warehouse.models import Category, Product, Rack, Batch
+from warehouse.seed import seed_warehouse
+
+
+@pytest.fixture(scope='session')
+def django_db_setup(django_db_setup, django_db_blocker):
+    """Тесты идут без миграций (--nomigrations): индекс FTS5 из миграции создается здесь"""
+    with django_db_blocker.unblock():
+        search.create_index()
+
+
+@pytest.fixture(autouse=True)
+def metrics_dir(settings, tmp_path):
+    """Каждый тест пишет метрики в собственный каталог"""
+    settings.METRICS_DIR = tmp_path / 'metrics'
+    metrics.store.reset()
+    yield settings.METRICS_DIR
+    metrics.store.reset()
 
 
 @pytest.fixture
@@ -47,3 +66,36 @@ def batch(db, product):
         arrival_date=timezone.now(),
         supplier="Поставщик ООО"
     )
+
+
+@pytest.fixture
+def seeded_warehouse(db, user):
+    """Небольшой, но не тривиальный склад: N+1 проявляется как рост числа запросов"""
+    return seed_warehouse(categories=3, products=30, racks=8, batches=30,
+                          placements=60, journal=60)
+
+
+@pytest.fixture
+def assert_within_budget(request):
+    """Проверяет, что ответ уложился в бюджет SQL-запросов своего представления.
+
+    Бюджет берется из settings.QUERY_BUDGETS по имени маршрута либо из
+    маркера ``@pytest.mark.query_budget(n)`` на тесте.
+    """
+    marker = request.node.get_closest_marker('query_budget')
+
+    def _check(response):
+        view_name = response.resolver_match.view_name
+        budget = marker.args[0] if marker else get_query_budget(view_name)
+        assert budget is not None, f'Для {view_name} не задан бюджет запросов'
+        queries = int(response['X-DB-Queries'])
+        assert queries <= budget, (
+            f'{view_name}: {queries} SQL-запросов при бюджете {budget}, '
+            f'повторов: {response["X-DB-Duplicates"]}')
+        return queries
+    return _check
+
+
+@pytest.fixture
+def staff_user(db):
+    return User.objects.create_user(username='staff', password='testpass123', is_staff=True)
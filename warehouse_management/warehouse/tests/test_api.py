@@ -0,0 +1,169 @@
+import base64
+import json
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from warehouse import journal, reservations, services
+from warehouse.models import Batch, Placement, Rack, WarehouseJournal
+
+
+def _post(client, name, items, **payload):
+    return client.post(reverse(name), json.dumps({'items': items, **payload}),
+                       content_type='application/json')
+
+
+@pytest.fixture
+def api_client(client, user):
+    client.force_login(user)
+    return client
+
+
+@pytest.fixture
+def racks(db):
+    return [Rack.objects.create(name=f'API-{i}', max_load=100, length=100, width=50, height=200)
+            for i in range(3)]
+
+
+@pytest.mark.django_db
+def test_bulk_batches_by_id_and_sku(api_client, product):
+    response = _post(api_client, 'warehouse:api_batches', [
+        {'product': product.pk, 'quantity': 10, 'supplier': 'ООО Альфа'},
+        {'sku': product.sku, 'quantity': 5, 'supplier': 'ООО Бета', 'notes': 'паллета 2'},
+        {'sku': 'NOPE', 'quantity': 5, 'supplier': 'ООО Бета'},
+        {'product': product.pk, 'quantity': 0},
+    ])
+    assert response.status_code == 200
+    data = response.json()
+    assert (data['version'], data['ok'], data['failed']) == (1, 2, 2)
+    assert [r['status'] for r in data['results']] == ['ok', 'ok', 'error', 'error']
+    assert data['results'][2]['errors']['__all__'][0]['message'] == 'Товар не найден'
+    assert set(data['results'][3]['errors']) == {'quantity', 'supplier'}
+    assert Batch.objects.get(pk=data['results'][1]['id']).notes == 'паллета 2'
+
+
+@pytest.mark.django_db
+def test_bulk_placements_share_one_snapshot(api_client, batch, racks):
+    response = _post(api_client, 'warehouse:api_placements', [
+        {'batch': batch.pk, 'rack': racks[0].pk, 'quantity': 30},
+        {'batch': batch.pk, 'rack': racks[1].pk, 'quantity': 30},  # в партии осталось 20
+        {'batch': batch.pk, 'rack': racks[1].pk, 'quantity': 20},
+        {'batch': 999, 'rack': racks[2].pk, 'quantity': 1},
+    ])
+    results = response.json()['results']
+    assert [r['status'] for r in results] == ['ok', 'error', 'ok', 'error']
+    assert 'Доступно: 20' in results[1]['errors']['__all__'][0]['message']
+    assert Placement.objects.filter(batch=batch).count() == 2
+    assert WarehouseJournal.objects.filter(operation_type='IN', operator='testuser').count() == 2
+
+
+@pytest.mark.django_db
+def test_bulk_placement_queries_do_not_grow(api_client, product, racks):
+    def place(count):
+        batches = Batch.objects.bulk_create([
+            Batch(product=product, quantity=1, supplier='ООО', arrival_date=timezone.now())
+            for _ in range(count)])
+        items = [{'batch': b.pk, 'rack': racks[i % 3].pk, 'quantity': 1}
+                 for i, b in enumerate(batches)]
+        with CaptureQueriesContext(connection) as queries:
+            assert _post(api_client, 'warehouse:api_placements', items).json()['ok'] == count
+        return len(queries)
+
+    assert place(2) == place(40)
+
+
+@pytest.mark.django_db
+def test_atomic_batch_is_all_or_nothing(api_client, batch, racks):
+    response = _post(api_client, 'warehouse:api_placements', [
+        {'batch': batch.pk, 'rack': racks[0].pk, 'quantity': 10},
+        {'batch': batch.pk, 'rack': 999, 'quantity': 10},
+    ], atomic=True)
+    assert response.status_code == 422
+    data = response.json()
+    assert not data['applied']
+    assert [r['status'] for r in data['results']] == ['skipped', 'error']
+    assert not Placement.objects.exists()
+
+
+@pytest.mark.django_db
+def test_bulk_issue_is_fifo_across_lines(api_client, product, batch, racks):
+    older = Placement.objects.create(rack=racks[0], product=product, batch=batch, quantity=5,
+                                     date_placed=timezone.now() - timedelta(days=1))
+    newer = Placement.objects.create(rack=racks[1], product=product, batch=batch, quantity=10)
+    response = _post(api_client, 'warehouse:api_issues', [
+        {'sku': product.sku, 'quantity': 3, 'operator': 'Терминал 7'},
+        {'product': product.pk, 'quantity': 4},
+        {'product': product.pk, 'quantity': 9},  # осталось 8
+    ])
+    results = response.json()['results']
+    assert [r['status'] for r in results] == ['ok', 'ok', 'error']
+    assert results[1] == {'index': 1, 'status': 'ok', 'product': product.pk, 'issued': 4,
+                          'racks': [racks[0].pk, racks[1].pk]}
+    older.refresh_from_db()
+    newer.refresh_from_db()
+    assert not older.is_active
+    assert (newer.quantity, newer.is_active) == (8, True)
+    assert list(WarehouseJournal.objects.filter(operation_type='OUT').order_by('pk').values_list(
+        'quantity', 'operator')) == [(3, 'Терминал 7'), (2, 'testuser'), (2, 'testuser')]
+
+
+@pytest.mark.django_db
+def test_bulk_issue_respects_reservations(api_client, product, batch, racks):
+    Placement.objects.create(rack=racks[0], product=product, batch=batch, quantity=10)
+    with journal.unit_of_work():
+        reservations.create(product, 7, 'З-1', 'Кладовщик')
+    response = _post(api_client, 'warehouse:api_issues', [
+        {'product': product.pk, 'quantity': 5},
+        {'product': product.pk, 'quantity': 3},
+    ])
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert [r['status'] for r in results] == ['error', 'ok']
+    assert 'Доступно: 3' in results[0]['errors']['__all__'][0]['message']
+    assert Placement.objects.get().quantity == 7
+
+
+@pytest.mark.django_db(transaction=True)
+def test_exhausted_conflict_retries_return_409(api_client, product, batch, racks, monkeypatch):
+    Placement.objects.create(rack=racks[0], product=product, batch=batch, quantity=10)
+    monkeypatch.setattr(services.time, 'sleep', lambda seconds: None)
+
+    def conflict(*args):
+        raise services.StockConflict('Остаток изменен конкурентной выдачей')
+
+    monkeypatch.setattr(services, 'issue_lines', conflict)
+    response = _post(api_client, 'warehouse:api_issues', [{'product': product.pk, 'quantity': 1}])
+    assert response.status_code == 409
+    assert 'повторите запрос' in response.json()['error']
+
+
+@pytest.mark.django_db
+def test_api_auth_and_request_errors(client, user, product):
+    url = reverse('warehouse:api_batches')
+    item = {'product': product.pk, 'quantity': 1, 'supplier': 'ООО'}
+    response = _post(client, 'warehouse:api_batches', [item])
+    assert response.status_code == 401
+    assert response['WWW-Authenticate'].startswith('Basic')
+
+    token = base64.b64encode(b'testuser:testpass123').decode()
+    auth = {'HTTP_AUTHORIZATION': f'Basic {token}'}
+    response = client.post(url, json.dumps({'items': [item]}), content_type='application/json', **auth)
+    assert response.json()['ok'] == 1
+    assert '_auth_user_id' not in client.session
+
+    assert client.post(url, {'items': '[]'}, **auth).status_code == 415
+    assert client.post(url, '{', content_type='application/json', **auth).status_code == 400
+    assert client.post(url, '{"items": []}', content_type='application/json', **auth).status_code == 400
+    assert client.get(url, **auth).status_code == 405
+
+
+@pytest.mark.django_db
+def test_api_rejects_oversized_batches(api_client, settings, product):
+    settings.API_BULK_MAX_ITEMS = 2
+    items = [{'product': product.pk, 'quantity': 1, 'supplier': 'ООО'}] * 3
+    assert _post(api_client, 'warehouse:api_batches', items).status_code == 413
+    assert not Batch.objects.exists()
@@ -0,0 +1,84 @@
+"""Async-представления через ASGI (AsyncClient): запросы ORM идут в отдельном потоке,
+поэтому тестам нужна транзакционная БД."""
+import pytest
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.test import AsyncClient
+from django.urls import reverse
+
+from warehouse import views
+from warehouse.metrics import MetricsMiddleware
+from warehouse.middleware import QueryBudgetMiddleware
+from warehouse.profiling import ProfilerMiddleware
+
+ASYNC_VIEWS = [
+    views.DashboardView, views.SearchProductView, views.WarehouseJournalView,
+    views.RackListView, views.ProductAutocompleteView, views.RackAutocompleteView,
+]
+
+
+@pytest.mark.parametrize('view_class', ASYNC_VIEWS)
+def test_read_views_are_async(view_class):
+    assert view_class.view_is_async
+    assert iscoroutinefunction(view_class.as_view())
+
+
+@pytest.mark.parametrize('middleware', [MetricsMiddleware, QueryBudgetMiddleware, ProfilerMiddleware])
+def test_middleware_keeps_async_chain(middleware):
+    async def get_response(request):
+        return None
+
+    assert iscoroutinefunction(middleware(get_response))
+    assert not iscoroutinefunction(middleware(lambda request: None))
+
+
+def _get(user, name, **params):
+    async def run():
+        client = AsyncClient()
+        if user is not None:
+            await client.aforce_login(user)
+        return await client.get(reverse(name), params)
+    return async_to_sync(run)()
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('name,params', [
+    ('warehouse:dashboard', {}),
+    ('warehouse:rack_list', {}),
+    ('warehouse:journal', {'page': 2}),
+    ('warehouse:search_product', {'q': 'Товар'}),
+])
+def test_async_pages_under_asgi(user, seeded_warehouse, assert_within_budget, name, params):
+    response = _get(user, name, **params)
+    assert response.status_code == 200
+    # Запросы из потока async ORM тоже попадают в счетчик бюджета
+    assert assert_within_budget(response) > 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_journal_page_has_navigation(user, seeded_warehouse):
+    response = _get(user, 'warehouse:journal')
+    entries = response.context['entries']
+    assert entries.number == 1
+    assert len(entries) == 50
+    assert entries.paginator.num_pages > 1
+    assert 'page=2' in response.content.decode()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_autocomplete_and_login(user, product, rack):
+    results = _get(user, 'warehouse:product_autocomplete', q='смарт').json()['results']
+    assert [item['sku'] for item in results] == ['SMART-001']
+    results = _get(user, 'warehouse:rack_autocomplete', q='Стеллаж').json()['results']
+    assert [item['text'] for item in results] == ['Стеллаж-A1']
+
+    response = _get(None, 'warehouse:dashboard')
+    assert response.status_code == 302
+    assert response['Location'].startswith('/login/?next=')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_request_profiling(staff_user, settings, tmp_path):
+    settings.PROFILING_DIR = tmp_path / 'profiles'
+    response = _get(staff_user, 'warehouse:dashboard', _profile='1')
+    profile_id = response['X-Profile-Id']
+    assert (settings.PROFILING_DIR / f'{profile_id}.prof').exists()
@@ -0,0 +1,78 @@
+import pytest
+from django.urls import reverse
+
+from warehouse.forms import IssueForm
+from warehouse.models import Product, Rack, Placement
+
+
+@pytest.fixture
+def catalog(db, category):
+    return Product.objects.bulk_create([
+        Product(name=f"Кабель {i:03d}", category=category, sku=f"CB-{i:03d}",
+                length=10, width=5, height=2, weight=0.1)
+        for i in range(60)
+    ])
+
+
+@pytest.mark.django_db
+def test_issue_page_does_not_render_catalog(client, user, catalog):
+    client.force_login(user)
+    response = client.get(reverse('warehouse:issue_product'))
+    assert response.status_code == 200
+    html = response.content.decode()
+    assert 'data-autocomplete-url="{}"'.format(reverse('warehouse:product_autocomplete')) in html
+    assert 'Кабель 000' not in html
+
+
+@pytest.mark.django_db
+def test_bound_form_renders_only_selected_option(catalog):
+    selected = catalog[7]
+    html = str(IssueForm(data={'product': selected.pk, 'quantity': 1})['product'])
+    assert html.count('<option') == 2
+    assert f'value="{selected.pk}" selected' in html
+
+
+@pytest.mark.django_db
+def test_issue_form_validates_submitted_id(catalog, rack, batch):
+    Placement.objects.create(batch=batch, rack=rack, product=batch.product, quantity=5)
+    form = IssueForm(data={'product': batch.product.pk, 'quantity': 3, 'operator': 'Иванов'})
+    assert form.is_valid(), form.errors
+    form = IssueForm(data={'product': 999999, 'quantity': 3, 'operator': 'Иванов'})
+    assert 'product' in form.errors
+
+
+@pytest.mark.django_db
+def test_product_autocomplete_prefix_and_stock(client, user, catalog, rack, batch):
+    Placement.objects.create(batch=batch, rack=rack, product=batch.product, quantity=7)
+    client.force_login(user)
+    url = reverse('warehouse:product_autocomplete')
+
+    results = client.get(url, {'q': 'CB-01'}).json()['results']
+    assert sorted(item['sku'] for item in results) == [f'CB-{i:03d}' for i in range(10, 20)]
+
+    results = client.get(url, {'q': 'смарт'}).json()['results']
+    assert results == [{'id': batch.product.pk, 'text': str(batch.product),
+                        'sku': 'SMART-001', 'available': 7}]
+
+    assert len(client.get(url, {'q': 'кабель'}).json()['results']) == 20
+    assert client.get(url).json()['results'] == []
+
+
+@pytest.mark.django_db
+def test_rack_autocomplete_only_active_by_prefix(client, user, rack):
+    Rack.objects.create(name="Стеллаж-B1", max_load=50, length=10, width=10, height=10)
+    Rack.objects.create(name="Стеллаж-A2", max_load=50, length=10, width=10, height=10,
+                        is_active=False)
+    client.force_login(user)
+    url = reverse('warehouse:rack_autocomplete')
+
+    results = client.get(url, {'q': 'Стеллаж-A'}).json()['results']
+    assert [item['text'] for item in results] == ['Стеллаж-A1']
+    assert results[0]['available_weight'] == 100
+    assert len(client.get(url).json()['results']) == 2
+
+
+@pytest.mark.django_db
+def test_autocomplete_requires_login(client):
+    response = client.get(reverse('warehouse:product_autocomplete'), {'q': 'x'})
+    assert response.status_code == 302
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from warehouse.benchmark import compare, discover_urls, percentile, run_benchmark
+from warehouse.models import Product, Rack, Batch, Placement, WarehouseJournal
+
+
+SMALL_SCALE = ['--categories', '2', '--products', '20', '--racks', '5',
+               '--batches', '30', '--placements', '40', '--journal', '80']
+
+
+def _snapshot():
+    return (
+        list(Product.objects.order_by('sku').values_list('sku', 'length', 'weight')),
+        list(Placement.objects.order_by('pk').values_list(
+            'rack__name', 'product__sku', 'quantity')),
+    )
+
+
+@pytest.mark.django_db
+def test_seed_warehouse_counts_and_capacity():
+    call_command('seed_warehouse', *SMALL_SCALE)
+
+    assert Product.objects.count() == 20
+    assert Rack.objects.count() == 5
+    assert Batch.objects.count() == 30
+    assert WarehouseJournal.objects.count() == 80
+    assert 0 < Placement.objects.count() <= 40
+    for rack in Rack.objects.all():
+        assert rack.available_volume() >= 0
+        assert rack.available_weight() >= 0
+    for batch in Batch.objects.all():
+        assert batch.get_initial_remaining() >= 0
+
+
+@pytest.mark.django_db
+def test_seed_warehouse_is_reproducible():
+    call_command('seed_warehouse', *SMALL_SCALE, '--seed', '7')
+    first = _snapshot()
+    call_command('seed_warehouse', *SMALL_SCALE, '--seed', '7', '--flush')
+    assert _snapshot() == first
+
+
+@pytest.mark.django_db
+def test_seed_warehouse_refuses_to_mix_with_existing_data(product):
+    with pytest.raises(CommandError):
+        call_command('seed_warehouse', *SMALL_SCALE)
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile([], 95) == 0.0
+
+
+@pytest.mark.django_db
+def test_benchmark_covers_every_url(staff_user, seeded_warehouse):
+    names = {name for name, _ in discover_urls()}
+    assert {'dashboard', 'product_update', 'place_batch', 'journal'} <= names
+
+    data = run_benchmark(staff_user, repeat=2, warmup=0, host='testserver')
+    assert set(data['results']) == names
+    for result in data['results'].values():
+        # 204 - поток живых событий, который под WSGI не отдается
+        assert result['status'] in (200, 204, 302)
+        assert result['p95_ms'] >= result['p50_ms']
+    assert data['meta']['dataset']['products'] == 30
+
+
+def test_compare_flags_regressions():
+    baseline = {'results': {'dashboard': {'p95_ms': 10.0, 'queries': 9}}}
+    same = {'results': {'dashboard': {'p95_ms': 11.0, 'queries': 9}}}
+    worse = {'results': {'dashboard': {'p95_ms': 20.0, 'queries': 30}}}
+    assert compare(baseline, same) == []
+    assert len(compare(baseline, worse)) == 2
+
+
+@pytest.mark.django_db
+def test_bench_views_command_saves_baseline(tmp_path, seeded_warehouse, settings):
+    settings.ALLOWED_HOSTS = ['localhost']
+    path = tmp_path / 'baseline.json'
+    call_command('bench_views', '--repeat', '1', '--warmup', '0',
+                 '--url-name', 'dashboard', '--save', str(path))
+    data = json.loads(path.read_text(encoding='utf-8'))
+    assert list(data['results']) == ['dashboard']
+    call_command('bench_views', '--repeat', '1', '--warmup', '0',
+                 '--url-name', 'dashboard', '--compare', str(path), '--tolerance', '100')
@@ -0,0 +1,117 @@
+import threading
+
+import pytest
+from django.contrib import messages
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.db import OperationalError, connection, transaction
+
+from warehouse import journal, services
+from warehouse.views import notify
+from warehouse.models import Batch, Placement, Product, Rack, WarehouseJournal
+
+
+def test_retry_on_conflict_is_bounded(settings, monkeypatch):
+    settings.CONFLICT_RETRY_ATTEMPTS = 3
+    monkeypatch.setattr(services.time, 'sleep', lambda seconds: None)
+    calls = []
+
+    @services.retry_on_conflict
+    def locked():
+        calls.append(1)
+        raise OperationalError('database is locked')
+
+    with pytest.raises(services.ConflictRetriesExhausted):
+        locked()
+    assert len(calls) == 3
+
+
+def test_only_lock_errors_are_retried(settings, monkeypatch):
+    monkeypatch.setattr(services.time, 'sleep', lambda seconds: None)
+    calls = []
+
+    @services.retry_on_conflict
+    def broken():
+        calls.append(1)
+        raise OperationalError('no such table: warehouse_rack')
+
+    with pytest.raises(OperationalError) as error:
+        broken()
+    assert not isinstance(error.value, services.ConflictRetriesExhausted)
+    assert len(calls) == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_retry_drops_messages_of_failed_attempt(rf, monkeypatch):
+    monkeypatch.setattr(services.time, 'sleep', lambda seconds: None)
+    request = rf.post('/')
+    request._messages = CookieStorage(request)
+    messages.info(request, 'До операции')
+    calls = []
+
+    @services.retry_on_conflict
+    @journal.unit_of_work()
+    def post(request):
+        calls.append(1)
+        notify(request, messages.SUCCESS, f'Попытка {len(calls)}')
+        if len(calls) == 1:
+            raise OperationalError('database is locked')
+
+    post(request)
+    assert [message.message for message in request._messages] == ['До операции', 'Попытка 2']
+
+
+@pytest.mark.django_db
+def test_no_retry_inside_outer_transaction(settings):
+    calls = []
+
+    @services.retry_on_conflict
+    def locked():
+        calls.append(1)
+        raise OperationalError('database is locked')
+
+    with transaction.atomic(), pytest.raises(OperationalError):
+        locked()
+    assert len(calls) == 1
+
+
+@services.retry_on_conflict
+@journal.unit_of_work()
+def _place(batch_id, rack_id, quantity):
+    """Размещение так же, как в PlacementBulkView: блокировка, снимок, запись"""
+    snapshot = services.CapacitySnapshot(batch_ids=[batch_id], rack_ids=[rack_id])
+    if snapshot.reserve_placement(batch_id, rack_id, quantity):
+        return False
+    services.place(snapshot.batches[batch_id], snapshot.racks[rack_id], quantity, 'Кладовщик')
+    return True
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_placements_never_overfill_rack(category, settings):
+    settings.CONFLICT_RETRY_ATTEMPTS = 50
+    settings.CONFLICT_RETRY_DELAY = 0.005
+    # Стеллаж вмещает ровно 6 коробок по объему
+    box = Product.objects.create(name='Коробка', category=category, sku='BOX-1',
+                                 length=10, width=10, height=10, weight=1)
+    rack = Rack.objects.create(name='Узкий', max_load=100, length=10, width=10, height=60)
+    batches = [Batch.objects.create(product=box, quantity=3, supplier='ООО') for _ in range(6)]
+
+    outcomes = []
+    start = threading.Barrier(len(batches))
+
+    def operator(batch):
+        try:
+            start.wait()
+            outcomes.append(_place(batch.pk, rack.pk, 3))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=operator, args=(batch,)) for batch in batches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(outcomes) == [False] * 4 + [True] * 2
+    rack = Rack.objects.with_occupancy().get(pk=rack.pk)
+    assert rack.available_volume() == 0
+    assert Placement.objects.count() == WarehouseJournal.objects.count() == 2
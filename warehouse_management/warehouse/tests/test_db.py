@@ -0,0 +1,63 @@
+import pytest
+from django.db import connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import RequestFactory
+
+from warehouse import db
+from warehouse.models import Product
+
+
+@pytest.fixture
+def read_alias(settings):
+    """Алиас чтения в настройках соединений (без реального подключения)"""
+    connections.settings['read'] = {**connections.settings['default']}
+    yield 'read'
+    del connections.settings['read']
+
+
+@pytest.mark.django_db
+def test_pragmas_are_applied_per_alias(settings, tmp_path):
+    settings.SQLITE_PRAGMAS = {'prod': {'journal_mode': 'WAL', 'busy_timeout': 1234,
+                                        'synchronous': 'NORMAL'}}
+    config = connections.configure_settings({'default': {
+        'ENGINE': 'django.db.backends.sqlite3', 'NAME': tmp_path / 'prod.sqlite3'}})['default']
+    wrapper = DatabaseWrapper(config, alias='prod')
+    try:
+        with wrapper.cursor() as cursor:
+            pragmas = {name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                       for name in ('journal_mode', 'busy_timeout', 'synchronous')}
+    finally:
+        wrapper.close()
+    # synchronous=NORMAL хранится как 1
+    assert pragmas == {'journal_mode': 'wal', 'busy_timeout': 1234, 'synchronous': 1}
+
+
+@pytest.mark.parametrize('method, path, expected', [
+    ('get', '/warehouse/journal/', 'read'),
+    ('get', '/warehouse/issue/', None),
+    ('post', '/warehouse/journal/', None),
+    ('get', '/nowhere/', None),
+])
+def test_read_views_are_routed_to_read_alias(read_alias, method, path, expected):
+    router = db.ReadReplicaRouter()
+    seen = []
+
+    def view(request):
+        seen.append(router.db_for_read(Product))
+        return None
+
+    middleware = db.ReadOnlyViewsMiddleware(view)
+    middleware(getattr(RequestFactory(), method)(path))
+    assert seen == [expected]
+    # После ответа пометка снимается, запись всегда идет в default
+    assert router.db_for_read(Product) is None
+    assert router.db_for_write(Product) == 'default'
+    assert router.allow_migrate('read', 'warehouse') is False
+
+
+def test_router_without_read_alias_uses_default():
+    token = db._read_only.set(True)
+    try:
+        assert db.ReadReplicaRouter().db_for_read(Product) is None
+    finally:
+        db._read_only.reset(token)
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from warehouse import events, journal, services
+from warehouse.models import LiveEvent, Placement
+
+
+def _parse(chunks):
+    """Разбор потока SSE в список (event, data)"""
+    parsed = []
+    for chunk in chunks:
+        fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+        if 'event' in fields:
+            parsed.append((fields['event'], json.loads(fields['data'])))
+    return parsed
+
+
+@pytest.fixture
+def published(monkeypatch):
+    """События, переданные брокеру в памяти после фиксации транзакции"""
+    sent = []
+    monkeypatch.setattr(events.broker, 'publish', lambda kind, data: sent.append((kind, data)))
+    monkeypatch.setattr(events, 'is_listening', lambda: True)
+    return sent
+
+
+def test_broker_delivers_events_from_other_threads(settings):
+    settings.LIVE_EVENTS_HEARTBEAT = 0.05
+    settings.LIVE_EVENTS_MAX_DURATION = 5
+
+    async def run():
+        stream = events.stream()
+        assert await anext(stream) == 'retry: 3000\n\n'
+        # Подписка оформляется при первом ожидании очереди
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0.01)
+        assert events.broker.subscriber_count == 1
+        thread = threading.Thread(target=events.broker.publish,
+                                  args=(events.RACK_UTILIZATION, {'rack': 1, 'utilization': 40.0}))
+        thread.start()
+        thread.join()
+        chunks = [await pending]
+        chunks.append(await anext(stream))
+        await stream.aclose()
+        return chunks
+
+    chunks = async_to_sync(run)()
+    assert _parse(chunks) == [(events.RACK_UTILIZATION, {'rack': 1, 'utilization': 40.0})]
+    assert chunks[1] == ': ping\n\n'
+    assert events.broker.subscriber_count == 0
+
+
+@pytest.mark.django_db
+def test_placement_publishes_after_commit(client, user, batch, rack, published,
+                                          django_capture_on_commit_callbacks):
+    client.force_login(user)
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        client.post(reverse('warehouse:place_batch', kwargs={'batch_id': batch.id}),
+                    {'batch': batch.id, 'rack': rack.id, 'quantity': 10})
+    # До фиксации транзакции ничего не отправляется
+    assert published == []
+    for callback in callbacks:
+        callback()
+
+    kinds = [kind for kind, _ in published]
+    # Остаток 0 -> 10: товар уходит из списка низких остатков
+    assert kinds == [events.PLACEMENT_CREATED, events.RACK_UTILIZATION, events.LOW_STOCK_LEFT]
+    placement = published[0][1]
+    assert placement['quantity'] == 10 and placement['operator'] == user.username
+    assert published[1][1]['rack'] == rack.pk
+    assert published[1][1]['utilization'] > 0
+    assert published[2][1]['stock'] == 10
+
+
+@pytest.mark.django_db
+def test_issue_reports_racks_and_low_stock(client, user, product, batch, rack, published,
+                                           django_capture_on_commit_callbacks):
+    Placement.objects.create(rack=rack, product=product, batch=batch, quantity=12)
+    client.force_login(user)
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post(reverse('warehouse:issue_product'),
+                    {'product': product.id, 'quantity': 4, 'operator': 'Кладовщик'})
+    assert dict(published)[events.ISSUE_DONE] == {
+        'product': product.pk, 'name': product.name, 'quantity': 4, 'racks': [rack.pk],
+        'deactivated_placements': 0, 'operator': 'Кладовщик'}
+    assert dict(published)[events.LOW_STOCK_ENTERED]['stock'] == 8
+
+    published.clear()
+    Placement.objects.create(rack=rack, product=product, batch=batch, quantity=5)
+    with django_capture_on_commit_callbacks(execute=True):
+        # Остаток 13 -> 10: порог не пересечен
+        client.post(reverse('warehouse:issue_product'),
+                    {'product': product.id, 'quantity': 3, 'operator': 'Кладовщик'})
+    assert [kind for kind, _ in published] == [events.ISSUE_DONE, events.RACK_UTILIZATION]
+
+
+@pytest.mark.django_db
+def test_no_listeners_means_no_event_queries(monkeypatch, batch, rack):
+    def fail(*args):
+        raise AssertionError('события собираются без подписчиков')
+
+    monkeypatch.setattr(events, '_rack_utilization', fail)
+    monkeypatch.setattr(events, '_stock_changes', fail)
+    with journal.unit_of_work():
+        services.place(batch, rack, 10, 'Кладовщик')
+        services.issue(batch.product, 4, 'Кладовщик')
+
+
+@pytest.mark.django_db
+def test_db_backend_writes_operation_events_in_one_insert(settings, batch, rack):
+    settings.LIVE_EVENTS_BACKEND = 'db'
+    with journal.unit_of_work():
+        services.place(batch, rack, 12, 'Кладовщик')
+    last = LiveEvent.objects.order_by('pk').last().pk
+    with CaptureQueriesContext(connection) as queries, journal.unit_of_work():
+        services.issue_lines([services.IssueLine(batch.product, 1, 'Кладовщик'),
+                              services.IssueLine(batch.product, 2, 'Кладовщик')])
+    inserts = [query for query in queries
+               if query['sql'].startswith('INSERT') and 'warehouse_liveevent' in query['sql']]
+    assert len(inserts) == 1
+    # Две выдачи, загрузка стеллажа и переход остатка 12 -> 9 через порог
+    assert list(LiveEvent.objects.filter(pk__gt=last).order_by('pk').values_list('kind', flat=True)) == [
+        events.ISSUE_DONE, events.ISSUE_DONE, events.RACK_UTILIZATION, events.LOW_STOCK_ENTERED]
+
+
+@pytest.mark.django_db
+def test_db_backend_replays_after_last_event_id(settings, product):
+    settings.LIVE_EVENTS_BACKEND = 'db'
+    settings.LIVE_EVENTS_MAX_DURATION = 0.2
+    settings.LIVE_EVENTS_POLL_INTERVAL = 0.05
+    events.stock_changed(product, -12)
+    events.publish(events.ISSUE_DONE, {'product': product.pk, 'quantity': 1})
+    first, second = LiveEvent.objects.order_by('pk')
+    assert first.kind == events.LOW_STOCK_ENTERED
+
+    async def collect(last_event_id):
+        return [chunk async for chunk in events.stream(last_event_id)]
+
+    chunks = async_to_sync(collect)(first.pk)
+    assert chunks[0] == 'retry: 3000\n\n'
+    assert _parse(chunks) == [(events.ISSUE_DONE, {'product': product.pk, 'quantity': 1})]
+    assert chunks[1].startswith(f'id: {second.pk}\n')
+    # Новый клиент без Last-Event-ID получает только новые события
+    assert _parse(async_to_sync(collect)(None)) == []
+
+
+@pytest.mark.django_db(transaction=True)
+def test_live_events_view_headers(user, settings):
+    settings.LIVE_EVENTS_MAX_DURATION = 0
+
+    async def run():
+        client = AsyncClient()
+        await client.aforce_login(user)
+        response = await client.get(reverse('warehouse:live_events'))
+        return response, [chunk async for chunk in response.streaming_content]
+
+    response, chunks = async_to_sync(run)()
+    assert response['Content-Type'] == 'text/event-stream'
+    assert response['Cache-Control'] == 'no-cache'
+    assert response['X-Accel-Buffering'] == 'no'
+    assert chunks == [b'retry: 3000\n\n']
+
+
+@pytest.mark.django_db
+def test_live_events_not_streamed_under_wsgi(client, user):
+    client.force_login(user)
+    response = client.get(reverse('warehouse:live_events'))
+    assert response.status_code == 204
+    # Страницы под WSGI не открывают поток, который не смог бы отдать события
+    for name in ('warehouse:dashboard', 'warehouse:rack_list'):
+        assert b'EventSource' not in client.get(reverse(name)).content
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('enabled', [True, False])
+def test_live_events_script_follows_setting_under_asgi(user, settings, enabled):
+    settings.LIVE_EVENTS_ENABLED = enabled
+    settings.LIVE_EVENTS_MAX_DURATION = 0
+
+    async def run():
+        client = AsyncClient()
+        await client.aforce_login(user)
+        page = await client.get(reverse('warehouse:rack_list'))
+        stream = await client.get(reverse('warehouse:live_events'))
+        return page, stream
+
+    page, stream = async_to_sync(run)()
+    assert (b'EventSource' in page.content) is enabled
+    if not enabled:
+        assert stream.status_code == 204
@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from warehouse import journal, services
+from warehouse.forms import BatchForm
+from warehouse.models import Batch, Category, Placement
+
+
+@pytest.fixture
+def shelf_life(product, rack):
+    """Три размещения товара: раньше всех пришла партия с самым поздним сроком"""
+    today = timezone.localdate()
+    placed = []
+    for days_ago, expires_in in ((3, 30), (2, 5), (1, None)):
+        batch = Batch.objects.create(
+            product=product, quantity=10, supplier='ООО',
+            expiry_date=today + timedelta(days=expires_in) if expires_in else None)
+        placed.append(Placement.objects.create(
+            rack=rack, product=product, batch=batch, quantity=10,
+            date_placed=timezone.now() - timedelta(days=days_ago)))
+    return placed
+
+
+def _issue_from(product, strategy):
+    Category.objects.filter(pk=product.category_id).update(issue_strategy=strategy)
+    with journal.unit_of_work():
+        services.issue(product, 4, 'Кладовщик')
+    return Placement.objects.filter(product=product).exclude(quantity=10).get()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('strategy, expected', [
+    (Category.FIFO, 0),
+    (Category.FEFO, 1),
+    (Category.LIFO, 2),
+])
+def test_issue_follows_category_strategy(shelf_life, product, strategy, expected):
+    assert _issue_from(product, strategy).pk == shelf_life[expected].pk
+
+
+@pytest.mark.django_db
+def test_fefo_issues_undated_stock_last(shelf_life, product):
+    Category.objects.filter(pk=product.category_id).update(issue_strategy=Category.FEFO)
+    ordered = services.active_placements([product])[product.pk]
+    assert [p.pk for p in ordered] == [shelf_life[1].pk, shelf_life[0].pk, shelf_life[2].pk]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('strategy, index', [
+    (Category.FIFO, 'placement_arrival_idx'),
+    (Category.FEFO, 'placement_issue_idx'),
+    (Category.LIFO, 'placement_arrival_idx'),
+])
+def test_issue_order_is_read_from_index(product, strategy, index):
+    for product_ids in ([product.pk], [product.pk, product.pk + 1]):
+        plan = Placement.objects.filter(product__in=product_ids, is_active=True).order_by(
+            *services.ISSUE_ORDERING[strategy]).explain()
+        assert index in plan
+        assert 'TEMP B-TREE' not in plan
+
+
+@pytest.mark.django_db
+def test_placements_follow_batch_expiry(shelf_life):
+    placement = shelf_life[2]
+    assert placement.expiry_date is None and shelf_life[0].expiry_date is not None
+    batch = placement.batch
+    batch.expiry_date = timezone.localdate() + timedelta(days=1)
+    batch.save()
+    placement.refresh_from_db()
+    assert placement.expiry_date == batch.expiry_date
+
+
+@pytest.mark.django_db
+def test_batch_form_rejects_expired_date(product):
+    form = BatchForm(data={'product': product.pk, 'quantity': 5, 'supplier': 'ООО',
+                           'expiry_date': timezone.localdate() - timedelta(days=1)})
+    assert 'expiry_date' in form.errors
+
+
+@pytest.mark.django_db
+def test_expiring_report(client, user, shelf_life):
+    Placement.objects.filter(pk=shelf_life[1].pk).update(
+        expiry_date=timezone.localdate() - timedelta(days=1))
+    client.force_login(user)
+    response = client.get(reverse('warehouse:expiring_stock'))
+    assert [p.pk for p in response.context['placements']] == [shelf_life[1].pk]
+    assert 'Просрочено' in response.content.decode()
+
+    response = client.get(reverse('warehouse:expiring_stock'), {'days': 60})
+    assert [p.pk for p in response.context['placements']] == [shelf_life[1].pk, shelf_life[0].pk]
+    plan = Placement.objects.filter(is_active=True, expiry_date__lte=timezone.localdate()).order_by(
+        'expiry_date').explain()
+    assert 'placement_expiry_idx' in plan
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from warehouse import history, journal, services
+from warehouse.models import Aisle, UtilizationSnapshot, Warehouse, Zone
+
+
+@pytest.fixture
+def zoned_rack(rack, batch):
+    """Стеллаж в зоне с 10 размещенными единицами товара"""
+    zone = Zone.objects.create(warehouse=Warehouse.objects.create(name='Основной'), name='A')
+    rack.aisle = Aisle.objects.create(zone=zone, name='1')
+    rack.save()
+    with journal.unit_of_work():
+        services.place(batch, rack, 10, 'Кладовщик')
+    return rack
+
+
+def _point(kind, object_id, taken_at, utilization, **kwargs):
+    return UtilizationSnapshot.objects.create(
+        kind=kind, object_id=object_id, taken_at=taken_at, utilization=utilization,
+        weight=kwargs.pop('weight', 0), sku_count=kwargs.pop('sku_count', 1), **kwargs)
+
+
+@pytest.mark.django_db
+def test_snapshot_is_one_insert(zoned_rack, product):
+    with CaptureQueriesContext(connection) as queries:
+        assert history.take() == 2
+    inserts = [query for query in queries if query['sql'].startswith('INSERT')]
+    assert len(inserts) == 1
+
+    rack_point = UtilizationSnapshot.objects.get(kind=UtilizationSnapshot.RACK)
+    zone_point = UtilizationSnapshot.objects.get(kind=UtilizationSnapshot.ZONE)
+    assert rack_point.object_id == zoned_rack.pk
+    assert rack_point.weight == pytest.approx(10 * product.weight)
+    assert rack_point.sku_count == zone_point.sku_count == 1
+    assert zone_point.utilization == rack_point.utilization == zoned_rack.get_utilization_percent()
+
+
+@pytest.mark.django_db
+def test_downsample_folds_old_points_into_daily(settings):
+    settings.SNAPSHOT_RAW_DAYS = 14
+    settings.SNAPSHOT_KEEP_DAYS = 365
+    now = timezone.now()
+    day = timezone.localtime(now - timedelta(days=20)).replace(hour=10, minute=0)
+    _point(UtilizationSnapshot.ZONE, 1, day, 40, sku_count=3)
+    _point(UtilizationSnapshot.ZONE, 1, day + timedelta(hours=4), 60, sku_count=5)
+    recent = _point(UtilizationSnapshot.ZONE, 1, now, 70)
+    _point(UtilizationSnapshot.ZONE, 1, now - timedelta(days=400), 10,
+           resolution=UtilizationSnapshot.DAILY)
+
+    assert history.downsample(now) == (2, 1)
+    daily = UtilizationSnapshot.objects.get(resolution=UtilizationSnapshot.DAILY)
+    assert (daily.utilization, daily.sku_count) == (50, 5)
+    assert timezone.localtime(daily.taken_at).date() == day.date()
+    assert set(UtilizationSnapshot.objects.values_list('pk', flat=True)) == {daily.pk, recent.pk}
+
+
+@pytest.mark.django_db
+def test_history_endpoint_reads_snapshots(client, user, zoned_rack, assert_within_budget):
+    history.take()
+    client.force_login(user)
+    response = client.get(reverse('warehouse:utilization_data'))
+    assert_within_budget(response)
+    [series] = response.json()['series']
+    assert series['name'] == 'Основной / A'
+    assert len(series['points']) == 1
+
+    response = client.get(reverse('warehouse:utilization_data'), {'rack': zoned_rack.pk, 'days': 30})
+    assert response.json()['series'][0]['name'] == zoned_rack.name
+    assert client.get(reverse('warehouse:utilization_data'), {'days': 7}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_history_page(client, user, zoned_rack, assert_within_budget):
+    history.take()
+    client.force_login(user)
+    response = client.get(reverse('warehouse:utilization_history'))
+    assert_within_budget(response)
+    assert [item['name'] for item in response.context['latest']] == ['Основной / A']
+    assert reverse('warehouse:utilization_data') in response.content.decode()
@@ -0,0 +1,146 @@
+import time
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from warehouse import jobs
+from warehouse.models import Job, WarehouseJournal
+
+
+@pytest.fixture
+def flaky(monkeypatch):
+    """Задача, падающая заданное число раз"""
+    calls = []
+
+    def handler(job, failures=0):
+        calls.append(job.attempts)
+        if len(calls) <= failures:
+            raise RuntimeError('сбой')
+        return {'calls': len(calls)}
+
+    monkeypatch.setitem(jobs.TASKS, 'flaky', ('Нестабильная задача', handler))
+    return calls
+
+
+@pytest.mark.django_db
+def test_claim_takes_job_once(flaky):
+    job = jobs.enqueue('flaky')
+    jobs.enqueue('flaky', delay=timedelta(hours=1))
+
+    claimed = jobs.claim('w1')
+    assert claimed.pk == job.pk
+    assert claimed.status == Job.RUNNING and claimed.attempts == 1 and claimed.worker == 'w1'
+    # Вторая задача отложена, первая уже занята
+    assert jobs.claim('w2') is None
+    assert not jobs._start(job.pk, 'w2', timezone.now())
+
+
+@pytest.mark.django_db
+def test_failed_job_is_retried_with_backoff(flaky, settings):
+    settings.JOB_RETRY_DELAY = 10
+    job = jobs.enqueue('flaky', {'failures': 1}, max_attempts=2)
+
+    assert not jobs.run(jobs.claim('w1'))
+    job.refresh_from_db()
+    assert job.status == Job.QUEUED and 'RuntimeError' in job.error
+    assert job.run_after > timezone.now() + timedelta(seconds=5)
+
+    Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+    assert jobs.run(jobs.claim('w1'))
+    job.refresh_from_db()
+    assert job.status == Job.DONE and job.progress == 100
+    assert job.result == {'calls': 2} and job.attempts == 2
+
+
+@pytest.mark.django_db
+def test_job_fails_after_max_attempts(flaky):
+    job = jobs.enqueue('flaky', {'failures': 5}, max_attempts=1)
+    assert not jobs.run(jobs.claim('w1'))
+    job.refresh_from_db()
+    assert job.status == Job.FAILED and job.finished is not None
+
+
+@pytest.mark.django_db
+def test_stale_running_job_is_requeued(flaky, settings):
+    settings.JOB_STALE_AFTER = timedelta(minutes=1)
+    job = jobs.enqueue('flaky')
+    jobs.claim('w1')
+    assert jobs.requeue_stale() == 0
+
+    assert jobs.requeue_stale(timezone.now() + timedelta(minutes=2)) == 1
+    job.refresh_from_db()
+    assert job.status == Job.QUEUED and job.worker == ''
+
+
+@pytest.mark.django_db(transaction=True)
+def test_long_handler_keeps_heartbeat(monkeypatch, settings):
+    settings.JOB_HEARTBEAT_INTERVAL = 0.05
+    settings.JOB_STALE_AFTER = timedelta(seconds=0.2)
+
+    def handler(job):
+        # Долгий пересчет без вызовов progress()
+        time.sleep(0.5)
+        return {'stale': jobs.requeue_stale()}
+
+    monkeypatch.setitem(jobs.TASKS, 'slow', ('Долгая задача', handler))
+    job = jobs.enqueue('slow')
+    assert jobs.run(jobs.claim('w1'))
+    job.refresh_from_db()
+    assert job.status == Job.DONE and job.result == {'stale': 0}
+    assert job.heartbeat > job.started + timedelta(seconds=0.3)
+
+
+@pytest.mark.django_db
+def test_requeued_job_result_is_not_overwritten(monkeypatch):
+    def handler(job):
+        # Пока обработчик работал, задачу вернули в очередь и забрал другой
+        Job.objects.filter(pk=job.pk).update(status=Job.QUEUED, worker='')
+        jobs.claim('w2')
+        return {'done': True}
+
+    monkeypatch.setitem(jobs.TASKS, 'slow', ('Долгая задача', handler))
+    job = jobs.enqueue('slow')
+    assert not jobs.run(jobs.claim('w1'))
+    job.refresh_from_db()
+    assert (job.status, job.worker, job.result) == (Job.RUNNING, 'w2', None)
+
+
+@pytest.mark.django_db
+def test_work_burst_exports_journal(seeded_warehouse, settings, tmp_path):
+    settings.JOB_OUTPUT_DIR = tmp_path
+    job = jobs.enqueue('export_journal')
+    jobs.enqueue('reconcile_stock')
+
+    assert jobs.work('w1', burst=True) == 2
+    job.refresh_from_db()
+    assert job.status == Job.DONE
+    lines = (tmp_path / job.result['file']).read_text(encoding='utf-8-sig').splitlines()
+    assert len(lines) == WarehouseJournal.objects.count() + 1
+    assert job.result['url'].endswith(job.result['file'])
+    reconcile = Job.objects.get(kind='reconcile_stock')
+    assert reconcile.result['mismatched_count'] == 0
+
+
+@pytest.mark.django_db
+def test_job_page_enqueues_and_reports_status(client, staff_user):
+    client.force_login(staff_user)
+    response = client.post(reverse('warehouse:job_list'), {'kind': 'wave_labels'})
+    assert response.status_code == 200
+    assert not Job.objects.exists()
+
+    response = client.post(reverse('warehouse:job_list'), {'kind': 'reconcile_stock', 'fix': 'on'})
+    job = Job.objects.get()
+    assert response.status_code == 302
+    assert job.payload == {'fix': True} and job.created_by == 'staff'
+    assert 'Сверка счетчиков' in client.get(reverse('warehouse:job_list')).content.decode()
+
+    status = client.get(reverse('warehouse:job_status', args=[job.pk])).json()
+    assert status['status'] == Job.QUEUED and status['progress'] == 0
+
+
+@pytest.mark.django_db
+def test_job_page_requires_staff(client, user):
+    client.force_login(user)
+    assert client.get(reverse('warehouse:job_list')).status_code == 403
@@ -0,0 +1,90 @@
+import pytest
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+
+from warehouse import journal, services
+from warehouse.models import Placement, WarehouseJournal
+
+
+class Abort(Exception):
+    pass
+
+
+def _journal_inserts(queries):
+    return sum(q['sql'].startswith('INSERT INTO "warehouse_warehousejournal"') for q in queries)
+
+
+def _assert_consistent(product):
+    """Остаток по размещениям совпадает с балансом журнала"""
+    placed = Placement.objects.filter(product=product, is_active=True).aggregate(
+        total=Sum('quantity', default=0))['total']
+    moved = {row['operation_type']: row['total'] for row in WarehouseJournal.objects.filter(
+        product=product).values('operation_type').annotate(total=Sum('quantity'))}
+    assert placed == moved.get('IN', 0) - moved.get('OUT', 0)
+
+
+@pytest.fixture
+def placed(batch, rack):
+    with journal.unit_of_work():
+        services.place(batch, rack, 10, 'Кладовщик')
+        services.place(batch, rack, 10, 'Кладовщик')
+    return batch
+
+
+@pytest.mark.django_db
+def test_unit_of_work_writes_journal_once(placed, rack):
+    with CaptureQueriesContext(connection) as queries:
+        with journal.unit_of_work():
+            services.issue(placed.product, 15, 'Кладовщик')
+            services.place(placed, rack, 5, 'Кладовщик')
+    assert _journal_inserts(queries) == 1
+    assert WarehouseJournal.objects.filter(operation_type='OUT').count() == 2
+    _assert_consistent(placed.product)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('durable', [True, False])
+def test_rollback_keeps_journal_consistent(placed, rack, durable, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        with pytest.raises(Abort):
+            with journal.unit_of_work(durable=durable):
+                services.issue(placed.product, 12, 'Кладовщик')
+                services.place(placed, rack, 5, 'Кладовщик')
+                raise Abort
+    assert WarehouseJournal.objects.count() == 2
+    assert Placement.objects.filter(is_active=True).count() == 2
+    _assert_consistent(placed.product)
+
+
+@pytest.mark.django_db
+def test_nested_rollback_discards_inner_entries(placed, rack):
+    with journal.unit_of_work():
+        services.issue(placed.product, 3, 'Кладовщик')
+        with pytest.raises(Abort):
+            with journal.unit_of_work():
+                services.place(placed, rack, 5, 'Кладовщик')
+                raise Abort
+    assert list(WarehouseJournal.objects.order_by('pk').values_list(
+        'operation_type', 'quantity')) == [('IN', 10), ('IN', 10), ('OUT', 3)]
+    _assert_consistent(placed.product)
+
+
+@pytest.mark.django_db
+def test_non_durable_mode_writes_after_commit(placed, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks() as callbacks:
+        with journal.unit_of_work(durable=False):
+            services.issue(placed.product, 3, 'Кладовщик')
+    assert not WarehouseJournal.objects.filter(operation_type='OUT').exists()
+    for callback in callbacks:
+        callback()
+    assert WarehouseJournal.objects.filter(operation_type='OUT').count() == 1
+    _assert_consistent(placed.product)
+
+
+@pytest.mark.django_db
+def test_record_outside_unit_of_work_inserts_immediately(product):
+    journal.record([WarehouseJournal(operation_type='IN', product=product, quantity=1,
+                                     operator='Кладовщик')])
+    assert WarehouseJournal.objects.count() == 1
+    assert journal.current_writer() is None
@@ -0,0 +1,137 @@
+import re
+from io import BytesIO
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from warehouse import labels
+from warehouse.models import Batch, Placement
+
+REVERSE_PATTERNS = {pattern: value for value, pattern in enumerate(labels.CODE128_PATTERNS)}
+
+
+def _decode_widths(widths):
+    """Обратное преобразование ширин штрихов в строку с проверкой контрольной суммы"""
+    symbols = [REVERSE_PATTERNS[''.join(map(str, widths[i:i + 6]))]
+               for i in range(0, len(widths) - 7, 6)]
+    assert ''.join(map(str, widths[-7:])) == labels.CODE128_PATTERNS[labels.STOP]
+    *values, checksum = symbols
+    assert (values[0] + sum(i * v for i, v in enumerate(values[1:], 1))) % 103 == checksum
+    text, mode = '', values[0]
+    for value in values[1:]:
+        if value in (labels.CODE_B, labels.CODE_C):
+            mode = labels.START_B if value == labels.CODE_B else labels.START_C
+        elif mode == labels.START_C:
+            text += f'{value:02d}'
+        else:
+            text += chr(value + 32)
+    return text
+
+
+def _runs(modules):
+    widths, current, run = [], modules[0], 0
+    for module in modules:
+        if module == current:
+            run += 1
+        else:
+            widths.append(run)
+            current, run = module, 1
+    widths.append(run)
+    return widths
+
+
+def test_code128_table():
+    assert len(labels.CODE128_PATTERNS) == 107
+    assert len(set(labels.CODE128_PATTERNS)) == 107
+    assert all(sum(map(int, p)) == 11 for p in labels.CODE128_PATTERNS[:-1])
+    assert sum(map(int, labels.CODE128_PATTERNS[-1])) == 13
+
+
+@pytest.mark.parametrize('data', ['SMART-001/12', 'PJJ123C', '12345678', 'AB123456/7', 'x'])
+def test_code128_round_trip(data):
+    assert _decode_widths(_runs(labels.code128_modules(data))) == data
+
+
+def test_code128_uses_set_c_for_digit_runs():
+    assert labels.code128_values('12345678')[0] == labels.START_C
+    assert len(labels.code128_values('12345678')) == 1 + 4 + 1
+    with pytest.raises(ValueError):
+        labels.code128_values('Товар')
+
+
+def test_rendered_barcode_is_readable():
+    label = labels.Label('SKU-77', 'Товар', 5, 'A1', 3)
+    page = labels.render_page([labels.asdict(label)]).convert('L')
+    # Горизонтальная линия через середину штрихкода первой этикетки
+    y = labels.MARGIN + 16 + 112 + 40
+    row = [page.getpixel((x, y)) < 128 for x in range(labels.MARGIN + 1, labels.MARGIN + 520)]
+    first, last = row.index(True), len(row) - row[::-1].index(True)
+    widths = _runs(row[first:last])
+    module = min(widths)
+    assert _decode_widths([w // module for w in widths]) == label.payload
+
+
+@pytest.fixture
+def placed_batch(batch, rack):
+    Placement.objects.create(batch=batch, rack=rack, product=batch.product, quantity=30)
+    return batch
+
+
+@pytest.mark.django_db
+def test_labels_per_placement_and_unit(placed_batch):
+    batches = Batch.objects.filter(pk=placed_batch.pk)
+    per_placement = labels.labels_for_batches(batches)
+    assert [(label.rack, label.quantity) for label in per_placement] == [('Стеллаж-A1', 30), ('', 20)]
+    per_unit = labels.labels_for_batches(batches, per='unit')
+    assert len(per_unit) == 50
+    assert len(labels.paginate(per_unit)) == 3
+
+
+def _check_pdf(content, pages):
+    assert content.startswith(b'%PDF-1.4') and content.rstrip().endswith(b'%%EOF')
+    assert content.count(b'/Type /Page ') == pages
+    xref = int(re.search(rb'startxref\n(\d+)', content).group(1))
+    table = content[xref:].split(b'trailer')[0].split(b'\n')[3:]
+    for number, entry in enumerate(filter(None, table), 1):
+        offset = int(entry.split()[0])
+        assert content[offset:].startswith(f'{number} 0 obj'.encode())
+
+
+@pytest.mark.django_db
+def test_batch_labels_pdf_is_streamed(client, user, placed_batch):
+    client.force_login(user)
+    url = reverse('warehouse:batch_labels', kwargs={'batch_id': placed_batch.pk})
+    response = client.get(url, {'per': 'unit'})
+    assert response.status_code == 200
+    assert response.streaming
+    assert response['X-Label-Pages'] == '3'
+    _check_pdf(b''.join(response.streaming_content), 3)
+
+
+@pytest.mark.django_db
+def test_png_sheet_and_wave(client, user, placed_batch):
+    client.force_login(user)
+    url = reverse('warehouse:batch_labels', kwargs={'batch_id': placed_batch.pk})
+    response = client.get(url, {'format': 'png', 'per': 'unit', 'page': 3})
+    assert response['Content-Type'] == 'image/png'
+    with Image.open(BytesIO(response.content)) as image:
+        assert image.size == labels.PAGE_SIZE
+    assert client.get(url, {'format': 'png', 'page': 9}).status_code == 404
+
+    wave = reverse('warehouse:wave_labels')
+    today = timezone.localdate(placed_batch.arrival_date).isoformat()
+    response = client.get(wave, {'date': today})
+    assert response['X-Label-Pages'] == '1'
+    assert client.get(wave, {'date': 'вчера'}).status_code == 400
+    assert client.get(wave, {'date': '2001-01-01'}).status_code == 302
+
+
+def test_process_pool_matches_inline_rendering(settings):
+    pages = labels.paginate([labels.Label(f'SKU-{i}', 'Товар', i, 'A1', 1) for i in range(60)])
+    settings.LABEL_WORKERS = 0
+    inline = list(labels.render_pages(pages, labels._render_pdf_page))
+    settings.LABEL_WORKERS = 2
+    pooled = list(labels.render_pages(pages, labels._render_pdf_page))
+    assert pooled == inline
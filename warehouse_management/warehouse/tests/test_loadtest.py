@@ -0,0 +1,48 @@
+import pytest
+
+from warehouse import stock as stock_counters
+from warehouse.loadtest import histogram, parse_mix, run_load_test, check_invariants, stock_by_product
+from warehouse.models import Placement, Product, Rack
+from warehouse_management.wsgi import application
+
+
+def test_parse_mix():
+    assert parse_mix('place=1,issue=2,read=0') == {'place': 1, 'issue': 2, 'read': 0}
+    with pytest.raises(ValueError):
+        parse_mix('delete=1')
+
+
+def test_histogram_buckets():
+    result = histogram([1, 7, 7, 3000])
+    assert result['<=5ms'] == 1
+    assert result['<=10ms'] == 2
+    assert result['>2500ms'] == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_load_test_reports_and_keeps_invariants(user, seeded_warehouse):
+    operators = 4
+    report = run_load_test(application, user, operators=operators, ops_per_operator=15,
+                           host='testserver')
+    assert report['operators'] == operators
+    assert report['total_ops'] == operators * 15
+    assert set(report['operations']) <= {'place', 'issue', 'read'}
+    # Конкурентная запись не переполнила стеллажи и не рассогласовала остатки
+    assert report['invariant_violations'] == []
+    for rack in Rack.objects.with_occupancy():
+        assert rack.available_volume() >= -1e-6 and rack.available_weight() >= -1e-6
+    stock = stock_by_product()
+    counters = stock_counters.available(Product.objects.values_list('pk', flat=True))
+    assert all(counters.get(pk, 0) == stock.get(pk, 0) for pk in set(stock) | set(counters))
+    # Отказы из-за блокировок учитываются отдельно, других исключений нет
+    assert isinstance(report['lock_errors'], int)
+    assert sum(report['exceptions'].values()) == report['lock_errors']
+
+
+@pytest.mark.django_db
+def test_invariants_detect_unjournaled_stock_change(seeded_warehouse):
+    stock = stock_by_product()
+    placement = Placement.objects.filter(is_active=True).first()
+    placement.quantity += 1
+    placement.save()
+    assert check_invariants(stock, 10 ** 9)
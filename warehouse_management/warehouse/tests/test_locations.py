@@ -0,0 +1,120 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from warehouse import journal, locations, services
+from warehouse.models import Aisle, Product, Rack, Warehouse, Zone
+
+
+@pytest.fixture
+def layout(db):
+    """Склад с зоной мелких стеллажей и зоной крупных, плюс второй склад"""
+    main = Warehouse.objects.create(name='Основной')
+    small = Aisle.objects.create(zone=Zone.objects.create(warehouse=main, name='Мелкие'), name='1')
+    large = Aisle.objects.create(zone=Zone.objects.create(warehouse=main, name='Крупные'), name='1')
+    other = Aisle.objects.create(
+        zone=Zone.objects.create(warehouse=Warehouse.objects.create(name='Резервный'), name='A'),
+        name='1')
+    racks = {
+        'small': Rack.objects.create(name='S-1', aisle=small, length=50, width=40, height=50,
+                                     max_load=100),
+        'large': Rack.objects.create(name='L-1', aisle=large, length=300, width=100, height=250,
+                                     max_load=2000),
+        'other': Rack.objects.create(name='O-1', aisle=other, length=300, width=100, height=250,
+                                     max_load=2000),
+    }
+    return racks
+
+
+@pytest.fixture
+def bulky(category):
+    return Product.objects.create(name='Шкаф', category=category, sku='BULKY-1',
+                                  length=150, width=60, height=200, weight=80)
+
+
+@pytest.mark.django_db
+def test_levels_roll_up_rack_capacity(layout):
+    zone = layout['large'].aisle.zone
+    zone.refresh_from_db()
+    warehouse = zone.warehouse
+    warehouse.refresh_from_db()
+    assert zone.racks_count == 1 and zone.total_volume == layout['large'].volume
+    assert warehouse.racks_count == 2
+    assert warehouse.total_volume == layout['small'].volume + layout['large'].volume
+    assert warehouse.max_free_volume == layout['large'].volume
+    assert warehouse.max_height == 250
+
+
+@pytest.mark.django_db
+def test_place_and_issue_update_branch(layout, batch, product):
+    rack = layout['small']
+    with journal.unit_of_work():
+        services.place(batch, rack, 10, 'Кладовщик')
+    volume = product.get_volume()
+    for node in (rack.aisle, rack.aisle.zone, rack.aisle.zone.warehouse):
+        node.refresh_from_db()
+        assert node.occupied_volume == pytest.approx(10 * volume)
+
+    with journal.unit_of_work():
+        services.issue(product, 4, 'Кладовщик')
+    warehouse = Warehouse.objects.get(pk=rack.aisle.zone.warehouse_id)
+    assert warehouse.occupied_volume == pytest.approx(6 * volume)
+    assert warehouse.occupied_weight == pytest.approx(6 * product.weight)
+
+
+@pytest.mark.django_db
+def test_moving_rack_refreshes_both_aisles(layout):
+    rack = layout['other']
+    target = layout['small'].aisle
+    rack.aisle = target
+    rack.save()
+    assert Aisle.objects.get(pk=target.pk).racks_count == 2
+    old_warehouse = Warehouse.objects.get(name='Резервный')
+    assert old_warehouse.racks_count == 0 and old_warehouse.total_volume == 0
+    assert Warehouse.objects.get(name='Основной').racks_count == 3
+
+
+@pytest.mark.django_db
+def test_candidate_racks_skip_zones_that_cannot_fit(layout, bulky, rack):
+    unlocated = rack
+    found = {r.pk for r in locations.candidate_racks(bulky)}
+    assert found == {layout['large'].pk, layout['other'].pk}
+
+    main = layout['large'].aisle.zone.warehouse
+    with CaptureQueriesContext(connection) as queries:
+        racks = list(locations.candidate_racks(bulky, main))
+    assert [r.pk for r in racks] == [layout['large'].pk]
+    assert len(queries) == 1
+    assert unlocated.pk not in {r.pk for r in racks}
+
+
+@pytest.mark.django_db
+def test_plan_stops_when_zone_is_full(layout, bulky):
+    main = layout['large'].aisle.zone.warehouse
+    # В крупный стеллаж основного склада помещаются 4 шкафа по объему
+    plan, remaining = locations.plan_placement(bulky, 5, main)
+    assert [(r.pk, suggested) for r, _, suggested in plan] == [(layout['large'].pk, 4)]
+    assert remaining == 1
+
+
+@pytest.mark.django_db
+def test_check_capacity_filters_by_warehouse(client, user, layout, bulky):
+    client.force_login(user)
+    main = layout['large'].aisle.zone.warehouse
+    response = client.post(reverse('warehouse:check_capacity'),
+                           {'product': bulky.pk, 'quantity': 1, 'warehouse': main.pk})
+    assert [item['rack'].pk for item in response.context['suggested_racks']] == [layout['large'].pk]
+
+
+@pytest.mark.django_db
+def test_rebuild_locations_command(layout):
+    rack = layout['small']
+    Rack.objects.filter(pk=rack.pk).update(max_load=500)
+    output = StringIO()
+    call_command('rebuild_locations', stdout=output)
+    assert 'рядов: 3' in output.getvalue()
+    assert Zone.objects.get(pk=rack.aisle.zone_id).total_load == 500
@@ -0,0 +1,129 @@
+import multiprocessing
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from warehouse import journal, metrics, services
+from warehouse.metrics import MmapedDict, read_file
+from warehouse.models import Warehouse
+
+
+def _write_in_child(directory, amount):
+    values = MmapedDict(directory / 'metrics_child.db')
+    values.add('warehouse_placements_total', amount)
+    values.close()
+
+
+def test_mmaped_dict_roundtrip_and_growth(tmp_path):
+    values = MmapedDict(tmp_path / 'metrics_1.db')
+    for i in range(3000):
+        values.add(f'sample_{i}{{view="длинное имя маршрута"}}', i)
+    values.add('sample_7{view="длинное имя маршрута"}', 0.5)
+    values.close()
+
+    data = read_file(tmp_path / 'metrics_1.db')
+    assert len(data) == 3000
+    assert data['sample_7{view="длинное имя маршрута"}'] == 7.5
+
+    reopened = MmapedDict(tmp_path / 'metrics_1.db')
+    reopened.add('sample_1{view="длинное имя маршрута"}', 1)
+    reopened.close()
+    assert read_file(tmp_path / 'metrics_1.db')['sample_1{view="длинное имя маршрута"}'] == 2
+
+
+def test_values_aggregate_across_processes(metrics_dir):
+    metrics.inc('warehouse_placements_total', 2)
+    process = multiprocessing.get_context('fork').Process(
+        target=_write_in_child, args=(metrics.get_metrics_dir(), 3))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert metrics.collect()['warehouse_placements_total'] == 5
+
+
+def test_histogram_buckets_are_cumulative(metrics_dir):
+    metrics.observe('warehouse_http_request_queries', 7, metrics.QUERY_BUCKETS, view='x')
+    data = metrics.collect()
+    assert 'warehouse_http_request_queries_bucket{le="5",view="x"}' not in data
+    assert data['warehouse_http_request_queries_bucket{le="10",view="x"}'] == 1
+    assert data['warehouse_http_request_queries_bucket{le="+Inf",view="x"}'] == 1
+    assert data['warehouse_http_request_queries_sum{view="x"}'] == 7
+    assert data['warehouse_http_request_queries_count{view="x"}'] == 1
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(client, user, batch, rack, django_capture_on_commit_callbacks):
+    cache.clear()
+    client.force_login(user)
+    client.get(reverse('warehouse:dashboard'))
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post(reverse('warehouse:place_batch', kwargs={'batch_id': batch.id}), {
+            'batch': batch.id, 'rack': rack.id, 'quantity': 10})
+        client.post(reverse('warehouse:issue_product'), {
+            'product': batch.product.id, 'quantity': 4, 'operator': 'Тест'})
+    client.post(reverse('warehouse:issue_product'), {
+        'product': batch.product.id, 'quantity': 1000, 'operator': 'Тест'})
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    text = response.content.decode()
+    assert '# TYPE warehouse_http_request_duration_seconds histogram' in text
+    assert 'warehouse_http_request_duration_seconds_count{method="GET",view="warehouse:dashboard"} 1.0' in text
+    assert 'warehouse_http_request_queries_count{view="warehouse:dashboard"} 1.0' in text
+    assert 'warehouse_placements_total 1.0' in text
+    assert 'warehouse_issues_total 1.0' in text
+    assert 'warehouse_units_moved_total{direction="in"} 10.0' in text
+    assert 'warehouse_units_moved_total{direction="out"} 4.0' in text
+    assert 'warehouse_validation_failures_total{form="IssueForm"} 1.0' in text
+    assert 'warehouse_stock_units 6.0' in text
+    assert 'warehouse_open_batches 1.0' in text
+    assert '# TYPE warehouse_rack_utilization_ratio gauge' in text
+
+
+@pytest.mark.django_db
+def test_operation_counters_wait_for_commit(metrics_dir, batch, rack,
+                                            django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        with journal.unit_of_work():
+            services.place(batch, rack, 5, 'Кладовщик')
+            services.issue(batch.product, 2, 'Кладовщик')
+    # Откаченная операция не попадает в счетчики
+    assert 'warehouse_placements_total' not in metrics.collect()
+    for callback in callbacks:
+        callback()
+    totals = metrics.collect()
+    assert totals['warehouse_placements_total'] == totals['warehouse_issues_total'] == 1.0
+    assert totals['warehouse_units_moved_total{direction="out"}'] == 2.0
+
+
+@pytest.mark.django_db
+def test_gauges_read_rollups(batch, rack):
+    cache.clear()
+    Warehouse.objects.create(name='Основной', total_volume=3_000_000, occupied_volume=1_000_000)
+    with journal.unit_of_work():
+        services.place(batch, rack, 10, 'Кладовщик')
+    with CaptureQueriesContext(connection) as queries:
+        gauges = metrics.compute_gauges()
+    occupied = 10 * batch.product.get_volume()
+    assert gauges['warehouse_rack_utilization_ratio'] == pytest.approx(
+        (1_000_000 + occupied) / (3_000_000 + rack.volume))
+    assert gauges['warehouse_stock_units'] == 10.0
+    # Партия размещена не полностью; счетчик читается без JOIN с размещениями
+    assert gauges['warehouse_open_batches'] == 1.0
+    [open_batches] = [query['sql'] for query in queries if 'warehouse_batch' in query['sql']]
+    assert 'JOIN' not in open_batches
+
+    cache.clear()
+    with journal.unit_of_work():
+        services.place(batch, rack, batch.quantity - 10, 'Кладовщик')
+        services.issue(batch.product, 5, 'Кладовщик')
+    # Выдача не возвращает полностью размещенную партию в открытые
+    assert metrics.compute_gauges()['warehouse_open_batches'] == 0.0
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint_is_local_only(client):
+    assert client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code == 403
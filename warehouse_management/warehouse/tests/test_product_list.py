@@ -0,0 +1,108 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from warehouse.models import Category, Product, Placement
+from warehouse.pagination import decode_cursor, encode_cursor
+
+
+@pytest.fixture
+def catalog(db, category):
+    tools = Category.objects.create(name="Инструменты")
+    products = [
+        Product(name=f"Кабель {i:02d}", category=category, sku=f"CB-{i:03d}",
+                length=10 + i, width=5, height=2, weight=0.1)
+        for i in range(45)
+    ]
+    products.append(Product(name="Дрель", category=tools, sku="DR-001",
+                            length=30, width=10, height=25, weight=2))
+    return Product.objects.bulk_create(products)
+
+
+def _names(response):
+    return [product.name for product in response.context['products']]
+
+
+@pytest.mark.django_db
+def test_keyset_pages_cover_catalog_once(client, user, catalog):
+    client.force_login(user)
+    url = reverse('warehouse:product_list')
+    seen = []
+    response = client.get(url)
+    assert not response.context['products'].has_previous()
+    while True:
+        page = response.context['products']
+        seen += _names(response)
+        if not page.has_next():
+            break
+        response = client.get(url, {'after': page.next_cursor()})
+    assert seen == sorted(p.name for p in catalog)
+
+    # Назад со второй страницы - снова первая
+    second = client.get(url, {'after': client.get(url).context['products'].next_cursor()})
+    back = client.get(url, {'before': second.context['products'].previous_cursor()})
+    assert _names(back) == seen[:20]
+    assert not back.context['products'].has_previous()
+
+
+@pytest.mark.django_db
+def test_filters_by_category_prefix_and_dimensions(client, user, catalog):
+    client.force_login(user)
+    url = reverse('warehouse:product_list')
+    tools = Category.objects.get(name="Инструменты")
+
+    assert _names(client.get(url, {'category': tools.pk})) == ['Дрель']
+    assert _names(client.get(url, {'search': 'дре'})) == ['Дрель']
+    assert _names(client.get(url, {'search': 'cb-01'}))[:2] == ['Кабель 10', 'Кабель 11']
+    assert len(_names(client.get(url, {'search': 'CB-01'}))) == 10
+    assert _names(client.get(url, {'min_length': 50, 'max_length': 52})) == [
+        'Кабель 40', 'Кабель 41', 'Кабель 42']
+    assert _names(client.get(url, {'min_height': 20})) == ['Дрель']
+    # Некорректные значения фильтров игнорируются
+    assert client.get(url, {'min_length': 'abc', 'after': 'garbage'}).status_code == 200
+
+
+@pytest.mark.django_db
+def test_on_hand_stock_and_first_batch(client, user, rack, batch):
+    Placement.objects.create(batch=batch, rack=rack, product=batch.product, quantity=4)
+    Placement.objects.create(batch=batch, rack=rack, product=batch.product, quantity=3)
+    Placement.objects.create(batch=batch, rack=rack, product=batch.product, quantity=9,
+                             is_active=False)
+    client.force_login(user)
+    response = client.get(reverse('warehouse:product_list'))
+    product = response.context['products'].object_list[0]
+    assert product.on_hand == 7
+    assert product.first_batch_id == batch.pk
+    assert reverse('warehouse:suggest_racks', kwargs={'batch_id': batch.pk}) in response.content.decode()
+
+
+@pytest.mark.django_db
+def test_page_query_follows_name_index(client, user, catalog):
+    client.force_login(user)
+    with CaptureQueriesContext(connection) as queries:
+        client.get(reverse('warehouse:product_list'), {'after': encode_cursor(['Кабель 10', 0])})
+    [page_sql] = [query['sql'] for query in queries
+                  if 'FROM "warehouse_product"' in query['sql'] and 'LIMIT 21' in query['sql']]
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {page_sql}')
+        plan = [row[-1] for row in cursor.fetchall()]
+    # Остаток не группирует весь каталог: страница читается по индексу (name, id)
+    assert plan[0].startswith('SEARCH warehouse_product USING INDEX product_name_id_idx')
+    assert not any('GROUP BY' in step for step in plan)
+
+
+@pytest.mark.django_db
+@pytest.mark.query_budget(4)
+def test_product_list_query_count_is_constant(client, user, catalog, assert_within_budget):
+    client.force_login(user)
+    response = client.get(reverse('warehouse:product_list'), {'search': 'Кабель'})
+    assert len(response.context['products']) == 20
+    assert_within_budget(response)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(['Кабель 01', 17])
+    assert decode_cursor(cursor, 2) == ['Кабель 01', 17]
+    assert decode_cursor(cursor, 3) is None
+    assert decode_cursor('не курсор', 2) is None
@@ -0,0 +1,65 @@
+import pytest
+from django.urls import reverse
+
+from warehouse import profiling
+
+
+@pytest.fixture(autouse=True)
+def profiling_dir(settings, tmp_path):
+    settings.PROFILING_DIR = tmp_path / 'profiles'
+    return settings.PROFILING_DIR
+
+
+@pytest.mark.django_db
+def test_staff_request_is_profiled(client, staff_user, seeded_warehouse, profiling_dir):
+    client.force_login(staff_user)
+    response = client.get(reverse('warehouse:rack_list'), {'_profile': '1'})
+    assert response.status_code == 200
+    profile_id = response['X-Profile-Id']
+    assert (profiling_dir / f'{profile_id}.prof').exists()
+
+    profile = profiling.load_profile(profile_id)
+    assert profile['view'] == 'warehouse:rack_list'
+    assert profile['query_count'] == len(profile['queries']) > 0
+    assert any(q.get('explain') for q in profile['queries'])
+    assert 'cumulative' in profile['stats'] or 'function calls' in profile['stats']
+
+
+@pytest.mark.django_db
+def test_header_toggle_and_non_staff_ignored(client, user, staff_user):
+    client.force_login(user)
+    response = client.get(reverse('warehouse:dashboard'), HTTP_X_PROFILE='1')
+    assert 'X-Profile-Id' not in response
+    assert profiling.list_profiles() == []
+
+    client.force_login(staff_user)
+    response = client.get(reverse('warehouse:dashboard'), HTTP_X_PROFILE='1')
+    assert 'X-Profile-Id' in response
+
+
+@pytest.mark.django_db
+def test_profile_pages_are_staff_only(client, user, staff_user):
+    client.force_login(staff_user)
+    profile_id = client.get(reverse('warehouse:dashboard'), {'_profile': '1'})['X-Profile-Id']
+
+    response = client.get(reverse('warehouse:profile_list'))
+    assert response.status_code == 200
+    assert [p['id'] for p in response.context['profiles']] == [profile_id]
+    response = client.get(reverse('warehouse:profile_detail', kwargs={'profile_id': profile_id}))
+    assert response.status_code == 200
+    response = client.get(reverse('warehouse:profile_download', kwargs={'profile_id': profile_id}))
+    assert response.status_code == 200
+    response = client.get(reverse('warehouse:profile_detail', kwargs={'profile_id': 'not-a-profile'}))
+    assert response.status_code == 404
+
+    client.force_login(user)
+    assert client.get(reverse('warehouse:profile_list')).status_code == 403
+
+
+@pytest.mark.django_db
+def test_old_profiles_are_pruned(client, staff_user, settings):
+    settings.PROFILING_MAX_PROFILES = 2
+    client.force_login(staff_user)
+    for _ in range(4):
+        client.get(reverse('warehouse:dashboard'), {'_profile': '1'})
+    assert len(profiling.list_profiles()) == 2
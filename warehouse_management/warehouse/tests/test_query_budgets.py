@@ -0,0 +1,58 @@
+import pytest
+from django.urls import reverse
+
+from warehouse.middleware import QueryBudgetExceeded
+
+
+BUDGETED_VIEWS = [
+    'warehouse:dashboard',
+    'warehouse:product_list',
+    'warehouse:rack_list',
+    'warehouse:batch_list',
+    'warehouse:journal',
+]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('view_name', BUDGETED_VIEWS)
+def test_view_within_query_budget(client, user, seeded_warehouse, assert_within_budget, view_name):
+    client.force_login(user)
+    response = client.get(reverse(view_name))
+    assert response.status_code == 200
+    assert_within_budget(response)
+
+
+@pytest.mark.django_db
+def test_search_within_query_budget(client, user, seeded_warehouse, assert_within_budget):
+    client.force_login(user)
+    response = client.get(reverse('warehouse:search_product'), {'q': 'Товар'})
+    assert response.status_code == 200
+    assert_within_budget(response)
+
+
+@pytest.mark.django_db
+def test_query_headers_and_duplicates(client, user, rack):
+    client.force_login(user)
+    response = client.get(reverse('warehouse:rack_list'))
+    assert int(response['X-DB-Queries']) > 0
+    assert float(response['X-DB-Time-Ms']) >= 0
+    assert response['X-DB-Duplicates'] == '0'
+    assert response['X-DB-Budget'] == '6'
+
+
+@pytest.mark.django_db
+@pytest.mark.query_budget(1)
+def test_budget_marker_overrides_settings(client, user, assert_within_budget):
+    client.force_login(user)
+    response = client.get(reverse('warehouse:dashboard'))
+    with pytest.raises(AssertionError):
+        assert_within_budget(response)
+
+
+@pytest.mark.django_db
+def test_strict_mode_raises(client, user, settings):
+    settings.QUERY_BUDGETS = {'warehouse:dashboard': 1}
+    settings.QUERY_BUDGET_STRICT = True
+    client.force_login(user)
+    with pytest.raises(QueryBudgetExceeded):
+        client.get(reverse('warehouse:dashboard'))
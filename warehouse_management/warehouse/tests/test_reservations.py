@@ -0,0 +1,109 @@
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from warehouse import journal, reservations, stock
+from warehouse.forms import IssueForm
+from warehouse.models import Placement, Rack, Reservation, WarehouseJournal
+
+
+@pytest.fixture
+def stocked(batch, rack):
+    Placement.objects.create(rack=rack, product=batch.product, batch=batch, quantity=10)
+    return batch.product
+
+
+def _available(product):
+    return stock.available([product.pk]).get(product.pk, 0)
+
+
+@pytest.mark.django_db
+def test_reservation_lowers_available_stock(stocked):
+    with journal.unit_of_work():
+        reservation = reservations.create(stocked, 7, 'З-1', 'Кладовщик')
+    assert _available(stocked) == 3
+    form = IssueForm(data={'product': stocked.pk, 'quantity': 4, 'operator': 'Кладовщик'})
+    assert not form.is_valid()
+    assert 'Доступно: 3' in form.non_field_errors()[0]
+
+    with journal.unit_of_work():
+        assert reservations.release(reservation)
+        assert not reservations.release(reservation)
+    assert _available(stocked) == 10
+
+
+@pytest.mark.django_db
+def test_fulfill_issues_reserved_quantity_once(stocked):
+    with journal.unit_of_work():
+        reservation = reservations.create(stocked, 6, 'З-2', 'Кладовщик')
+    with journal.unit_of_work():
+        line = reservations.fulfill(reservation, 'Сборщик')
+        assert line.issued == 6
+        assert reservations.fulfill(reservation, 'Сборщик') is None
+        assert not reservations.release(reservation)
+    assert Placement.objects.get().quantity == 4
+    assert _available(stocked) == 4
+    assert WarehouseJournal.objects.get(operation_type='OUT').operator == 'Сборщик'
+
+
+@pytest.mark.django_db
+def test_pinned_reservation_picks_from_its_rack(stocked, batch, rack):
+    other = Rack.objects.create(name='Стеллаж-B1', max_load=100, length=100, width=50, height=200)
+    pinned = Placement.objects.create(rack=other, product=stocked, batch=batch, quantity=5)
+    with journal.unit_of_work():
+        reservation = reservations.create(stocked, 5, 'З-3', 'Кладовщик', rack=other)
+        reservations.fulfill(reservation, 'Сборщик')
+    pinned.refresh_from_db()
+    assert not pinned.is_active
+    # Более раннее размещение на первом стеллаже не тронуто
+    assert Placement.objects.get(rack=rack).quantity == 10
+
+
+@pytest.mark.django_db
+def test_expire_returns_stock_and_reads_index(stocked):
+    with journal.unit_of_work():
+        old = reservations.create(stocked, 4, 'З-4', 'Кладовщик', ttl=timedelta(minutes=1))
+        fresh = reservations.create(stocked, 2, 'З-5', 'Кладовщик')
+    later = timezone.now() + timedelta(minutes=5)
+    with journal.unit_of_work():
+        assert reservations.expire(now=later) == 1
+    assert _available(stocked) == 8
+    old.refresh_from_db()
+    assert old.status == Reservation.EXPIRED
+    # Истекший резерв больше нельзя выдать
+    with journal.unit_of_work():
+        assert reservations.fulfill(old, 'Сборщик') is None
+    plan = Reservation.objects.filter(status=Reservation.ACTIVE, expires_at__lte=later).order_by(
+        'expires_at').explain()
+    assert 'reservation_expiry_idx' in plan
+
+    Reservation.objects.filter(pk=fresh.pk).update(expires_at=timezone.now())
+    call_command('expire_reservations')
+    assert _available(stocked) == 10
+
+
+@pytest.mark.django_db
+def test_reservation_views(client, user, stocked, rack):
+    client.force_login(user)
+    url = reverse('warehouse:reservation_list')
+    response = client.post(url, {'product': stocked.pk, 'quantity': 3, 'order': 'З-6',
+                                 'operator': 'Кладовщик', 'ttl': 30, 'rack': rack.pk})
+    assert response.status_code == 302
+    reservation = Reservation.objects.get()
+    assert reservation.rack == rack and reservation.status == Reservation.ACTIVE
+    assert 'З-6' in client.get(url).content.decode()
+
+    response = client.post(url, {'product': stocked.pk, 'quantity': 8, 'order': 'З-7',
+                                 'operator': 'Кладовщик', 'ttl': 30})
+    assert response.status_code == 200
+    assert 'Доступно: 7' in response.content.decode()
+
+    response = client.post(reverse('warehouse:reservation_issue', args=[reservation.pk]),
+                           {'operator': 'Сборщик'})
+    assert response.status_code == 302
+    reservation.refresh_from_db()
+    assert reservation.status == Reservation.FULFILLED
+    assert Placement.objects.get().quantity == 7
@@ -0,0 +1,148 @@
+import json
+import threading
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from warehouse import journal, reservations, scans
+from warehouse.labels import label_payload, parse_label_payload
+from warehouse.models import Placement, ScanKey, WarehouseJournal
+
+
+@pytest.fixture(autouse=True)
+def no_coalesce_window(settings):
+    settings.SCAN_COALESCE_WINDOW = 0
+
+
+def _scan(client, *items):
+    response = client.post(reverse('warehouse:api_scans'), json.dumps({'items': list(items)}),
+                           content_type='application/json')
+    assert response.status_code == 200
+    return response.json()['results']
+
+
+@pytest.fixture
+def api_client(client, user):
+    client.force_login(user)
+    return client
+
+
+def test_parse_label_payload():
+    assert parse_label_payload(label_payload('SMART-001', 12)) == ('SMART-001', 12)
+    assert parse_label_payload(' A/B/7 ') == ('A/B', 7)
+    assert parse_label_payload('SMART-001') == ('SMART-001', None)
+    assert parse_label_payload('A/B') == ('A/B', None)
+
+
+@pytest.mark.django_db
+def test_retried_place_scan_is_applied_once(api_client, batch, rack):
+    code = label_payload(batch.product.sku, batch.pk)
+    scan = {'key': 'tsd1-0001', 'action': 'place', 'code': code, 'rack': rack.pk, 'quantity': 4}
+    first = _scan(api_client, scan)[0]
+    assert first['status'] == 'ok' and 'duplicate' not in first
+    retry = _scan(api_client, scan)[0]
+    assert retry['duplicate'] and retry['placement'] == first['placement']
+    assert Placement.objects.get().quantity == 4
+    assert ScanKey.objects.get(key='tsd1-0001').result['placement'] == first['placement']
+
+
+@pytest.mark.django_db
+def test_scans_are_coalesced_into_bulk_writes(api_client, batch, rack):
+    code = label_payload(batch.product.sku, batch.pk)
+    results = _scan(api_client, *[
+        {'key': f'k{i}', 'action': 'place', 'code': code, 'rack': rack.pk} for i in range(5)
+    ], {'key': 'k0', 'action': 'place', 'code': code, 'rack': rack.pk})
+    assert [r['status'] for r in results] == ['ok'] * 6
+    assert results[5]['duplicate']
+    placement = Placement.objects.get()
+    assert placement.quantity == 5
+    assert WarehouseJournal.objects.get(operation_type='IN').quantity == 5
+
+    results = _scan(api_client, *[
+        {'key': f'i{i}', 'action': 'issue', 'code': batch.product.sku} for i in range(3)
+    ], {'key': 'c1', 'action': 'count', 'code': code, 'rack': rack.pk, 'quantity': 1})
+    assert [r['status'] for r in results] == ['ok'] * 4
+    placement.refresh_from_db()
+    assert placement.quantity == 2
+    assert WarehouseJournal.objects.get(operation_type='OUT').quantity == 3
+    # Пересчет сравнивается с остатком после выдач той же пачки
+    assert (results[3]['expected'], results[3]['difference']) == (2, -1)
+
+
+@pytest.mark.django_db
+def test_scan_errors_and_validation(api_client, product, batch, rack):
+    results = _scan(
+        api_client,
+        {'key': 'e1', 'action': 'issue', 'code': product.sku, 'quantity': 1},
+        {'key': 'e2', 'action': 'place', 'code': product.sku, 'rack': rack.pk},
+        {'key': 'e3', 'action': 'place', 'code': 'NOPE/1', 'rack': rack.pk},
+        {'key': 'e4', 'action': 'place', 'code': label_payload(product.sku, batch.pk)},
+        {'action': 'jump', 'code': 'x'},
+    )
+    assert [r['status'] for r in results] == ['error'] * 5
+    assert 'Недостаточно товара' in results[0]['errors'][0]
+    assert 'этикетку партии' in results[1]['errors'][0]
+    assert 'NOPE' in results[2]['errors'][0]
+    assert results[3]['errors'] == ['Не указан стеллаж']
+    assert set(results[4]['errors']) == {'key', 'action'}
+    # Ошибка тоже сохраняется: повтор с тем же ключом ее не переигрывает
+    assert ScanKey.objects.count() == 4
+
+
+@pytest.mark.django_db
+def test_issue_scan_respects_reservations(api_client, batch, rack):
+    Placement.objects.create(rack=rack, product=batch.product, batch=batch, quantity=10)
+    with journal.unit_of_work():
+        reservations.create(batch.product, 7, 'З-1', 'Кладовщик')
+    results = _scan(api_client, {'key': 'r1', 'action': 'issue', 'code': batch.product.sku,
+                                 'quantity': 5})
+    assert results[0]['status'] == 'error'
+    assert 'Доступно: 3' in results[0]['errors'][0]
+    assert Placement.objects.get().quantity == 10
+
+
+@pytest.mark.django_db
+def test_scan_queries_do_not_grow(api_client, batch, rack):
+    code = label_payload(batch.product.sku, batch.pk)
+
+    def send(prefix, count):
+        items = [{'key': f'{prefix}{i}', 'action': 'place', 'code': code, 'rack': rack.pk}
+                 for i in range(count)]
+        with CaptureQueriesContext(connection) as queries:
+            _scan(api_client, *items)
+        return len(queries)
+
+    assert send('a', 2) == send('b', 20)
+
+
+def test_concurrent_requests_share_one_flush(settings, monkeypatch):
+    settings.SCAN_COALESCE_WINDOW = 0.2
+    flushed = []
+
+    def fake_flush(batch):
+        flushed.append(len(batch))
+        for scan in batch:
+            scan.result = {'status': 'ok'}
+
+    monkeypatch.setattr(scans, 'flush', fake_flush)
+    buffer = scans.ScanBuffer()
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.extend(buffer.submit(
+        [scans.Scan(f'k{i}-{j}', scans.ISSUE, 'SKU') for j in range(3)]))) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert flushed == [12]
+    assert results == [{'status': 'ok'}] * 12
+
+
+def test_failed_flush_releases_waiters(monkeypatch):
+    def broken_flush(batch):
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(scans, 'flush', broken_flush)
+    result, = scans.ScanBuffer().submit([scans.Scan('k', scans.ISSUE, 'SKU')])
+    assert result['status'] == 'error'
@@ -0,0 +1,109 @@
+from importlib import import_module
+
+import pytest
+from django.db import connection
+from django.urls import reverse
+
+from warehouse import search
+from warehouse.models import Category, Product, Placement
+
+
+@pytest.fixture
+def catalog(db, category):
+    tools = Category.objects.create(name="Инструменты")
+    return [
+        Product.objects.create(name="Смартфон Альфа", category=category, sku="PH-1001",
+                               length=15, width=7, height=1, weight=0.2),
+        Product.objects.create(name="Чехол для смартфона", category=category, sku="CS-2001",
+                               length=16, width=8, height=1, weight=0.05),
+        Product.objects.create(name="Дрель", category=tools, sku="PH-2002",
+                               length=30, width=10, height=25, weight=2),
+    ]
+
+
+def _names(query, **kwargs):
+    return [p.name for p in search.search_products(query, **kwargs)]
+
+
+@pytest.mark.django_db
+def test_index_follows_product_writes(catalog):
+    assert _names('дрель') == ['Дрель']
+    drill = catalog[2]
+    drill.name = 'Перфоратор'
+    drill.save()
+    assert _names('дрель') == []
+    assert _names('перфоратор') == ['Перфоратор']
+    drill.delete()
+    assert _names('перфоратор') == []
+
+
+@pytest.mark.django_db
+def test_sku_prefix_and_category_search(catalog):
+    assert sorted(_names('PH-')) == ['Дрель', 'Смартфон Альфа']
+    assert _names('PH-10') == ['Смартфон Альфа']
+    assert _names('инструм') == ['Дрель']
+
+    Category.objects.filter(name='Инструменты').update(name='Оборудование')
+    assert _names('инструм') == []
+    assert _names('оборуд') == ['Дрель']
+
+
+@pytest.mark.django_db
+def test_ranking_prefers_name_over_category(catalog, category):
+    Product.objects.create(name="Аккумулятор", category=Category.objects.create(name="Смартфоны б/у"),
+                           sku="AC-1", length=5, width=5, height=1, weight=0.1)
+    names = _names('смартфон')
+    assert names[-1] == 'Аккумулятор'
+    assert set(names[:2]) == {'Смартфон Альфа', 'Чехол для смартфона'}
+
+
+@pytest.mark.django_db
+def test_results_are_paginated(category):
+    Product.objects.bulk_create([
+        Product(name=f"Кабель {i:02d}", category=category, sku=f"CB-{i:03d}",
+                length=1, width=1, height=1, weight=0.1)
+        for i in range(25)
+    ])
+    first = search.search_products('кабель', page=1, per_page=10)
+    last = search.search_products('кабель', page=3, per_page=10)
+    assert first.count == 25 and first.num_pages == 3
+    assert len(first) == 10 and len(last) == 5
+    assert not set(p.pk for p in first) & set(p.pk for p in last)
+
+
+@pytest.mark.django_db
+def test_rebuild_index(catalog):
+    search.rebuild_index()
+    assert _names('чехол') == ['Чехол для смартфона']
+
+
+@pytest.mark.django_db
+def test_search_migration_is_reversible(catalog):
+    migration = import_module('warehouse.migrations.0015_product_search_fts')
+    with connection.cursor() as cursor:
+        for statement in migration.REVERSE_SQL:
+            cursor.execute(statement)
+        cursor.execute("SELECT count(*) FROM sqlite_master WHERE name LIKE 'warehouse_product_fts%'")
+        assert cursor.fetchone()[0] == 0
+        # Прямая миграция на базе с товарами создает индекс и заполняет его
+        for statement in migration.FORWARD_SQL:
+            cursor.execute(statement)
+    assert _names('чехол') == ['Чехол для смартфона']
+    Product.objects.filter(pk=catalog[0].pk).update(name='Планшет')
+    assert _names('планшет') == ['Планшет']
+
+
+def test_build_match_query():
+    assert search.build_match_query('SKU-0012 "кабель') == '"SKU 0012"* AND "кабель"*'
+    assert search.build_match_query(' -- ') == ''
+
+
+@pytest.mark.django_db
+def test_search_view_paginates_placements(client, user, catalog, rack):
+    for _ in range(3):
+        Placement.objects.create(rack=rack, product=catalog[0], quantity=1)
+    client.force_login(user)
+    response = client.get(reverse('warehouse:search_product'), {'q': 'PH-1001'})
+    assert response.status_code == 200
+    assert [p.name for p in response.context['products']] == ['Смартфон Альфа']
+    assert response.context['placements'].paginator.count == 3
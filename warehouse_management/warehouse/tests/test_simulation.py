@@ -0,0 +1,92 @@
+import random
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from warehouse.models import Placement, Product, Rack, WarehouseJournal
+from warehouse.simulation import CapacitySimulation, Inbound
+
+
+@pytest.fixture
+def box(category):
+    return Product.objects.create(name='Коробка', category=category, sku='BOX-1',
+                                  length=10, width=10, height=10, weight=1)
+
+
+@pytest.fixture
+def narrow_rack(box):
+    """Стеллаж на 6 коробок, 2 уже стоят"""
+    rack = Rack.objects.create(name='Узкий', max_load=100, length=10, width=10, height=60)
+    Placement.objects.create(rack=rack, product=box, quantity=2)
+    return rack
+
+
+@pytest.mark.django_db
+def test_reports_day_capacity_runs_out(box, narrow_rack):
+    model = CapacitySimulation()
+    with CaptureQueriesContext(connection) as queries:
+        result = model.run([Inbound(1, box.pk, 3), Inbound(2, box.pk, 3)], days=5)
+    assert not any(q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) for q in queries)
+
+    assert (result.received, result.unplaced, result.shortage_day) == (4, 2, 2)
+    [rack_class] = result.classes
+    assert rack_class.label == '10×10×60 см, до 100 кг'
+    assert rack_class.full_date == model.today + timedelta(days=2)
+    assert rack_class.utilization[0] == pytest.approx(33.3)
+    assert rack_class.utilization[-1] == 100
+    # Снимок не изменился: повторный прогон дает тот же результат
+    assert model.run([Inbound(1, box.pk, 3), Inbound(2, box.pk, 3)], days=5).unplaced == 2
+    assert Placement.objects.get().quantity == 2
+
+
+@pytest.mark.django_db
+def test_projected_outbound_frees_space(box, narrow_rack):
+    now = timezone.now()
+    WarehouseJournal.objects.bulk_create([
+        WarehouseJournal(operation_type='OUT', product=box, quantity=2, operator='Кладовщик',
+                         operation_date=now - timedelta(days=day)) for day in range(7)])
+    model = CapacitySimulation(lookback_days=7)
+    result = model.run([Inbound(1, box.pk, 3), Inbound(2, box.pk, 3)], days=5)
+    assert result.unplaced == 0 and result.shortage_day is None
+    # Расход 2 в день; в день 1 склад пуст до прихода
+    assert result.issued == 8
+    assert model.run([Inbound(1, box.pk, 3), Inbound(2, box.pk, 3)], days=5,
+                     outbound_factor=0).unplaced == 2
+
+
+@pytest.mark.django_db
+def test_thousands_of_events_run_fast(seeded_warehouse):
+    products = list(Product.objects.values_list('pk', flat=True))
+    rnd = random.Random(1)
+    inbound = [Inbound(rnd.randrange(60), rnd.choice(products), rnd.randint(1, 20))
+               for _ in range(5000)]
+    result = CapacitySimulation().run(inbound, days=60)
+    assert result.events == 5000
+    assert result.received + result.unplaced == sum(event.quantity for event in inbound)
+    assert result.elapsed_ms < 1000
+
+
+@pytest.mark.django_db
+def test_capacity_plan_view(client, user, box, narrow_rack):
+    client.force_login(user)
+    url = reverse('warehouse:capacity_plan')
+    assert client.get(url).status_code == 200
+
+    tomorrow = timezone.localdate() + timedelta(days=1)
+    data = {'days': 10, 'lookback_days': 28, 'outbound_factor': 1,
+            'schedule': f'{tomorrow:%d.%m.%Y}; BOX-1; 10\nзавтра; BOX-1; 1\n{tomorrow}; NOPE; 1'}
+    response = client.post(url, data)
+    errors = response.context['form'].errors['schedule']
+    assert errors == ['Строка 2: неверная дата или количество',
+                      'Строка 3: товар с артикулом NOPE не найден']
+
+    data['schedule'] = f'# дата; артикул; количество\n{tomorrow:%d.%m.%Y}; BOX-1; 10'
+    response = client.post(url, data)
+    result = response.context['result']
+    assert result.unplaced == 6
+    assert result.shortage_date == tomorrow
+    assert tomorrow.strftime('%d.%m.%Y') in response.content.decode()
@@ -0,0 +1,147 @@
+from io import StringIO
+
+import pytest
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.urls import reverse
+
+from warehouse import journal, locations, services, slots
+from warehouse.forms import PlacementForm
+from warehouse.models import Batch, Placement, Product, Shelf
+
+
+@pytest.fixture
+def slotted(settings, rack):
+    """Одна полка на 10 ячеек по 10 см; стеллаж 100×50×200 см"""
+    settings.SLOT_ALLOCATION = True
+    slots.equip(rack, levels=1, slots=10)
+    return rack
+
+
+@pytest.fixture
+def crate(category):
+    """Ящик на 2 ячейки; в полосу входят 2 ящика друг на друге"""
+    return Product.objects.create(name='Ящик', category=category, sku='CRATE-1',
+                                  length=20, width=50, height=100, weight=1)
+
+
+def _place(crate, rack, quantity):
+    batch = Batch.objects.create(product=crate, quantity=quantity, supplier='ООО')
+    with journal.unit_of_work():
+        return services.place(batch, rack, quantity, 'Кладовщик')
+
+
+def _occupied(rack):
+    shelf = Shelf.objects.get(rack=rack)
+    return [i for i in range(shelf.slots) if shelf.bits >> i & 1]
+
+
+def test_bitmap_runs():
+    occupied = 0b0011110000
+    assert slots.find_run(occupied, 10, 4) == 0
+    assert slots.find_run(occupied, 10, 5) is None
+    assert slots.find_run(0b1111, 10, 6) == 4
+    assert slots.longest_run(occupied, 10) == 4
+    assert slots.longest_run(0, 10) == 10
+    assert slots.longest_run((1 << 10) - 1, 10) == 0
+
+
+@pytest.mark.django_db
+def test_placements_take_contiguous_lanes(slotted, crate):
+    first = _place(crate, slotted, 4)
+    second = _place(crate, slotted, 1)
+    assert (first.first_slot, first.slot_count) == (0, 4)
+    assert (second.first_slot, second.slot_count) == (4, 2)
+    assert _occupied(slotted) == [0, 1, 2, 3, 4, 5]
+
+
+@pytest.mark.django_db
+def test_issue_frees_slots(slotted, crate):
+    placement = _place(crate, slotted, 4)
+    with journal.unit_of_work():
+        services.issue(crate, 3, 'Кладовщик')
+    placement.refresh_from_db()
+    assert placement.slot_count == 2
+    assert _occupied(slotted) == [0, 1]
+    with journal.unit_of_work():
+        services.issue(crate, 1, 'Кладовщик')
+    assert _occupied(slotted) == []
+
+
+@pytest.mark.django_db
+def test_fragmented_space_is_not_offered(slotted, crate):
+    _place(crate, slotted, 4)
+    _place(crate, slotted, 2)
+    with journal.unit_of_work():
+        services.issue(crate, 4, 'Кладовщик')
+    # Свободны ячейки 0-3 и 6-9: по объему входит 8 ящиков, одним участком - 4
+    assert slotted.available_volume() // crate.get_volume() == 8
+    plan, remaining = locations.plan_placement(crate, 6)
+    assert [(rack.pk, max_quantity) for rack, max_quantity, _ in plan] == [(slotted.pk, 4)]
+
+    batch = Batch.objects.create(product=crate, quantity=6, supplier='ООО')
+    form = PlacementForm({'batch': batch.pk, 'rack': slotted.pk, 'quantity': 6}, batch_id=batch.pk)
+    assert not form.is_valid()
+    assert 'Поместится: 4' in form.non_field_errors()[0]
+
+
+@pytest.mark.django_db
+def test_concurrent_change_is_detected(slotted, crate):
+    slot_map = slots.SlotMap([slotted.pk])
+    assert slot_map.allocate(slotted, crate, 2) is not None
+    _place(crate, slotted, 2)
+    with pytest.raises(slots.SlotConflict):
+        slot_map.save()
+
+
+@pytest.mark.django_db
+def test_equip_lays_out_existing_stock_and_rebuild(settings, rack, crate):
+    settings.SLOT_ALLOCATION = False
+    placement = _place(crate, rack, 3)
+    assert placement.shelf_id is None
+    # Полки по 100 см: ящики не ставятся друг на друга, 3 ящика - 3 полосы
+    assert slots.equip(rack, levels=2, slots=10) == []
+    placement.refresh_from_db()
+    assert placement.shelf.level == 1 and placement.slot_count == 6
+
+    Shelf.objects.update(occupancy=b'')
+    output = StringIO()
+    call_command('equip_shelves', rebuild=True, stdout=output)
+    assert 'полок: 2' in output.getvalue()
+    assert Shelf.objects.get(rack=rack, level=1).occupied_slots() == 6
+
+
+@pytest.mark.django_db
+def test_disabled_allocation_ignores_shelves(settings, slotted, crate):
+    settings.SLOT_ALLOCATION = False
+    placement = _place(crate, slotted, 4)
+    assert placement.shelf_id is None
+    assert not Placement.objects.filter(slot_count__gt=0).exists()
+
+
+@pytest.mark.django_db
+def test_shelf_requires_slots(rack):
+    shelf = Shelf(rack=rack, level=1, height=50, slots=0)
+    with pytest.raises(ValidationError) as error:
+        shelf.full_clean()
+    assert set(error.value.message_dict) == {'slots'}
+
+
+@pytest.mark.django_db
+def test_issue_from_reshaped_shelf_keeps_lane(slotted, crate):
+    placement = _place(crate, slotted, 4)
+    # Полку опустили ниже ящика: полоса больше не вычисляется
+    Shelf.objects.filter(rack=slotted).update(height=50)
+    with journal.unit_of_work():
+        services.issue(crate, 1, 'Кладовщик')
+    placement.refresh_from_db()
+    assert placement.slot_count == 4
+    assert _occupied(slotted) == [0, 1, 2, 3]
+
+
+@pytest.mark.django_db
+def test_admin_locks_shelf_size_under_stock(admin_client, slotted, crate):
+    url = reverse('admin:warehouse_rack_change', args=[slotted.pk])
+    assert 'name="shelves-0-slots"' in admin_client.get(url).content.decode()
+    _place(crate, slotted, 1)
+    assert 'name="shelves-0-slots"' not in admin_client.get(url).content.decode()
@@ -0,0 +1,185 @@
+import threading
+import time
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+
+from warehouse import journal, services, stock
+from warehouse.forms import IssueForm
+from warehouse.models import Placement, StockShard, WarehouseJournal
+
+
+def _placed_total(product):
+    return Placement.objects.filter(product=product, is_active=True).aggregate(
+        total=Sum('quantity', default=0))['total']
+
+
+@pytest.mark.django_db
+def test_counters_follow_placements(batch, rack):
+    product = batch.product
+    assert StockShard.objects.filter(product=product).count() == 8
+    with journal.unit_of_work():
+        services.place(batch, rack, 30, 'Кладовщик')
+    placement = Placement.objects.create(rack=rack, product=product, batch=batch, quantity=5)
+    assert stock.available([product.pk]) == {product.pk: 35}
+
+    with journal.unit_of_work():
+        services.issue(product, 32, 'Кладовщик')
+    assert stock.available([product.pk]) == {product.pk: 3} == {product.pk: _placed_total(product)}
+
+    # Сохранение через save() тоже попадает в счетчики
+    placement.refresh_from_db()
+    placement.quantity = 10
+    placement.save()
+    assert stock.available([product.pk])[product.pk] == _placed_total(product) == 10
+
+
+@pytest.mark.django_db
+def test_reserve_never_goes_negative(product):
+    stock.add(product.pk, 5)
+    stock.add(product.pk, 5)
+    assert stock.reserve(product.pk, 25) == 10
+    assert stock.available([product.pk]) == {product.pk: 0}
+    assert not StockShard.objects.filter(quantity__lt=0).exists()
+
+
+@pytest.mark.django_db
+def test_stale_read_is_a_conflict(batch, rack):
+    with journal.unit_of_work():
+        services.place(batch, rack, 10, 'Кладовщик')
+    stale = services.active_placements([batch.product])
+    with journal.unit_of_work():
+        services.issue(batch.product, 4, 'Кладовщик')
+    with pytest.raises(services.StockConflict), journal.unit_of_work():
+        services.issue_lines([services.IssueLine(batch.product, 4, 'Кладовщик')], stale)
+    assert _placed_total(batch.product) == stock.available([batch.product.pk])[batch.product.pk] == 6
+
+
+@pytest.mark.django_db
+def test_issue_claims_skip_rows_of_other_issues(batch, rack, monkeypatch):
+    queryset = Placement.objects.filter(product=batch.product, is_active=True)
+    # SQLite не блокирует строки: выборка остается обычной
+    assert not services.claim_placements(queryset).query.select_for_update
+    monkeypatch.setattr(connection.features, 'has_select_for_update_skip_locked', True)
+    claimed = services.claim_placements(queryset).query
+    assert claimed.select_for_update and claimed.select_for_update_skip_locked
+
+
+@pytest.mark.django_db
+def test_issue_form_reads_counters(batch, rack):
+    Placement.objects.create(rack=rack, product=batch.product, batch=batch, quantity=5)
+    form = IssueForm(data={'product': batch.product.pk, 'quantity': 6, 'operator': 'Кладовщик'})
+    assert not form.is_valid()
+    assert 'Доступно: 5' in form.non_field_errors()[0]
+
+
+@pytest.mark.django_db
+def test_rebuild_stock_counters(batch, rack):
+    Placement.objects.create(rack=rack, product=batch.product, batch=batch, quantity=7)
+    StockShard.objects.update(quantity=100)
+    call_command('rebuild_stock_counters')
+    assert stock.available([batch.product.pk]) == {batch.product.pk: 7}
+
+
+@services.retry_on_conflict
+@journal.unit_of_work()
+def _issue(product, quantity):
+    """Выдача так же, как в IssueProductView: проверка по счетчикам, затем списание"""
+    if stock.available([product.pk]).get(product.pk, 0) < quantity:
+        return 0
+    return services.issue(product, quantity, 'Кладовщик').issued
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_issues_of_hot_product(batch, rack, settings):
+    settings.CONFLICT_RETRY_ATTEMPTS = 50
+    settings.CONFLICT_RETRY_DELAY = 0.005
+    product = batch.product
+    with journal.unit_of_work():
+        for _ in range(5):
+            services.place(batch, rack, 10, 'Кладовщик')
+
+    # 8 кладовщиков по 4 выдачи по 2 шт. при остатке 50: хватает не всем
+    issued = []
+    start = threading.Barrier(8)
+
+    def operator():
+        try:
+            start.wait()
+            for _ in range(4):
+                issued.append(_issue(product, 2))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=operator) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(issued) == 32
+    assert sum(issued) == 50
+    assert stock.available([product.pk]) == {product.pk: 0} == {product.pk: _placed_total(product)}
+    assert not StockShard.objects.filter(quantity__lt=0).exists()
+    out = WarehouseJournal.objects.filter(operation_type='OUT').aggregate(total=Sum('quantity'))
+    assert out['total'] == 50
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.skipif(connection.features.has_select_for_update_skip_locked,
+                    reason='Выдачи расходятся по строкам через SKIP LOCKED')
+def test_hot_product_issues_hold_write_lock_one_at_a_time(batch, rack, settings, monkeypatch):
+    settings.CONFLICT_RETRY_ATTEMPTS = 50
+    settings.CONFLICT_RETRY_DELAY = 0.005
+    product = batch.product
+    with journal.unit_of_work():
+        for _ in range(8):
+            services.place(batch, rack, 5, 'Кладовщик')
+
+    # Выдача держит запись от резерва на счетчиках до фиксации транзакции:
+    # отрезок от резерва до конца тела unit_of_work целиком лежит внутри нее
+    spans, attempts = [], []
+    started = threading.local()
+    reserve = stock.reserve
+
+    def tracked_reserve(product_id, quantity):
+        taken = reserve(product_id, quantity)
+        started.at = time.perf_counter()
+        return taken
+
+    monkeypatch.setattr(stock, 'reserve', tracked_reserve)
+
+    @services.retry_on_conflict
+    @journal.unit_of_work()
+    def issue_one():
+        attempts.append(1)
+        issued = services.issue(product, 1, 'Кладовщик').issued
+        spans.append((started.at, time.perf_counter()))
+        return issued
+
+    issued = []
+    start = threading.Barrier(8)
+
+    def operator():
+        try:
+            start.wait()
+            for _ in range(5):
+                issued.append(issue_one())
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=operator) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Все выдачи прошли, но в SQLite одновременно списывает только одна:
+    # пропускная способность по одному товару - один писатель
+    assert sum(issued) == 40
+    spans.sort()
+    assert all(end <= next_start for (_, end), (next_start, _) in zip(spans, spans[1:]))
+    assert len(attempts) >= len(issued) == 40
+    assert _placed_total(product) == stock.available([product.pk])[product.pk] == 0
@@ -0,0 +1,102 @@
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from PIL import Image
+
+from warehouse import thumbnails
+from warehouse.models import Product
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path / 'media'
+    settings.THUMBNAIL_ASYNC = False
+    return settings.MEDIA_ROOT
+
+
+def _upload(name='photo.png', size=(1200, 800), color=(200, 30, 30, 255)):
+    output = BytesIO()
+    Image.new('RGBA', size, color).save(output, 'PNG')
+    return SimpleUploadedFile(name, output.getvalue(), content_type='image/png')
+
+
+def _make_product(category, sku, image=None):
+    return Product.objects.create(name=f"Товар {sku}", category=category, sku=sku,
+                                  length=10, width=10, height=10, weight=1, image=image)
+
+
+@pytest.mark.django_db
+def test_upload_builds_variants_after_commit(category, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        product = _make_product(category, 'IMG-1', _upload())
+    product.refresh_from_db()
+    assert len(product.image_digest) == 64
+
+    for variant, size in thumbnails.get_sizes().items():
+        for fmt in thumbnails.FORMATS:
+            path = thumbnails.variant_path(product.image_digest, variant, fmt)
+            with default_storage.open(path) as f, Image.open(f) as image:
+                assert max(image.size) == max(size)
+                assert image.format == thumbnails.FORMATS[fmt]
+    assert product.image_url() == default_storage.url(
+        thumbnails.variant_path(product.image_digest, 'list'))
+    assert product.image_urls()['card'].endswith('/card.webp')
+
+
+@pytest.mark.django_db
+def test_original_served_until_thumbnails_ready(category, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        product = _make_product(category, 'IMG-2', _upload())
+    assert product.image_digest == ''
+    assert product.image_url() == product.image.url
+    assert len(callbacks) == 1
+
+
+@pytest.mark.django_db
+def test_duplicate_uploads_share_thumbnails(category, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        first = _make_product(category, 'IMG-3', _upload('a.png'))
+        second = _make_product(category, 'IMG-4', _upload('b.png'))
+    first.refresh_from_db()
+    second.refresh_from_db()
+    assert first.image.name != second.image.name
+    assert first.image_digest == second.image_digest
+    assert first.image_url() == second.image_url()
+    stored = list(Path(default_storage.path(thumbnails.ROOT)).rglob('*.*'))
+    assert len(stored) == len(thumbnails.get_sizes()) * len(thumbnails.FORMATS)
+
+
+@pytest.mark.django_db
+def test_resave_without_new_upload_keeps_digest(category, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        product = _make_product(category, 'IMG-5', _upload())
+    product.refresh_from_db()
+    digest = product.image_digest
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        product.name = 'Новое название'
+        product.save()
+    assert callbacks == []
+    product.refresh_from_db()
+    assert product.image_digest == digest
+
+    product.image = None
+    product.save()
+    product.refresh_from_db()
+    assert product.image_digest == ''
+
+
+@pytest.mark.django_db
+def test_rebuild_thumbnails_command(category):
+    Product.objects.bulk_create([
+        Product(name=f"Товар {i}", category=category, sku=f"BK-{i}",
+                length=1, width=1, height=1, weight=1,
+                image=default_storage.save('products/same.png', _upload()))
+        for i in range(3)
+    ])
+    call_command('rebuild_thumbnails', '--workers', '1')
+    digests = set(Product.objects.values_list('image_digest', flat=True))
+    assert len(digests) == 1 and '' not in digests
@@ -1,7 +1,9 @@
 import pytest
 from django.urls import reverse
 from django.utils import timezone
-from warehouse.models import Placement, Product, WarehouseJournal
+from warehouse import reservations, services
+from warehouse.models import Placement, Product, Reservation, WarehouseJournal
+from warehouse.views import CONFLICT_MESSAGE
 
 
 @pytest.mark.django_db
@@ -13,6 +15,17 @@ def test_dashboard_view(client, user):
     assert 'total_racks' in response.context
 
 
+@pytest.mark.django_db
+def test_dashboard_shows_racks_without_zones(client, user, rack, batch):
+    Placement.objects.create(rack=rack, product=batch.product, batch=batch, quantity=10)
+    client.force_login(user)
+    response = client.get(reverse('warehouse:dashboard'))
+    assert response.context['zones_utilization'] == []
+    [item] = response.context['racks_utilization']
+    assert item['rack'] == rack and item['utilization'] > 0
+    assert 'Загрузка стеллажей' in response.content.decode()
+
+
 @pytest.mark.django_db
 def test_product_list_view(client, user, product):
     client.force_login(user)
@@ -97,3 +110,53 @@ def test_issue_product_view(client, user, product, rack, batch):
         operation_type='OUT').first()
     assert journal_entry.quantity == 5
     assert journal_entry.product == product
+
+
+@pytest.mark.django_db(transaction=True)
+def test_issue_conflict_is_reported_in_form(client, user, product, rack, batch, monkeypatch):
+    Placement.objects.create(rack=rack, product=product, batch=batch, quantity=10)
+    monkeypatch.setattr(services.time, 'sleep', lambda seconds: None)
+
+    def conflict(*args):
+        raise services.StockConflict('Остаток изменен конкурентной выдачей')
+
+    monkeypatch.setattr(services, 'issue', conflict)
+    client.force_login(user)
+    response = client.post(reverse('warehouse:issue_product'),
+                           {'product': product.id, 'quantity': 4, 'operator': 'Кладовщик'})
+    assert response.status_code == 200
+    assert CONFLICT_MESSAGE in response.context['form'].non_field_errors()
+    assert not WarehouseJournal.objects.filter(operation_type='OUT').exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_place_conflict_redirects_with_message(client, user, batch, rack, monkeypatch):
+    monkeypatch.setattr(services.time, 'sleep', lambda seconds: None)
+
+    def conflict(*args):
+        raise services.StockConflict('Стеллаж изменен конкурентной операцией')
+
+    monkeypatch.setattr(services, 'place', conflict)
+    client.force_login(user)
+    url = reverse('warehouse:place_batch', kwargs={'batch_id': batch.id})
+    response = client.post(url, {'batch': batch.id, 'rack': rack.id, 'quantity': 10}, follow=True)
+    assert response.redirect_chain == [(url, 302)]
+    assert [str(message) for message in response.context['messages']] == [CONFLICT_MESSAGE]
+    assert not Placement.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reservation_conflict_redirects_with_message(client, user, product, monkeypatch):
+    monkeypatch.setattr(services.time, 'sleep', lambda seconds: None)
+    reservation = Reservation.objects.create(product=product, quantity=1, order='З-1',
+                                             operator='Кладовщик', expires_at=timezone.now())
+
+    def conflict(*args):
+        raise services.StockConflict('Остаток изменен конкурентной операцией')
+
+    monkeypatch.setattr(reservations, 'release', conflict)
+    client.force_login(user)
+    response = client.post(reverse('warehouse:reservation_release', args=[reservation.pk]),
+                           follow=True)
+    assert response.status_code == 200
+    assert [str(message) for message in response.context['messages']] == [CONFLICT_MESSAGE]
@@ -0,0 +1,144 @@
+"""Миниатюры изображений товаров, которые строятся в фоне.
+
+После загрузки изображения пул потоков читает оригинал, считает его SHA-256
+и сохраняет варианты THUMBNAIL_SIZES в форматах WebP и JPEG по пути
+``thumbnails/<ab>/<sha256>/<вариант>.<ext>``. Одинаковые загрузки дают один
+и тот же путь, поэтому миниатюры не дублируются и строятся один раз. Пока
+варианты не готовы, Product.image_url() отдает оригинал.
+"""
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger('warehouse.thumbnails')
+
+DEFAULT_SIZES = {'list': (96, 96), 'card': (320, 320)}
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+ROOT = 'thumbnails'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_sizes():
+    return getattr(settings, 'THUMBNAIL_SIZES', DEFAULT_SIZES)
+
+
+def variant_path(digest, variant, fmt='webp'):
+    return f'{ROOT}/{digest[:2]}/{digest}/{variant}.{fmt}'
+
+
+def variant_url(digest, variant, fmt='webp'):
+    return default_storage.url(variant_path(digest, variant, fmt))
+
+
+def file_digest(field_file):
+    sha = hashlib.sha256()
+    with field_file.open('rb') as f:
+        for chunk in f.chunks():
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def render_variants(data):
+    """Байты всех вариантов: {(вариант, формат): bytes}"""
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(data)) as source:
+        source = ImageOps.exif_transpose(source)
+        has_alpha = source.mode in ('RGBA', 'LA') or 'transparency' in source.info
+        source = source.convert('RGBA' if has_alpha else 'RGB')
+        results = {}
+        for variant, size in get_sizes().items():
+            image = source.copy()
+            image.thumbnail(size, Image.Resampling.LANCZOS)
+            for fmt, pil_format in FORMATS.items():
+                output = BytesIO()
+                if fmt == 'webp':
+                    image.save(output, pil_format, quality=80, method=4)
+                else:
+                    flat = image
+                    if image.mode == 'RGBA':
+                        # У JPEG нет прозрачности: подкладываем белый фон
+                        flat = Image.new('RGB', image.size, (255, 255, 255))
+                        flat.paste(image, mask=image.getchannel('A'))
+                    flat.save(output, pil_format, quality=82, optimize=True, progressive=True)
+                results[variant, fmt] = output.getvalue()
+    return results
+
+
+def generate(product_id):
+    """Строит миниатюры товара и записывает их дайджест (выполняется в пуле)"""
+    from .models import Product
+
+    product = Product.objects.filter(pk=product_id).only('image', 'image_digest').first()
+    if product is None or not product.image:
+        return None
+    image_name = product.image.name
+    digest = file_digest(product.image)
+
+    missing = [(variant, fmt) for variant in get_sizes() for fmt in FORMATS
+               if not default_storage.exists(variant_path(digest, variant, fmt))]
+    if missing:
+        with product.image.open('rb') as f:
+            rendered = render_variants(f.read())
+        for variant, fmt in missing:
+            default_storage.save(variant_path(digest, variant, fmt),
+                                 ContentFile(rendered[variant, fmt]))
+
+    # Если за время обработки загрузили другое изображение, дайджест не записываем
+    Product.objects.filter(pk=product_id, image=image_name).update(image_digest=digest)
+    return digest
+
+
+def run_job(product_id):
+    """generate() для потока пула: ошибки в лог, соединение с БД закрывается"""
+    try:
+        return generate(product_id)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры товара #%s', product_id)
+        return None
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+                thread_name_prefix='thumbnails')
+        return _executor
+
+
+def schedule(product_id):
+    """Ставит построение миниатюр в пул после фиксации транзакции"""
+    if not getattr(settings, 'THUMBNAIL_ASYNC', True):
+        transaction.on_commit(lambda: generate(product_id))
+        return
+    transaction.on_commit(lambda: get_executor().submit(run_job, product_id))
+
+
+def track_image_change(sender, instance, raw=False, **kwargs):
+    """pre_save: новая загрузка сбрасывает дайджест до готовности миниатюр"""
+    if raw:
+        return
+    image = instance.image
+    instance._thumbnails_pending = bool(image) and not image._committed
+    if instance._thumbnails_pending or not image:
+        instance.image_digest = ''
+
+
+def schedule_on_upload(sender, instance, raw=False, **kwargs):
+    """post_save: запускает построение миниатюр для новой загрузки"""
+    if not raw and getattr(instance, '_thumbnails_pending', False):
+        instance._thumbnails_pending = False
+        schedule(instance.pk)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 app_name = 'warehouse'
 
@@ -10,27 +10,60 @@ urlpatterns = [
     path('products/', views.ProductListView.as_view(), name='product_list'),
     path('products/create/', views.ProductCreateView.as_view(), name='product_create'),
     path('products/<int:pk>/update/', views.ProductUpdateView.as_view(), name='product_update'),
+    path('products/autocomplete/', views.ProductAutocompleteView.as_view(), name='product_autocomplete'),
     
     # Стеллажи
     path('racks/', views.RackListView.as_view(), name='rack_list'),
     path('racks/create/', views.RackCreateView.as_view(), name='rack_create'),
     path('racks/<int:pk>/update/', views.RackUpdateView.as_view(), name='rack_update'),
+    path('racks/autocomplete/', views.RackAutocompleteView.as_view(), name='rack_autocomplete'),
     
     # Партии
     path('batches/', views.BatchListView.as_view(), name='batch_list'),
     path('batches/create/', views.BatchCreateView.as_view(), name='batch_create'),
     path('batches/<int:batch_id>/suggest-racks/', views.SuggestRacksView.as_view(), name='suggest_racks'),
     path('batches/<int:batch_id>/place/', views.PlaceBatchView.as_view(), name='place_batch'),
+    path('batches/<int:batch_id>/labels/', views.BatchLabelsView.as_view(), name='batch_labels'),
+    path('batches/labels/', views.WaveLabelsView.as_view(), name='wave_labels'),
+    path('batches/expiring/', views.ExpiringStockView.as_view(), name='expiring_stock'),
     
     # Выдача товара
     path('issue/', views.IssueProductView.as_view(), name='issue_product'),
+
+    # Резервы под заказы
+    path('reservations/', views.ReservationListView.as_view(), name='reservation_list'),
+    path('reservations/<int:pk>/issue/', views.ReservationIssueView.as_view(), name='reservation_issue'),
+    path('reservations/<int:pk>/release/', views.ReservationReleaseView.as_view(), name='reservation_release'),
     
     # Поиск товара
     path('search/', views.SearchProductView.as_view(), name='search_product'),
     
     # Проверка вместимости
     path('check-capacity/', views.CheckCapacityView.as_view(), name='check_capacity'),
+    path('check-capacity/plan/', views.CapacityPlanView.as_view(), name='capacity_plan'),
+
+    # История загрузки стеллажей и зон
+    path('utilization/', views.UtilizationHistoryView.as_view(), name='utilization_history'),
+    path('utilization/data/', views.UtilizationDataView.as_view(), name='utilization_data'),
     
     # Журнал операций
     path('journal/', views.WarehouseJournalView.as_view(), name='journal'),
-]
\ No newline at end of file
+
+    # Живые обновления (server-sent events)
+    path('events/', views.LiveEventsView.as_view(), name='live_events'),
+
+    # JSON API для терминалов сбора данных
+    path('api/v1/batches/', api.BatchBulkView.as_view(), name='api_batches'),
+    path('api/v1/placements/', api.PlacementBulkView.as_view(), name='api_placements'),
+    path('api/v1/issues/', api.IssueBulkView.as_view(), name='api_issues'),
+    path('api/v1/scans/', api.ScanIngestView.as_view(), name='api_scans'),
+
+    # Очередь фоновых задач (только для сотрудников)
+    path('jobs/', views.JobListView.as_view(), name='job_list'),
+    path('jobs/<int:pk>/', views.JobStatusView.as_view(), name='job_status'),
+
+    # Профили запросов (только для сотрудников)
+    path('profiles/', views.ProfileListView.as_view(), name='profile_list'),
+    path('profiles/<str:profile_id>/', views.ProfileDetailView.as_view(), name='profile_detail'),
+    path('profiles/<str:profile_id>/download/', views.ProfileDownloadView.as_view(), name='profile_download'),
+]
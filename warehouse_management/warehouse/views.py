@@ -1,67 +1,152 @@
-from django.shortcuts import render, redirect, get_object_or_404
+import asyncio
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import render, redirect, get_object_or_404, resolve_url
 from django.views import View
 from django.views.generic import ListView, DetailView, CreateView, UpdateView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib import messages
-from django.db.models import Sum, Q
-from django.utils import timezone
 from django.db import transaction
-from .models import Product, Rack, Batch, Placement, WarehouseJournal, Category
-from .forms import ProductForm, RackForm, BatchForm, PlacementForm, IssueForm, CheckCapacityForm
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import Count, Sum, Q, Prefetch, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import (Product, Rack, Batch, Placement, WarehouseJournal, Category, Reservation, Job,
+                     Warehouse, Zone, UtilizationSnapshot)
+from .forms import (ProductForm, RackForm, BatchForm, PlacementForm, IssueForm,
+                    CheckCapacityForm, CapacityPlanForm, ProductFilterForm, ReservationForm,
+                    JobForm, UtilizationHistoryForm)
+from .pagination import apaginate, paginate_keyset
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.core.paginator import Paginator
+from django.http import (FileResponse, Http404, JsonResponse, HttpResponse,
+                         HttpResponseBadRequest, StreamingHttpResponse)
+from django.utils.dateparse import parse_date
+from . import (events, history, jobs, journal, labels, locations, profiling, reservations,
+               search, services, simulation)
 from django.contrib.auth.decorators import login_required
 
 
-class DashboardView(LoginRequiredMixin, View):
-    login_url = '/login/'
+class AsyncLoginRequiredMixin:
+    """LoginRequiredMixin для async-представлений.
 
-    def get(self, request):
-        # Статистика склада
-        total_products = Product.objects.count()
-        total_racks = Rack.objects.filter(is_active=True).count()
-        active_placements = Placement.objects.filter(is_active=True).count()
-        total_quantity = Placement.objects.filter(
-            is_active=True).aggregate(total=Sum('quantity'))['total'] or 0
-
-        # Товары с низким остатком
-        low_stock_products = []
-        for product in Product.objects.all():
-            quantity = Placement.objects.filter(product=product, is_active=True).aggregate(
-                total=Sum('quantity'))['total'] or 0
-            if quantity < 10:  # Порог низкого остатка
-                low_stock_products.append({
-                    'product': product,
-                    'quantity': quantity
-                })
+    Пользователь загружается через request.auser(), потому что ленивый
+    request.user обращается к БД синхронно.
+    """
+    login_url = None
 
-        # Последние операции
-        recent_operations = WarehouseJournal.objects.all()[:10]
+    async def dispatch(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(),
+                                     resolve_url(self.login_url or settings.LOGIN_URL))
+        request.user = user
+        return await super().dispatch(request, *args, **kwargs)
+
+
+async def arender(request, template_name, context):
+    """render() в потоке ORM: шаблоны и контекстные процессоры могут обращаться к БД"""
+    return await sync_to_async(render)(request, template_name, context)
 
-        # Загруженность стеллажей
-        racks_utilization = []
-        for rack in Rack.objects.filter(is_active=True).order_by('name')[:5]:
-            racks_utilization.append({
-                'rack': rack,
-                'utilization': rack.get_utilization_percent()
-            })
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+CONFLICT_MESSAGE = 'Склад занят параллельными операциями. Ничего не изменено, повторите операцию'
+
+
+def notify(request, level, message):
+    """Сообщение пользователю после фиксации транзакции операции.
+
+    Попытка, откаченная retry_on_conflict, своих сообщений не оставляет:
+    ее обработчики on_commit отменяются вместе с транзакцией.
+    """
+    transaction.on_commit(lambda: messages.add_message(request, level, message))
+
+
+class DashboardView(AsyncLoginRequiredMixin, View):
+    login_url = '/login/'
+
+    async def get(self, request):
+        active_placements = Placement.objects.filter(is_active=True)
+        (total_products, total_racks, placements_count, totals,
+         low_stock, recent_operations, zones) = await asyncio.gather(
+            # Статистика склада
+            Product.objects.acount(),
+            Rack.objects.filter(is_active=True).acount(),
+            active_placements.acount(),
+            active_placements.aaggregate(total=Sum('quantity')),
+            # Товары с низким остатком (остаток считается одним агрегирующим запросом)
+            alist(Product.objects.select_related('category').annotate(
+                stock=Coalesce(Sum('placement__quantity',
+                                   filter=Q(placement__is_active=True)), 0)
+            ).filter(stock__lt=10)[:5]),  # Порог низкого остатка
+            # Последние операции
+            alist(WarehouseJournal.objects.select_related('product')[:10]),
+            # Загруженность зон по свернутым показателям, без чтения стеллажей
+            alist(Zone.objects.filter(racks_count__gt=0).select_related('warehouse')),
+        )
+        racks = []
+        if not zones:
+            # Склад без иерархии: загрузка первых стеллажей по их размещениям
+            racks = await alist(
+                Rack.objects.filter(is_active=True).with_occupancy().order_by('name')[:5])
 
         context = {
             'total_products': total_products,
             'total_racks': total_racks,
-            'active_placements': active_placements,
-            'total_quantity': total_quantity,
-            'low_stock_products': low_stock_products[:5],
+            'active_placements': placements_count,
+            'total_quantity': totals['total'] or 0,
+            'low_stock_products': [
+                {'product': product, 'quantity': product.stock} for product in low_stock
+            ],
             'recent_operations': recent_operations,
-            'racks_utilization': racks_utilization,
+            'zones_utilization': sorted(
+                ({'zone': zone, 'utilization': zone.get_utilization_percent()} for zone in zones),
+                key=lambda item: item['utilization'], reverse=True)[:5],
+            'racks_utilization': [
+                {'rack': rack, 'utilization': rack.get_utilization_percent()} for rack in racks
+            ],
         }
-        return render(request, 'warehouse/dashboard.html', context)
+        return await arender(request, 'warehouse/dashboard.html', context)
 
 
-class ProductListView(LoginRequiredMixin, ListView):
-    model = Product
-    template_name = 'warehouse/product_list.html'
-    context_object_name = 'products'
+class ProductListView(LoginRequiredMixin, View):
     paginate_by = 20
+    # Порядок страниц совпадает с индексами (name, id) и (category, name, id)
+    ordering = ('name', 'id')
+
+    def get(self, request):
+        filter_form = ProductFilterForm(request.GET)
+        first_batch = Batch.objects.filter(product=OuterRef('pk')).order_by(
+            '-arrival_date').values('pk')[:1]
+        # Остаток - коррелированный подзапрос по индексу размещений товара:
+        # JOIN с GROUP BY по всему каталогу не дал бы индексу (name, id) вести выборку
+        on_hand = Placement.objects.filter(product=OuterRef('pk'), is_active=True).order_by(
+            ).values('product').annotate(total=Sum('quantity')).values('total')
+        queryset = filter_form.filter_queryset(Product.objects.all()).select_related(
+            'category').annotate(
+            on_hand=Coalesce(Subquery(on_hand), 0),
+            first_batch_id=Subquery(first_batch),
+        )
+        products = paginate_keyset(queryset, self.ordering, self.paginate_by,
+                                   after=request.GET.get('after'),
+                                   before=request.GET.get('before'))
+
+        # Параметры фильтров для ссылок на соседние страницы
+        params = request.GET.copy()
+        for key in ('after', 'before', 'page'):
+            params.pop(key, None)
+
+        context = {
+            'products': products,
+            'categories': Category.objects.only('id', 'name').order_by('name'),
+            'filter_query': params.urlencode(),
+        }
+        return render(request, 'warehouse/product_list.html', context)
 
 
 class ProductCreateView(LoginRequiredMixin, CreateView):
@@ -88,10 +173,10 @@ class ProductUpdateView(LoginRequiredMixin, UpdateView):
         return kwargs
 
 
-class RackListView(LoginRequiredMixin, ListView):
-    model = Rack
-    template_name = 'warehouse/rack_list.html'
-    context_object_name = 'racks'
+class RackListView(AsyncLoginRequiredMixin, View):
+    async def get(self, request):
+        racks = await alist(Rack.objects.with_occupancy())
+        return await arender(request, 'warehouse/rack_list.html', {'racks': racks})
 
 
 class RackCreateView(LoginRequiredMixin, CreateView):
@@ -130,7 +215,8 @@ class BatchListView(LoginRequiredMixin, ListView):
     ordering = ['-arrival_date']
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related(
+            'product').with_placement_totals()
         # Аннотируем каждую партию количеством размещенного товара
         queryset = queryset.annotate(
             placed_quantity=Sum('placement__quantity',
@@ -139,6 +225,35 @@ class BatchListView(LoginRequiredMixin, ListView):
         return queryset
 
 
+class ExpiringStockView(LoginRequiredMixin, ListView):
+    """Отчет: активные размещения, срок годности которых истек или истекает в ближайшие дни"""
+    template_name = 'warehouse/expiring_stock.html'
+    context_object_name = 'placements'
+    paginate_by = 50
+
+    def get_days(self):
+        try:
+            days = int(self.request.GET.get('days', ''))
+        except ValueError:
+            days = getattr(settings, 'EXPIRY_WARNING_DAYS', 14)
+        return max(0, min(days, 365))
+
+    def get_queryset(self):
+        self.days = self.get_days()
+        self.today = timezone.localdate()
+        # Диапазон по индексу placement_expiry_idx, без сортировки всех размещений
+        return Placement.objects.filter(
+            is_active=True, expiry_date__lte=self.today + timedelta(days=self.days)
+        ).select_related('product', 'rack', 'batch').order_by('expiry_date', 'pk')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        for placement in context['placements']:
+            placement.left = placement.days_left(self.today)
+        context.update(days=self.days, today=self.today)
+        return context
+
+
 class SuggestRacksView(LoginRequiredMixin, View):
     def get(self, request, batch_id):
         batch = get_object_or_404(Batch, id=batch_id)
@@ -155,42 +270,23 @@ class SuggestRacksView(LoginRequiredMixin, View):
         # Считаем, сколько товара из партии в данный момент активно размещено
         placed_quantity = batch.quantity - remaining_quantity
 
-        # Алгоритм подбора стеллажей...
-        racks = Rack.objects.filter(is_active=True)
-        suggested_racks = []
-
-        # Сортируем стеллажи по доступному объему
-        sorted_racks = sorted(
-            racks, key=lambda x: x.available_volume(), reverse=True)
-        remaining = remaining_quantity
-
-        for rack in sorted_racks:
-            if remaining <= 0:
-                break
-            # Проверяем, подходит ли товар по габаритам
-            if not rack.can_fit_product(product):
-                continue
-
-            # Рассчитываем, сколько товара можно разместить на стеллаже
-            max_by_volume = int(rack.available_volume() //
-                                product.get_volume())
-            max_by_weight = int(rack.available_weight() // product.weight)
-            max_quantity = min(max_by_volume, max_by_weight)
-
-            if max_quantity > 0:
-                quantity_to_place = min(max_quantity, remaining)
-                suggested_racks.append({
-                    'rack': rack,
-                    'max_quantity': max_quantity,
-                    'suggested_quantity': quantity_to_place
-                })
-                remaining -= quantity_to_place
+        # Подбор стеллажей: зоны и ряды, куда товар не поместится, отсекаются
+        # по свернутой вместимости до чтения стеллажей
+        warehouse_id = request.GET.get('warehouse', '')
+        warehouse = Warehouse.objects.filter(pk=warehouse_id).first() if warehouse_id.isdigit() else None
+        plan, remaining = locations.plan_placement(product, remaining_quantity, warehouse)
+        suggested_racks = [
+            {'rack': rack, 'max_quantity': max_quantity, 'suggested_quantity': suggested}
+            for rack, max_quantity, suggested in plan
+        ]
 
         context = {
             'batch': batch,
             'suggested_racks': suggested_racks,
             'remaining_quantity': remaining,
             'already_placed': placed_quantity,
+            'warehouses': Warehouse.objects.only('id', 'name'),
+            'warehouse': warehouse,
         }
         return render(request, 'warehouse/suggest_racks.html', context)
 
@@ -236,22 +332,36 @@ class PlaceBatchView(LoginRequiredMixin, View):
         }
         return render(request, 'warehouse/place_batch.html', context)
 
-    @transaction.atomic
     def post(self, request, batch_id):
+        try:
+            return self.place(request, batch_id)
+        except services.ConflictRetriesExhausted:
+            messages.error(request, CONFLICT_MESSAGE)
+            return redirect('warehouse:place_batch', batch_id=batch_id)
+
+    @services.retry_on_conflict
+    @journal.unit_of_work()
+    def place(self, request, batch_id):
+        # Блокируем партию и стеллаж до проверки вместимости в PlacementForm.clean
+        rack_id = request.POST.get('rack', '')
+        services.lock_rows(batch_ids=[batch_id],
+                           rack_ids=[int(rack_id)] if rack_id.isdigit() else [])
         batch = get_object_or_404(Batch, id=batch_id)
         form = PlacementForm(request.POST, batch_id=batch_id)
 
         # Проверка, полностью ли размещена партия
         if batch.is_fully_placed():
-            messages.error(
-                request, 'Невозможно разместить товар: вся партия уже была размещена на складе')
+            notify(
+                request, messages.ERROR,
+                'Невозможно разместить товар: вся партия уже была размещена на складе')
             return redirect('warehouse:batch_list')
 
         # Проверяем оставшееся количество для размещения
         remaining_quantity = batch.get_initial_remaining()
         if remaining_quantity <= 0:
-            messages.error(
-                request, 'Невозможно разместить товар: в партии не осталось товара для размещения')
+            notify(
+                request, messages.ERROR,
+                'Невозможно разместить товар: в партии не осталось товара для размещения')
             return redirect('warehouse:batch_list')
 
         if form.is_valid():
@@ -260,8 +370,9 @@ class PlaceBatchView(LoginRequiredMixin, View):
 
             # Проверяем, не превышает ли запрашиваемое количество доступное для размещения
             if quantity > remaining_quantity:
-                messages.error(
-                    request, f'Невозможно разместить указанное количество. В партии осталось только {remaining_quantity} ед. для размещения')
+                notify(
+                    request, messages.ERROR,
+                    f'Невозможно разместить указанное количество. В партии осталось только {remaining_quantity} ед. для размещения')
                 return render(request, 'warehouse/place_batch.html', {
                     'form': form,
                     'batch': batch,
@@ -270,34 +381,16 @@ class PlaceBatchView(LoginRequiredMixin, View):
                 })
 
             product = batch.product
+            operator = request.user.username if request.user.is_authenticated else 'Кладовщик'
+            services.place(batch, rack, quantity, operator)
 
-            # Создаем размещение
-            placement = Placement.objects.create(
-                rack=rack,
-                product=product,
-                batch=batch,
-                quantity=quantity,
-                is_active=True
-            )
-
-            # Создаем запись в журнале
-            WarehouseJournal.objects.create(
-                operation_type='IN',
-                product=product,
-                quantity=quantity,
-                rack=rack,
-                batch=batch,
-                operator=request.user.username if request.user.is_authenticated else 'Кладовщик',
-                notes=f'Размещение партии #{batch.id}'
-            )
-
-            messages.success(
-                request, f'Успешно размещено {quantity} ед. товара {product.name} на стеллаже {rack.name}')
+            notify(
+                request, messages.SUCCESS,
+                f'Успешно размещено {quantity} ед. товара {product.name} на стеллаже {rack.name}')
 
             # Проверяем, полностью ли размещена партия после этой операции
             if batch.is_fully_placed():
-                messages.success(
-                    request, 'Вся партия успешно размещена на складе')
+                notify(request, messages.SUCCESS, 'Вся партия успешно размещена на складе')
                 return redirect('warehouse:batch_list')
             else:
                 return redirect('warehouse:suggest_racks', batch_id=batch.id)
@@ -313,75 +406,207 @@ class PlaceBatchView(LoginRequiredMixin, View):
         })
 
 
+class LabelsMixin:
+    """Отдача листов этикеток: ?format=pdf|png, ?per=placement|unit, ?page=N для PNG"""
+
+    def get_batches(self):
+        raise NotImplementedError
+
+    def get_filename(self):
+        raise NotImplementedError
+
+    def get(self, request, **kwargs):
+        per = request.GET.get('per', 'placement')
+        output = request.GET.get('format', 'pdf')
+        if per not in ('placement', 'unit') or output not in ('pdf', 'png'):
+            return HttpResponseBadRequest('Неизвестный формат этикеток')
+        batches = self.get_batches()
+        pages = labels.paginate(labels.labels_for_batches(batches, per=per))
+        if not pages:
+            messages.info(request, 'Нет этикеток для печати')
+            return redirect('warehouse:batch_list')
+
+        if output == 'png':
+            number = _page_number(request.GET.get('page'))
+            if number > len(pages):
+                raise Http404('Нет такого листа')
+            response = HttpResponse(labels.render_png(pages, number), content_type='image/png')
+            response['Content-Disposition'] = f'inline; filename="{self.get_filename()}-{number}.png"'
+            response['X-Label-Pages'] = str(len(pages))
+            return response
+
+        response = StreamingHttpResponse(labels.stream_pdf(pages), content_type='application/pdf')
+        response['Content-Disposition'] = f'inline; filename="{self.get_filename()}.pdf"'
+        response['X-Label-Pages'] = str(len(pages))
+        return response
+
+
+class BatchLabelsView(LoginRequiredMixin, LabelsMixin, View):
+    def get_batches(self):
+        batch = get_object_or_404(Batch, id=self.kwargs['batch_id'])
+        return Batch.objects.filter(pk=batch.pk)
+
+    def get_filename(self):
+        return f"labels-batch-{self.kwargs['batch_id']}"
+
+
+class WaveLabelsView(LoginRequiredMixin, LabelsMixin, View):
+    """Этикетки всей волны приемки: партий, пришедших в день ?date=YYYY-MM-DD (по умолчанию сегодня)"""
+
+    def get(self, request, **kwargs):
+        value = request.GET.get('date')
+        try:
+            self.date = parse_date(value) if value else timezone.localdate()
+        except ValueError:
+            self.date = None
+        if self.date is None:
+            return HttpResponseBadRequest('Укажите дату приемки в формате ГГГГ-ММ-ДД')
+        return super().get(request, **kwargs)
+
+    def get_batches(self):
+        return labels.batches_for_wave(self.date)
+
+    def get_filename(self):
+        return f'labels-wave-{self.date.isoformat()}'
+
+
 class IssueProductView(LoginRequiredMixin, View):
     def get(self, request):
         form = IssueForm()
         return render(request, 'warehouse/issue_form.html', {'form': form})
 
-    @transaction.atomic
     def post(self, request):
+        try:
+            return self.issue(request)
+        except services.ConflictRetriesExhausted:
+            # Склад занят конкурентными выдачами: ничего не списано, форму можно отправить снова
+            form = IssueForm(request.POST)
+            form.is_valid()
+            form.add_error(None, CONFLICT_MESSAGE)
+            return render(request, 'warehouse/issue_form.html', {'form': form})
+
+    @services.retry_on_conflict
+    @journal.unit_of_work()
+    def issue(self, request):
         form = IssueForm(request.POST)
 
         if form.is_valid():
             product = form.cleaned_data['product']
             quantity = form.cleaned_data['quantity']
             operator = form.cleaned_data['operator']
-            remaining_quantity = quantity
-
-            # Получаем размещения товара, сортируем по дате (FIFO - первый пришел, первый ушел)
-            placements = Placement.objects.filter(
-                product=product,
-                is_active=True
-            ).order_by('date_placed')
 
-            if not placements.exists():
-                messages.error(request, 'Товар отсутствует на складе')
+            if not Placement.objects.filter(product=product, is_active=True).exists():
+                notify(request, messages.ERROR, 'Товар отсутствует на складе')
                 return render(request, 'warehouse/issue_form.html', {'form': form})
 
-            # Списываем товар со стеллажей
-            for placement in placements:
-                if remaining_quantity <= 0:
-                    break
-
-                if placement.quantity >= remaining_quantity:
-                    # Частичное списание с текущего размещения
-                    WarehouseJournal.objects.create(
-                        operation_type='OUT',
-                        product=product,
-                        quantity=remaining_quantity,
-                        rack=placement.rack,
-                        operator=operator,
-                        notes=f'Частичная выдача товара'
-                    )
-                    placement.quantity -= remaining_quantity
-                    placement.save()
-                    remaining_quantity = 0
-                else:
-                    # Полное списание текущего размещения
-                    remaining_quantity -= placement.quantity
-                    WarehouseJournal.objects.create(
-                        operation_type='OUT',
-                        product=product,
-                        quantity=placement.quantity,
-                        rack=placement.rack,
-                        operator=operator,
-                        notes=f'Полная выдача товара'
-                    )
-                    placement.is_active = False
-                    placement.save()
+            # Списываем товар со стеллажей в порядке стратегии категории
+            line = services.issue(product, quantity, operator)
+            remaining_quantity = quantity - line.issued
 
             if remaining_quantity > 0:
-                messages.warning(
-                    request, f'Не удалось выдать весь запрошенный объем. Выдано: {quantity - remaining_quantity} из {quantity}')
+                notify(
+                    request, messages.WARNING,
+                    f'Не удалось выдать весь запрошенный объем. Выдано: {quantity - remaining_quantity} из {quantity}')
             else:
-                messages.success(
-                    request, f'Успешно выдано {quantity} ед. товара {product.name}')
+                notify(
+                    request, messages.SUCCESS,
+                    f'Успешно выдано {quantity} ед. товара {product.name}')
 
             return redirect('warehouse:issue_product')
 
         return render(request, 'warehouse/issue_form.html', {'form': form})
 
 
+class ReservationListView(LoginRequiredMixin, View):
+    """Действующие резервы под заказы и форма нового резерва"""
+    limit = 100
+
+    def render_page(self, request, form):
+        active = Reservation.objects.filter(status=Reservation.ACTIVE).select_related(
+            'product__category', 'batch', 'rack')[:self.limit]
+        return render(request, 'warehouse/reservations.html', {
+            'form': form, 'reservations': active, 'now': timezone.now()})
+
+    def get(self, request):
+        return self.render_page(request, ReservationForm())
+
+    def post(self, request):
+        try:
+            return self.reserve(request)
+        except services.ConflictRetriesExhausted:
+            form = ReservationForm(request.POST)
+            form.is_valid()
+            form.add_error(None, CONFLICT_MESSAGE)
+            return self.render_page(request, form)
+
+    @services.retry_on_conflict
+    @journal.unit_of_work()
+    def reserve(self, request):
+        # Истекшие резервы возвращаются в остаток до проверки нового
+        reservations.expire()
+        form = ReservationForm(request.POST)
+        if not form.is_valid():
+            return self.render_page(request, form)
+        data = form.cleaned_data
+        reservation = reservations.create(
+            data['product'], data['quantity'], data['order'], data['operator'],
+            ttl=timedelta(minutes=data['ttl']), batch=data['batch'], rack=data['rack'])
+        notify(
+            request, messages.SUCCESS,
+            f'Зарезервировано {reservation.quantity} ед. товара {reservation.product.name} '
+            f'под заказ {reservation.order}')
+        return redirect('warehouse:reservation_list')
+
+
+class ReservationIssueView(LoginRequiredMixin, View):
+    """Выдача товара по резерву: количество уже закреплено за заказом"""
+
+    def post(self, request, pk):
+        try:
+            return self.fulfill(request, pk)
+        except services.ConflictRetriesExhausted:
+            messages.error(request, CONFLICT_MESSAGE)
+            return redirect('warehouse:reservation_list')
+
+    @services.retry_on_conflict
+    @journal.unit_of_work()
+    def fulfill(self, request, pk):
+        reservation = get_object_or_404(Reservation.objects.select_related('product'), pk=pk)
+        operator = request.POST.get('operator', '').strip() or reservation.operator
+        line = reservations.fulfill(reservation, operator)
+        if line is None:
+            notify(
+                request, messages.ERROR,
+                f'Резерв под заказ {reservation.order} уже не действует')
+        else:
+            notify(
+                request, messages.SUCCESS,
+                f'По заказу {reservation.order} выдано {line.issued} ед. товара '
+                f'{reservation.product.name}')
+        return redirect('warehouse:reservation_list')
+
+
+class ReservationReleaseView(LoginRequiredMixin, View):
+    def post(self, request, pk):
+        try:
+            return self.release(request, pk)
+        except services.ConflictRetriesExhausted:
+            messages.error(request, CONFLICT_MESSAGE)
+            return redirect('warehouse:reservation_list')
+
+    @services.retry_on_conflict
+    @journal.unit_of_work()
+    def release(self, request, pk):
+        reservation = get_object_or_404(Reservation.objects.select_related('product'), pk=pk)
+        if reservations.release(reservation):
+            notify(request, messages.SUCCESS, f'Резерв под заказ {reservation.order} снят')
+        else:
+            notify(
+                request, messages.ERROR,
+                f'Резерв под заказ {reservation.order} уже не действует')
+        return redirect('warehouse:reservation_list')
+
+
 class CheckCapacityView(LoginRequiredMixin, View):
     def get(self, request):
         form = CheckCapacityForm()
@@ -392,33 +617,15 @@ class CheckCapacityView(LoginRequiredMixin, View):
         if form.is_valid():
             product = form.cleaned_data['product']
             quantity = form.cleaned_data['quantity']
-            # Алгоритм проверки вместимости
-            available_racks = Rack.objects.filter(is_active=True)
-            # Сортируем стеллажи по доступному объему
-            racks = sorted(available_racks,
-                           key=lambda x: x.available_volume(), reverse=True)
-            remaining_quantity = quantity
-            suggested_racks = []
-            for rack in racks:
-                if remaining_quantity <= 0:
-                    break
-                # Проверяем, подходит ли товар по габаритам
-                if not rack.can_fit_product(product):
-                    continue
-                # Расчет максимального количества товара, которое можно разместить на стеллаже
-                max_by_volume = int(
-                    rack.available_volume() // product.get_volume())
-                max_by_weight = int(rack.available_weight() // product.weight)
-                max_quantity = min(max_by_volume, max_by_weight)
-                if max_quantity > 0:
-                    quantity_to_place = min(max_quantity, remaining_quantity)
-                    suggested_racks.append({
-                        'rack': rack,
-                        'quantity': quantity_to_place,
-                        'max_possible': max_quantity,
-                        'utilization_after': (rack.volume - (rack.available_volume() - product.get_volume() * quantity_to_place)) / rack.volume * 100
-                    })
-                    remaining_quantity -= quantity_to_place
+            # Те же правила подбора, что и при размещении партии
+            plan, remaining_quantity = locations.plan_placement(
+                product, quantity, form.cleaned_data['warehouse'])
+            suggested_racks = [{
+                'rack': rack,
+                'quantity': suggested,
+                'max_possible': max_quantity,
+                'utilization_after': (rack.volume - (rack.available_volume() - product.get_volume() * suggested)) / rack.volume * 100
+            } for rack, max_quantity, suggested in plan]
 
             can_store = remaining_quantity == 0
             # Вычисляем размещенное количество
@@ -437,43 +644,171 @@ class CheckCapacityView(LoginRequiredMixin, View):
         return render(request, 'warehouse/check_capacity.html', {'form': form})
 
 
-class SearchProductView(LoginRequiredMixin, View):
+class CapacityPlanView(LoginRequiredMixin, View):
+    """Планирование вместимости: прогон графика приходов и прогнозного расхода без записи в БД"""
+    template_name = 'warehouse/capacity_plan.html'
+
+    def get(self, request):
+        return render(request, self.template_name, {'form': CapacityPlanForm()})
+
+    def post(self, request):
+        form = CapacityPlanForm(request.POST)
+        if not form.is_valid():
+            return render(request, self.template_name, {'form': form})
+        data = form.cleaned_data
+        model = simulation.CapacitySimulation(lookback_days=data['lookback_days'])
+        result = model.run(form.get_inbound(model.today), days=data['days'],
+                           outbound_factor=data['outbound_factor'])
+        # Сначала классы, в которых место кончится раньше
+        result.classes.sort(key=lambda c: (c.full_day is None, c.full_day or 0, -c.peak))
+        return render(request, self.template_name, {'form': form, 'result': result})
+
+
+class UtilizationDataMixin:
+    """Ряды истории загрузки по UtilizationHistoryForm; читаются только снимки"""
+
+    def get_series(self, form):
+        rack = form.cleaned_data['rack']
+        if rack is not None:
+            points = history.series(UtilizationSnapshot.RACK, [rack.pk], form.cleaned_data['days'])
+            names = {rack.pk: rack.name}
+        else:
+            points = history.series(UtilizationSnapshot.ZONE, days=form.cleaned_data['days'])
+            names = {zone.pk: str(zone) for zone in Zone.objects.filter(
+                pk__in=list(points)).select_related('warehouse')}
+        return [
+            {'id': object_id, 'name': names.get(object_id, f'#{object_id}'), 'points': series}
+            for object_id, series in sorted(points.items(), key=lambda item: names.get(item[0], ''))
+        ]
+
+
+class UtilizationHistoryView(LoginRequiredMixin, UtilizationDataMixin, View):
+    """Тренды загрузки зон или стеллажа; график строится по JSON из UtilizationDataView"""
+
+    def get(self, request):
+        # Пустой запрос - тоже допустимый выбор: все зоны за год
+        form = UtilizationHistoryForm(request.GET)
+        series = self.get_series(form) if form.is_valid() else []
+        # Последняя точка каждого ряда - для таблицы под графиком
+        latest = [{'name': item['name'], 'point': item['points'][-1]} for item in series]
+        return render(request, 'warehouse/utilization_history.html', {
+            'form': form,
+            'latest': latest,
+            'data_url': f"{reverse('warehouse:utilization_data')}?{request.GET.urlencode()}",
+        })
+
+
+class UtilizationDataView(LoginRequiredMixin, UtilizationDataMixin, View):
+    """История загрузки в JSON: ?rack=<id> - один стеллаж, иначе все зоны; ?days=30|90|365"""
+
     def get(self, request):
-        query = request.GET.get('q', '')
+        form = UtilizationHistoryForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        return JsonResponse({
+            'days': form.cleaned_data['days'],
+            'series': [
+                {**item, 'points': [[taken_at.isoformat(), utilization, weight, sku_count]
+                                    for taken_at, utilization, weight, sku_count in item['points']]}
+                for item in self.get_series(form)
+            ],
+        })
+
+
+class SearchProductView(AsyncLoginRequiredMixin, View):
+    paginate_by = 20
+    placements_paginate_by = 50
+
+    async def get(self, request):
+        query = request.GET.get('q', '').strip()
         products = []
         placements = []
 
         if query:
-            # Поиск товаров по названию, SKU или категории
-            products = Product.objects.filter(
-                Q(name__icontains=query) |
-                Q(sku__icontains=query) |
-                Q(category__name__icontains=query)
-            ).distinct()
-
-            # Получаем размещения для найденных товаров
-            placements = Placement.objects.filter(
-                product__in=products,
-                is_active=True
-            ).select_related('rack', 'product', 'batch')
+            # Поиск по индексу: название, SKU (по префиксу) или категория, по релевантности
+            products = await sync_to_async(search.search_products)(
+                query, page=_page_number(request.GET.get('page')), per_page=self.paginate_by)
+
+            # Размещения только для товаров текущей страницы, тоже постранично
+            placements = await apaginate(
+                Placement.objects.filter(
+                    product__in=[product.pk for product in products],
+                    is_active=True
+                ).select_related('product', 'batch').prefetch_related(
+                    Prefetch('rack', queryset=Rack.objects.with_occupancy())
+                ).order_by('product__name', 'pk'),
+                self.placements_paginate_by,
+                request.GET.get('ppage', 1)
+            )
 
         context = {
             'query': query,
             'products': products,
             'placements': placements
         }
-        return render(request, 'warehouse/search_product.html', context)
+        return await arender(request, 'warehouse/search_product.html', context)
+
+
+class ProductAutocompleteView(AsyncLoginRequiredMixin, View):
+    """Подсказки товаров для AutocompleteSelect: префиксный поиск по индексу"""
+    limit = 20
+
+    async def get(self, request):
+        query = request.GET.get('q', '').strip()
+        ids = []
+        if query:
+            ids = (await sync_to_async(search.search_product_ids)(query, limit=self.limit))[0]
+        products = await Product.objects.filter(pk__in=ids).annotate(
+            # Доступно к выдаче: счетчики остатков за вычетом резервов
+            available=Coalesce(Sum('stock_shards__quantity'), 0)
+        ).ain_bulk()
+        results = [
+            {
+                'id': pk,
+                'text': str(products[pk]),
+                'sku': products[pk].sku,
+                'available': products[pk].available,
+            }
+            for pk in ids if pk in products
+        ]
+        return JsonResponse({'results': results})
+
+
+class RackAutocompleteView(AsyncLoginRequiredMixin, View):
+    """Подсказки активных стеллажей по началу названия (индекс по name)"""
+    limit = 20
+
+    async def get(self, request):
+        query = request.GET.get('q', '').strip()
+        racks = Rack.objects.filter(is_active=True).with_occupancy().order_by('name')
+        if query:
+            # Диапазон вместо istartswith, чтобы SQLite использовал уникальный индекс
+            racks = racks.filter(name__gte=query, name__lt=query + '\uffff')
+        results = [
+            {
+                'id': rack.pk,
+                'text': str(rack),
+                'available_volume': round(rack.available_volume(), 1),
+                'available_weight': round(rack.available_weight(), 1),
+            }
+            async for rack in racks[:self.limit]
+        ]
+        return JsonResponse({'results': results})
+
 
+def _page_number(value):
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return 1
 
-class WarehouseJournalView(LoginRequiredMixin, ListView):
-    model = WarehouseJournal
-    template_name = 'warehouse/journal.html'
-    context_object_name = 'entries'
-    ordering = ['-operation_date']
+
+class WarehouseJournalView(AsyncLoginRequiredMixin, View):
     paginate_by = 50
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = WarehouseJournal.objects.select_related(
+            'product', 'rack', 'batch').order_by('-operation_date', '-pk')
         operation_type = self.request.GET.get('operation_type')
         product = self.request.GET.get('product')
         operator = self.request.GET.get('operator')
@@ -487,16 +822,116 @@ class WarehouseJournalView(LoginRequiredMixin, ListView):
 
         return queryset
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        # Передаем текущие значения фильтров в контекст
-        context['operation_type_filter'] = self.request.GET.get(
-            'operation_type', '')
-        context['product_filter'] = self.request.GET.get('product', '')
-        context['operator_filter'] = self.request.GET.get('operator', '')
-        # Предвычисляем условия для выбора опций в селекте
-        context['is_in_selected'] = self.request.GET.get(
-            'operation_type') == 'IN'
-        context['is_out_selected'] = self.request.GET.get(
-            'operation_type') == 'OUT'
-        return context
+    async def get(self, request):
+        entries = await apaginate(self.get_queryset(), self.paginate_by,
+                                  request.GET.get('page', 1))
+        context = {
+            # Страница целиком: шаблон использует entries.paginator для навигации
+            'entries': entries,
+            'page_obj': entries,
+            'is_paginated': entries.has_other_pages(),
+            # Передаем текущие значения фильтров в контекст
+            'operation_type_filter': request.GET.get('operation_type', ''),
+            'product_filter': request.GET.get('product', ''),
+            'operator_filter': request.GET.get('operator', ''),
+            # Предвычисляем условия для выбора опций в селекте
+            'is_in_selected': request.GET.get('operation_type') == 'IN',
+            'is_out_selected': request.GET.get('operation_type') == 'OUT',
+        }
+        return await arender(request, 'warehouse/journal.html', context)
+
+
+class LiveEventsView(AsyncLoginRequiredMixin, View):
+    """Поток server-sent events для живых обновлений панели и стеллажей"""
+
+    async def get(self, request):
+        if not events.is_streaming(request):
+            # 204 - EventSource не переподключается, страницы остаются статичными
+            return HttpResponse(status=204)
+        last_event_id = events.parse_last_event_id(
+            request.headers.get('Last-Event-ID') or request.GET.get('last_event_id'))
+        response = StreamingHttpResponse(events.stream(last_event_id),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Отключаем буферизацию ответа в nginx
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class StaffRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
+    """Доступ только для сотрудников с флагом is_staff"""
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+
+class ProfileListView(StaffRequiredMixin, View):
+    def get(self, request):
+        return render(request, 'warehouse/profile_list.html', {
+            'profiles': profiling.list_profiles(),
+        })
+
+
+class ProfileDetailView(StaffRequiredMixin, View):
+    def get(self, request, profile_id):
+        profile = profiling.load_profile(profile_id)
+        if profile is None:
+            raise Http404('Профиль не найден')
+        # Самые медленные запросы показываем первыми
+        profile['queries'] = sorted(
+            profile['queries'], key=lambda q: q['time_ms'], reverse=True)
+        return render(request, 'warehouse/profile_detail.html', {'profile': profile})
+
+
+class ProfileDownloadView(StaffRequiredMixin, View):
+    def get(self, request, profile_id):
+        path = profiling.stats_path(profile_id)
+        if path is None:
+            raise Http404('Профиль не найден')
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
+
+
+class JobListView(StaffRequiredMixin, View):
+    """Очередь фоновых задач: последние задачи, счетчики по статусам, постановка новой"""
+    limit = 50
+
+    def render_page(self, request, form):
+        counts = dict(Job.objects.order_by().values('status').annotate(n=Count('pk')).values_list('status', 'n'))
+        recent = list(Job.objects.all()[:self.limit])
+        for job in recent:
+            job.title = jobs.TASKS[job.kind][0] if job.kind in jobs.TASKS else job.kind
+        return render(request, 'warehouse/job_list.html', {
+            'form': form,
+            'jobs': recent,
+            'counts': [(label, counts.get(status, 0)) for status, label in Job.STATUS_CHOICES],
+        })
+
+    def get(self, request):
+        return self.render_page(request, JobForm())
+
+    def post(self, request):
+        form = JobForm(request.POST)
+        if not form.is_valid():
+            return self.render_page(request, form)
+        job = jobs.enqueue(form.cleaned_data['kind'], form.get_payload(),
+                           created_by=request.user.get_username())
+        messages.success(request, f'Задача #{job.pk} поставлена в очередь')
+        return redirect('warehouse:job_list')
+
+
+class JobStatusView(StaffRequiredMixin, View):
+    """Состояние задачи в JSON для обновления прогресса на странице очереди"""
+    model = Job
+
+    def get(self, request, pk):
+        job = get_object_or_404(self.model, pk=pk)
+        return JsonResponse({
+            'id': job.pk,
+            'kind': job.kind,
+            'status': job.status,
+            'status_display': job.get_status_display(),
+            'progress': job.progress,
+            'message': job.message,
+            'attempts': job.attempts,
+            'result': job.result,
+        })
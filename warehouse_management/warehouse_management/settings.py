@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'warehouse.metrics.MetricsMiddleware',
+    'warehouse.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,6 +52,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'warehouse.profiling.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'warehouse_management.urls'
@@ -63,6 +67,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'warehouse.context_processors.live_events',
             ],
         },
     },
@@ -81,6 +86,29 @@ DATABASES = {
     }
 }
 
+# PRAGMA для соединений SQLite по алиасам (warehouse.db.apply_sqlite_pragmas).
+# Для разработки не задаются; профиль эксплуатации - settings_production
+SQLITE_PRAGMAS = {}
+
+# Маршрутизация чтения (warehouse.db): GET-запросы к этим представлениям
+# читают через алиас DATABASE_READ_ALIAS, если он есть в DATABASES и
+# подключен ReadReplicaRouter
+DATABASE_READ_ALIAS = 'read'
+DATABASE_READ_VIEWS = [
+    'warehouse:dashboard',
+    'warehouse:journal',
+    'warehouse:search_product',
+    'warehouse:product_list',
+    'warehouse:rack_list',
+    'warehouse:product_autocomplete',
+    'warehouse:rack_autocomplete',
+    'warehouse:reservation_list',
+    'warehouse:expiring_stock',
+    'warehouse:job_status',
+    'warehouse:utilization_history',
+    'warehouse:utilization_data',
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -139,3 +167,148 @@ def admin_css_files():
     return [
         'admin/css/custom_admin.css',
     ]
+
+
+# Бюджеты SQL-запросов на один HTTP-запрос (warehouse.middleware.QueryBudgetMiddleware).
+# Ключ - имя маршрута, значение - максимально допустимое число запросов
+# с учетом сессии, пользователя и сообщений.
+QUERY_BUDGETS = {
+    'warehouse:dashboard': 12,
+    'warehouse:product_list': 5,
+    'warehouse:rack_list': 6,
+    'warehouse:batch_list': 6,
+    'warehouse:journal': 8,
+    'warehouse:search_product': 8,
+    'warehouse:expiring_stock': 6,
+    'warehouse:utilization_history': 5,
+    'warehouse:utilization_data': 5,
+}
+QUERY_BUDGET_DEFAULT = None
+# Одинаковый SQL, повторенный столько раз за запрос, считается признаком N+1
+QUERY_DUPLICATE_THRESHOLD = 3
+# В режиме отладки превышение бюджета приводит к исключению, иначе - к записи в лог
+QUERY_BUDGET_STRICT = DEBUG
+
+# Профилирование запросов по требованию (warehouse.profiling.ProfilerMiddleware):
+# сотрудник с is_staff добавляет заголовок X-Profile: 1 или ?_profile=1
+PROFILING_ENABLED = True
+PROFILING_DIR = BASE_DIR / 'var' / 'profiles'
+PROFILING_MAX_PROFILES = 50
+# Для скольких самых медленных запросов сохранять EXPLAIN
+PROFILING_EXPLAIN_TOP = 5
+
+# Метрики Prometheus (warehouse.metrics): файлы процессов в METRICS_DIR
+# суммируются эндпоинтом /metrics. Каталог очищается при перезапуске сервиса.
+METRICS_ENABLED = True
+METRICS_DIR = BASE_DIR / 'var' / 'metrics'
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+# Как долго кешируются агрегаты для gauge-метрик, секунд
+METRICS_GAUGE_TTL = 15
+
+# Миниатюры изображений товаров (warehouse.thumbnails): строятся пулом потоков
+# после загрузки и хранятся в MEDIA_ROOT/thumbnails по SHA-256 оригинала
+THUMBNAIL_SIZES = {'list': (96, 96), 'card': (320, 320)}
+THUMBNAIL_WORKERS = 2
+# False - строить сразу после фиксации транзакции в потоке запроса (тесты, отладка)
+THUMBNAIL_ASYNC = True
+
+# Этикетки партий (warehouse.labels): листы рисуются в пуле процессов.
+# LABEL_WORKERS = None - по числу процессоров, 0 - без пула.
+LABEL_WORKERS = None
+# TrueType-шрифт с кириллицей; если файла нет, используется встроенный шрифт Pillow
+LABEL_FONT = '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+
+# Живые обновления панели и стеллажей (warehouse.events, server-sent events).
+# 'memory' - рассылка внутри процесса (один ASGI-воркер),
+# 'db' - через таблицу LiveEvent, которую опрашивают все воркеры.
+# Поток работает только под ASGI; под WSGI страницы не подключают EventSource
+LIVE_EVENTS_ENABLED = True
+LIVE_EVENTS_BACKEND = 'memory'
+# Интервал опроса таблицы событий для бэкенда 'db', секунд
+LIVE_EVENTS_POLL_INTERVAL = 1.0
+# Комментарий-пинг держит соединение открытым через прокси, секунд
+LIVE_EVENTS_HEARTBEAT = 15
+# Через сколько секунд поток закрывается, и браузер переподключается
+LIVE_EVENTS_MAX_DURATION = 300
+# Сколько хранятся события бэкенда 'db'
+LIVE_EVENTS_RETENTION = timedelta(minutes=10)
+
+# Журнал операций (warehouse.journal): True - записи вставляются в той же
+# транзакции, что и размещения; False - после ее фиксации отдельной транзакцией
+# (короче блокировка записи, но при сбое между фиксациями записи теряются)
+JOURNAL_DURABLE = True
+
+# Повтор операций записи при конфликте блокировок (warehouse.services.retry_on_conflict):
+# число попыток и базовая задержка, секунд (растет вдвое с каждой попыткой)
+CONFLICT_RETRY_ATTEMPTS = 3
+CONFLICT_RETRY_DELAY = 0.05
+
+# Число шардов счетчика остатка на товар (warehouse.stock): одновременные
+# выдачи одного артикула обновляют разные строки
+STOCK_SHARDS = 8
+
+# JSON API терминалов (warehouse.api): максимум элементов в одном пакете
+API_BULK_MAX_ITEMS = 500
+
+# Прием сканирований (warehouse.scans): сколько секунд копить сканирования
+# одновременных запросов перед групповой фиксацией, размер пачки и сколько
+# запрос ждет фиксации своих сканирований
+SCAN_COALESCE_WINDOW = 0.02
+SCAN_BATCH_MAX = 500
+SCAN_WAIT_TIMEOUT = 10
+# Сколько хранятся ключи идемпотентности (повторы старше считаются новыми)
+SCAN_KEY_RETENTION = timedelta(days=7)
+
+# Резервы под заказы (warehouse.reservations): срок по умолчанию; истекшие
+# резервы возвращаются в остаток командой expire_reservations и перед
+# созданием нового резерва
+RESERVATION_TTL = timedelta(minutes=30)
+
+# Отчет об истекающих сроках годности: горизонт по умолчанию, дней.
+# Порядок выдачи (FIFO, FEFO, LIFO) задается в категории товара.
+EXPIRY_WARNING_DAYS = 14
+
+# Симулятор вместимости (warehouse.simulation): сколько строк графика
+# приходов принимается за один прогон
+CAPACITY_PLAN_MAX_EVENTS = 20000
+
+# Размещение по ячейкам полок (warehouse.slots): стеллажи с полками принимают
+# товар только на непрерывный свободный участок ячеек. Полки задаются в
+# админке или командой equip_shelves; стеллажи без полок учитываются по
+# объему и весу
+SLOT_ALLOCATION = False
+
+# История загрузки (warehouse.history, команда snapshot_utilization): сырые
+# снимки старше SNAPSHOT_RAW_DAYS сворачиваются в среднесуточные, точки
+# старше SNAPSHOT_KEEP_DAYS удаляются
+SNAPSHOT_RAW_DAYS = 14
+SNAPSHOT_KEEP_DAYS = 730
+
+# Очередь фоновых задач (warehouse.jobs, команда run_workers): как часто
+# свободный обработчик проверяет очередь, сколько попыток у задачи и базовая
+# задержка повтора, секунд (растет вдвое), как часто выполняемая задача
+# обновляет отклик, секунд (должно быть заметно меньше JOB_STALE_AFTER),
+# через сколько задача без отклика обработчика возвращается в очередь, куда
+# задачи пишут файлы
+JOB_POLL_INTERVAL = 1.0
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = 30
+JOB_HEARTBEAT_INTERVAL = 60
+JOB_STALE_AFTER = timedelta(minutes=10)
+JOB_OUTPUT_DIR = MEDIA_ROOT / 'jobs'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'warehouse': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
@@ -0,0 +1,70 @@
+"""Профиль эксплуатации на SQLite.
+
+Запуск: DJANGO_SETTINGS_MODULE=warehouse_management.settings_production.
+Отличается от settings.py только работой с базой и сессиями:
+
+- WAL и PRAGMA для каждого соединения (warehouse.db.apply_sqlite_pragmas);
+- постоянные соединения вместо открытия файла базы на каждый запрос;
+- BEGIN IMMEDIATE: транзакция сразу берет блокировку записи и ждет ее
+  busy_timeout, а не падает с "database is locked" при повышении
+  блокировки чтения до записи посреди транзакции;
+- отдельное соединение только для чтения для страниц-отчетов;
+- сессии в файловом кеше вместо таблицы django_session.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, MIDDLEWARE
+
+# Общие PRAGMA: журнал WAL (читатели не блокируют писателя), fsync только
+# при контрольной точке, ожидание блокировки до 5 с, отображение до 256 МБ
+# файла в память и страничный кеш 64 МБ на соединение
+_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+_SQLITE = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db.sqlite3',
+    # Соединение живет 10 минут и переиспользуется между запросами потока
+    'CONN_MAX_AGE': 600,
+    'CONN_HEALTH_CHECKS': True,
+}
+
+DATABASES = {
+    'default': {
+        **_SQLITE,
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
+    },
+    # Тот же файл, отдельное соединение только для чтения; в тестах - зеркало default
+    'read': {
+        **_SQLITE,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+SQLITE_PRAGMAS = {
+    'default': _PRAGMAS,
+    'read': {**_PRAGMAS, 'query_only': 'ON'},
+}
+
+DATABASE_ROUTERS = ['warehouse.db.ReadReplicaRouter']
+MIDDLEWARE = ['warehouse.db.ReadOnlyViewsMiddleware', *MIDDLEWARE]
+
+# Сессии не пишутся в базу: файловый кеш общий для всех процессов на хосте
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'var' / 'sessions',
+        'TIMEOUT': 14 * 24 * 3600,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
+SESSION_CACHE_ALIAS = 'sessions'
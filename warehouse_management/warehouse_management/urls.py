@@ -5,6 +5,7 @@ from django.views.generic import RedirectView
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
+from warehouse.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -14,5 +15,6 @@ urlpatterns = [
         redirect_authenticated_user=True
     ), name='login'),
     path('logout/', auth_views.LogoutView.as_view(next_page='warehouse:dashboard'), name='logout'),
+    path('metrics', metrics_view, name='metrics'),
     path('', RedirectView.as_view(url='/warehouse/', permanent=True)),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)